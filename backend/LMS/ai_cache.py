@@ -0,0 +1,195 @@
+"""
+AI Response Cache
+Caches AIService.chat completions keyed by a hash of the model, normalized
+messages, temperature and max_tokens. A per-process LRU with a TTL sits in
+front of a SQLite file so cached answers survive restarts and are shared by
+every worker on the host.
+"""
+
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+
+from .cache_utils import LRUCache
+
+
+def _normalize_content(content):
+    if isinstance(content, str):
+        # Whitespace and trailing newlines should not split the cache
+        return " ".join(content.split())
+    return content
+
+
+def cache_key(model, messages, temperature, max_tokens):
+    """Stable hash identifying one chat request"""
+    payload = {
+        'model': model,
+        'messages': [
+            {'role': str(m.get('role', '')).lower(), 'content': _normalize_content(m.get('content'))}
+            for m in messages
+        ],
+        'temperature': round(float(temperature), 3),
+        'max_tokens': int(max_tokens),
+    }
+    raw = json.dumps(payload, sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+class DiskTier:
+    """Size-bounded SQLite table of (key, value, expires_at, accessed_at)"""
+
+    def __init__(self, path, maxsize=10000, clock=time.time):
+        self.path = str(path)
+        self.maxsize = maxsize
+        self.clock = clock
+        with self._connect() as conn:
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS ai_response ('
+                ' key TEXT PRIMARY KEY, value TEXT NOT NULL,'
+                ' expires_at REAL NOT NULL, accessed_at REAL NOT NULL)'
+            )
+            conn.execute('CREATE INDEX IF NOT EXISTS ai_response_accessed ON ai_response (accessed_at)')
+
+    @contextmanager
+    def _connect(self):
+        # A connection per call keeps the tier safe across threads and processes
+        conn = sqlite3.connect(self.path, timeout=5)
+        try:
+            conn.execute('PRAGMA journal_mode=WAL')
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def get(self, key):
+        now = self.clock()
+        with self._connect() as conn:
+            row = conn.execute(
+                'SELECT value, expires_at FROM ai_response WHERE key = ?', (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            value, expires_at = row
+            if expires_at <= now:
+                conn.execute('DELETE FROM ai_response WHERE key = ?', (key,))
+                return None
+            conn.execute('UPDATE ai_response SET accessed_at = ? WHERE key = ?', (now, key))
+        return value, expires_at
+
+    def set(self, key, value, expires_at):
+        now = self.clock()
+        with self._connect() as conn:
+            conn.execute(
+                'INSERT OR REPLACE INTO ai_response (key, value, expires_at, accessed_at) VALUES (?, ?, ?, ?)',
+                (key, value, expires_at, now),
+            )
+            conn.execute('DELETE FROM ai_response WHERE expires_at <= ?', (now,))
+            # Evict the least recently read rows beyond maxsize
+            conn.execute(
+                'DELETE FROM ai_response WHERE key IN ('
+                ' SELECT key FROM ai_response ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)',
+                (self.maxsize,),
+            )
+
+    def clear(self):
+        with self._connect() as conn:
+            conn.execute('DELETE FROM ai_response')
+
+    def __len__(self):
+        with self._connect() as conn:
+            return conn.execute('SELECT COUNT(*) FROM ai_response').fetchone()[0]
+
+
+class AIResponseCache:
+    """Memory LRU + optional disk tier, both expiring entries after ttl seconds"""
+
+    def __init__(self, maxsize=1000, ttl=86400, path=None, disk_maxsize=10000, clock=time.time):
+        self.ttl = ttl
+        self.clock = clock
+        self.memory = LRUCache(maxsize=maxsize)
+        self.disk = DiskTier(path, maxsize=disk_maxsize, clock=clock) if path else None
+        self._lock = threading.Lock()
+        self.counters = {'hits': 0, 'disk_hits': 0, 'misses': 0, 'stores': 0}
+
+    def _count(self, name):
+        with self._lock:
+            self.counters[name] += 1
+
+    def get(self, key):
+        entry = self.memory.get(key)
+        if entry is not None:
+            value, expires_at = entry
+            if expires_at > self.clock():
+                self._count('hits')
+                return value
+            self.memory.delete(key)
+
+        if self.disk is not None:
+            entry = self.disk.get(key)
+            if entry is not None:
+                # Promote to memory with the remaining lifetime
+                self.memory.set(key, entry)
+                self._count('hits')
+                self._count('disk_hits')
+                return entry[0]
+
+        self._count('misses')
+        return None
+
+    def set(self, key, value):
+        expires_at = self.clock() + self.ttl
+        self.memory.set(key, (value, expires_at))
+        if self.disk is not None:
+            self.disk.set(key, value, expires_at)
+        self._count('stores')
+
+    def clear(self):
+        self.memory.clear()
+        if self.disk is not None:
+            self.disk.clear()
+
+    def stats(self):
+        with self._lock:
+            counters = dict(self.counters)
+        lookups = counters['hits'] + counters['misses']
+        counters['hit_rate'] = round(counters['hits'] / lookups, 4) if lookups else 0.0
+        counters['memory_entries'] = len(self.memory)
+        return counters
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_response_cache():
+    """Process-wide AIResponseCache built from settings; None when AI_CACHE_TTL is 0"""
+    global _cache
+    if not getattr(settings, 'AI_CACHE_TTL', 0):
+        return None
+    with _cache_lock:
+        if _cache is None:
+            _cache = AIResponseCache(
+                maxsize=getattr(settings, 'AI_CACHE_SIZE', 1000),
+                ttl=settings.AI_CACHE_TTL,
+                path=getattr(settings, 'AI_CACHE_PATH', None),
+                disk_maxsize=getattr(settings, 'AI_CACHE_DISK_SIZE', 10000),
+            )
+        return _cache
+
+
+def reset_response_cache():
+    """Forget the process-wide cache (the disk tier is left as is)"""
+    global _cache
+    with _cache_lock:
+        _cache = None
+
+
+def cache_stats():
+    """Hit and miss counters of the process-wide cache"""
+    cache = get_response_cache()
+    return cache.stats() if cache else {}
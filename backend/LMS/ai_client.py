@@ -0,0 +1,247 @@
+"""
+Shared LLM Client
+Process-wide OpenAI clients (one connection pool per base URL, and per event
+loop for the async client) with strict connect/read timeouts, bounded
+retries with jittered exponential backoff, and a circuit breaker that fails
+fast while the upstream is unhealthy so callers drop straight to their
+fallback.
+"""
+
+import asyncio
+import random
+import threading
+import time
+import weakref
+
+import openai
+from django.conf import settings
+
+
+class CircuitOpenError(Exception):
+    """The upstream failed repeatedly; calls are refused until the reset timeout passes"""
+
+
+# Worth another attempt: the request may succeed a moment later. Rate-limit
+# answers (429) are retried by LMS.ai_scheduler, which also pauses admissions
+RETRYABLE_ERRORS = (openai.APITimeoutError, openai.APIConnectionError, openai.InternalServerError)
+
+
+def is_retryable(error):
+    if isinstance(error, RETRYABLE_ERRORS):
+        return True
+    return isinstance(error, openai.APIStatusError) and error.status_code >= 500
+
+
+class CircuitBreaker:
+    """
+    closed -> open after failure_threshold consecutive failures; open -> half-open
+    after reset_timeout seconds, when one trial call is let through; the
+    trial's outcome closes or re-opens the circuit.
+    """
+
+    CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half_open'
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = None
+        self.rejected = 0
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.state == self.OPEN and self.clock() - self.opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+                self._trial_running = False
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.HALF_OPEN and not self._trial_running:
+                self._trial_running = True
+                return True
+            self.rejected += 1
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                self.state = self.OPEN
+                self.opened_at = self.clock()
+            self._trial_running = False
+
+
+class RetryPolicy:
+    """Up to `retries` extra attempts, sleeping a full-jitter backoff between them"""
+
+    def __init__(self, retries=2, backoff=0.25, backoff_max=2.0, rng=random.random):
+        self.retries = retries
+        self.backoff = backoff
+        self.backoff_max = backoff_max
+        self.rng = rng
+
+    def delay(self, attempt):
+        return self.rng() * min(self.backoff_max, self.backoff * (2 ** attempt))
+
+
+class ResilientCaller:
+    """Runs upstream calls through the circuit breaker and retry policy"""
+
+    def __init__(self, breaker, policy, sleep=time.sleep, async_sleep=asyncio.sleep):
+        self.breaker = breaker
+        self.policy = policy
+        self.sleep = sleep
+        self.async_sleep = async_sleep
+
+    def _check(self):
+        if not self.breaker.allow():
+            raise CircuitOpenError('AI service unavailable (circuit open)')
+
+    def _failed(self, error, attempt):
+        """True when the error should be retried; otherwise records the outcome"""
+        if is_retryable(error):
+            if attempt < self.policy.retries:
+                return True
+            self.breaker.record_failure()
+        else:
+            # The upstream answered (e.g. 400/401): it is healthy, the request is not
+            self.breaker.record_success()
+        return False
+
+    def call(self, fn):
+        self._check()
+        for attempt in range(self.policy.retries + 1):
+            try:
+                result = fn()
+            except Exception as e:
+                if not self._failed(e, attempt):
+                    raise
+                self.sleep(self.policy.delay(attempt))
+            else:
+                self.breaker.record_success()
+                return result
+
+    async def acall(self, fn):
+        self._check()
+        for attempt in range(self.policy.retries + 1):
+            try:
+                result = await fn()
+            except Exception as e:
+                if not self._failed(e, attempt):
+                    raise
+                await self.async_sleep(self.policy.delay(attempt))
+            else:
+                self.breaker.record_success()
+                return result
+
+
+def _timeout():
+    return openai.Timeout(
+        getattr(settings, 'AI_READ_TIMEOUT', 20.0),
+        connect=getattr(settings, 'AI_CONNECT_TIMEOUT', 3.0),
+    )
+
+
+_lock = threading.Lock()
+_sync_clients = {}
+# event loop -> ({(api_key, base_url): AsyncOpenAI}, closer); an async pool must stay on its loop
+_async_clients = weakref.WeakKeyDictionary()
+_caller = None
+
+
+def get_client(base_url=None):
+    """Shared OpenAI client for base_url (retries are done by ResilientCaller)"""
+    key = (settings.OPENAI_API_KEY, base_url)
+    with _lock:
+        client = _sync_clients.get(key)
+        if client is None:
+            client = _sync_clients[key] = openai.OpenAI(
+                api_key=settings.OPENAI_API_KEY, base_url=base_url, timeout=_timeout(), max_retries=0,
+            )
+        return client
+
+
+async def _close_with_loop(clients):
+    """
+    Parked at its yield until the loop shuts down its async generators, then
+    closes the loop's clients. asyncio.run() does that before closing the
+    loop, so the per-call loops asgiref runs async views on under WSGI do
+    not leave a connection pool behind; a server's loop keeps its clients.
+    """
+    try:
+        yield
+    finally:
+        with _lock:
+            closing = list(clients.values())
+            clients.clear()
+        for client in closing:
+            await client.close()
+
+
+def get_async_client(base_url=None):
+    """Shared AsyncOpenAI client for base_url on the running event loop"""
+    loop = asyncio.get_running_loop()
+    key = (settings.OPENAI_API_KEY, base_url)
+    with _lock:
+        entry = _async_clients.get(loop)
+        if entry is None:
+            clients = {}
+            closer = _close_with_loop(clients)
+            # Start it on this loop (registering it for shutdown); it reaches its yield without awaiting
+            try:
+                closer.asend(None).send(None)
+            except StopIteration:
+                pass
+            entry = _async_clients[loop] = (clients, closer)
+        clients = entry[0]
+        client = clients.get(key)
+        if client is None:
+            client = clients[key] = openai.AsyncOpenAI(
+                api_key=settings.OPENAI_API_KEY, base_url=base_url, timeout=_timeout(), max_retries=0,
+            )
+        return client
+
+
+async def aclose_async_clients():
+    """Close the running loop's clients now rather than when the loop shuts down"""
+    with _lock:
+        entry = _async_clients.pop(asyncio.get_running_loop(), None)
+    if entry is not None:
+        await entry[1].aclose()
+
+
+def get_caller():
+    """Process-wide ResilientCaller built from the AI_* settings"""
+    global _caller
+    with _lock:
+        if _caller is None:
+            _caller = ResilientCaller(
+                CircuitBreaker(
+                    failure_threshold=getattr(settings, 'AI_BREAKER_FAILURES', 5),
+                    reset_timeout=getattr(settings, 'AI_BREAKER_RESET', 30.0),
+                ),
+                RetryPolicy(
+                    retries=getattr(settings, 'AI_MAX_RETRIES', 2),
+                    backoff=getattr(settings, 'AI_RETRY_BACKOFF', 0.25),
+                    backoff_max=getattr(settings, 'AI_RETRY_BACKOFF_MAX', 2.0),
+                ),
+            )
+        return _caller
+
+
+def reset_ai_clients():
+    """Drop the shared clients and breaker state (tests, settings changes)"""
+    global _caller
+    with _lock:
+        _sync_clients.clear()
+        _async_clients.clear()
+        _caller = None
@@ -0,0 +1,136 @@
+"""
+LLM Concurrency Limit
+Caps the number of LLM calls in flight per process. Sync callers (threads)
+and async callers (event loops) draw from the same pool of slots, so AI
+traffic cannot tie up every worker or connection.
+"""
+
+import asyncio
+import threading
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+
+from django.conf import settings
+
+
+class AIBusyError(Exception):
+    """No LLM slot became free within the wait limit"""
+
+
+class _Waiter:
+    """A queued caller; a released slot is handed straight to it and wake() is called"""
+
+    def __init__(self, wake):
+        self.wake = wake
+        self.granted = False
+
+
+class LLMConcurrencyLimit:
+    def __init__(self, limit=8, wait=10.0):
+        self.limit = limit
+        self.wait = wait
+        self._free = limit
+        # Threads and event loops queue up together, first come first served
+        self._waiters = deque()
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.rejected = 0
+
+    def _acquired(self):
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+
+    def _enter(self, wake):
+        """Take a free slot (returns None) or queue a waiter to be woken with one"""
+        with self._lock:
+            if self._free and not self._waiters:
+                self._free -= 1
+                self._acquired()
+                return None
+            waiter = _Waiter(wake)
+            self._waiters.append(waiter)
+            return waiter
+
+    def _abandon(self, waiter):
+        """Stop waiting; True when a slot was handed over meanwhile (the caller now holds it)"""
+        with self._lock:
+            if waiter.granted:
+                return True
+            self._waiters.remove(waiter)
+            return False
+
+    def _release(self):
+        with self._lock:
+            self.in_flight -= 1
+            if not self._waiters:
+                self._free += 1
+                return
+            waiter = self._waiters.popleft()
+            waiter.granted = True
+            self._acquired()
+        waiter.wake()
+
+    def _reject(self):
+        with self._lock:
+            self.rejected += 1
+        raise AIBusyError(f"{self.limit} LLM calls already in flight")
+
+    @contextmanager
+    def slot(self):
+        """Hold a slot for a blocking call"""
+        ready = threading.Event()
+        waiter = self._enter(ready.set)
+        if waiter is not None and not ready.wait(self.wait) and not self._abandon(waiter):
+            self._reject()
+        try:
+            yield
+        finally:
+            self._release()
+
+    @asynccontextmanager
+    async def aslot(self):
+        """Hold a slot for an awaited call without blocking the event loop"""
+        loop = asyncio.get_running_loop()
+        ready = loop.create_future()
+
+        def wake():
+            # Called from whichever thread released the slot
+            loop.call_soon_threadsafe(lambda: ready.done() or ready.set_result(None))
+
+        waiter = self._enter(wake)
+        if waiter is not None:
+            try:
+                await asyncio.wait((ready,), timeout=self.wait)
+            except asyncio.CancelledError:
+                if self._abandon(waiter):
+                    self._release()
+                raise
+            if not ready.done() and not self._abandon(waiter):
+                self._reject()
+        try:
+            yield
+        finally:
+            self._release()
+
+
+_limit = None
+_limit_lock = threading.Lock()
+
+
+def get_llm_limit():
+    """Process-wide LLMConcurrencyLimit sized by AI_MAX_CONCURRENCY"""
+    global _limit
+    with _limit_lock:
+        if _limit is None:
+            _limit = LLMConcurrencyLimit(
+                limit=getattr(settings, 'AI_MAX_CONCURRENCY', 8),
+                wait=getattr(settings, 'AI_CONCURRENCY_WAIT', 10.0),
+            )
+        return _limit
+
+
+def reset_llm_limit():
+    global _limit
+    with _limit_lock:
+        _limit = None
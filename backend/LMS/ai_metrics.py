@@ -0,0 +1,246 @@
+"""
+AI Metrics
+In-process latency histograms for the LLM calls (e.g. time to first token of
+streamed chat), counters (tokens, cache hits, fallbacks, error classes) and
+gauges for current values such as the scheduler's queue depth. AIService
+methods run inside instrument(), which times them, attributes counters to
+the method and writes one JSON line per call to the 'LMS.ai' logger.
+Thread-safe; snapshot(), counters() and gauges() return plain dicts for
+endpoints and tests.
+"""
+
+import asyncio
+import bisect
+import contextvars
+import inspect
+import json
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+
+logger = logging.getLogger('LMS.ai')
+
+
+# Upper bounds in milliseconds; the last bucket is unbounded
+LATENCY_BUCKETS_MS = (50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000)
+
+
+class Histogram:
+    def __init__(self, buckets=LATENCY_BUCKETS_MS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the q-th observation"""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if seen >= rank:
+                return self.buckets[i] if i < len(self.buckets) else self.max
+        return self.max
+
+    def snapshot(self):
+        return {
+            'count': self.count,
+            'sum': round(self.total, 3),
+            'mean': round(self.total / self.count, 3) if self.count else None,
+            'max': round(self.max, 3),
+            'p50': self.quantile(0.5),
+            'p95': self.quantile(0.95),
+            'buckets': {
+                (f'le_{b}' if i < len(self.buckets) else 'inf'): n
+                for i, (b, n) in enumerate(zip(self.buckets + (None,), self.counts))
+            },
+        }
+
+
+_histograms = {}
+_counters = {}
+_gauges = {}
+_lock = threading.Lock()
+# The instrumented AI call running in this thread / task
+_current_call = contextvars.ContextVar('ai_call', default=None)
+
+
+def observe_ms(name, milliseconds):
+    """Record one latency sample (milliseconds) under name, e.g. 'chat.ttft'"""
+    with _lock:
+        histogram = _histograms.get(name)
+        if histogram is None:
+            histogram = _histograms[name] = Histogram()
+        histogram.observe(milliseconds)
+
+
+def incr(name, amount=1):
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + amount
+
+
+def set_gauge(name, value):
+    """Record the current value of name (e.g. 'scheduler.queue_depth'), keeping its peak"""
+    with _lock:
+        peak = _gauges.get(name, {}).get('max', value)
+        _gauges[name] = {'value': value, 'max': max(peak, value)}
+
+
+def snapshot():
+    with _lock:
+        return {name: h.snapshot() for name, h in sorted(_histograms.items())}
+
+
+def counters():
+    with _lock:
+        return dict(sorted(_counters.items()))
+
+
+def gauges():
+    with _lock:
+        return {name: dict(g) for name, g in sorted(_gauges.items())}
+
+
+def reset():
+    with _lock:
+        _histograms.clear()
+        _counters.clear()
+        _gauges.clear()
+
+
+# Per-call instrumentation
+
+def count(name, amount=1):
+    """Count name under the running call's method, e.g. 'predict_grade.fallbacks'"""
+    call = _current_call.get()
+    incr(f"{call['method'] if call else 'ai'}.{name}", amount)
+
+
+def record(**fields):
+    """Add fields to the running call's log line (no-op outside instrument())"""
+    call = _current_call.get()
+    if call is not None:
+        call.update(fields)
+
+
+def record_error(error, outcome='error'):
+    """
+    Count the error's class under '<method>.errors.<class>'
+
+    A call counts its first error only (e.g. the upstream failure, not the
+    parse error predict_grade hits on the resulting "Error: ..." text).
+    """
+    call = _current_call.get()
+    if call is None or 'error' not in call:
+        count(f"errors.{type(error).__name__}")
+    if call is not None:
+        call['outcome'] = outcome
+        call.setdefault('error', type(error).__name__)
+
+
+def record_usage(usage):
+    """Prompt and completion tokens the provider reported for one completion"""
+    call = _current_call.get()
+    for field in ('prompt_tokens', 'completion_tokens'):
+        tokens = getattr(usage, field, None) or 0
+        count(field, tokens)
+        if call is not None:
+            call[field] = call.get(field, 0) + tokens
+
+
+def _log_call(method, call, started):
+    latency_ms = (time.perf_counter() - started) * 1000
+    observe_ms(f"{method}.latency", latency_ms)
+    incr(f"{method}.calls")
+    incr(f"{method}.outcome.{call['outcome']}")
+    logger.info(json.dumps({'event': 'ai_call', **call, 'latency_ms': round(latency_ms, 1)}, default=str))
+
+
+@contextmanager
+def instrument(method):
+    """
+    Time an AI method into '<method>.latency' and '<method>.calls' and log it
+
+    Nested calls (predict_grade -> chat) belong to the outermost method.
+    """
+    if _current_call.get() is not None:
+        yield _current_call.get()
+        return
+    call = {'method': method, 'outcome': 'ok'}
+    token = _current_call.set(call)
+    started = time.perf_counter()
+    try:
+        yield call
+    except Exception as e:
+        record_error(e)
+        raise
+    finally:
+        _current_call.reset(token)
+        _log_call(method, call, started)
+
+
+def _instrumented_stream(method, fn):
+    """
+    instrument() for async generators, timed from the first step to the last
+
+    The call is made current around each step only: the consumer may
+    iterate the stream from another task or context than the one it started in.
+    """
+    @wraps(fn)
+    async def stream_wrapper(*args, **kwargs):
+        call = {'method': method, 'outcome': 'ok'}
+        nested = _current_call.get() is not None
+        started = time.perf_counter()
+        chunks = fn(*args, **kwargs)
+        try:
+            while True:
+                token = None if nested else _current_call.set(call)
+                try:
+                    chunk = await anext(chunks)
+                except StopAsyncIteration:
+                    break
+                except Exception as e:
+                    record_error(e)
+                    raise
+                finally:
+                    if token is not None:
+                        _current_call.reset(token)
+                yield chunk
+        finally:
+            await chunks.aclose()
+            if not nested:
+                _log_call(method, call, started)
+    return stream_wrapper
+
+
+def instrumented(method):
+    """Decorator running a sync or async AIService method (or async generator) inside instrument(method)"""
+    def decorator(fn):
+        if inspect.isasyncgenfunction(fn):
+            return _instrumented_stream(method, fn)
+
+        if asyncio.iscoroutinefunction(fn):
+            @wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                with instrument(method):
+                    return await fn(*args, **kwargs)
+            return async_wrapper
+
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            with instrument(method):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
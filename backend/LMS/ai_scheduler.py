@@ -0,0 +1,232 @@
+"""
+LLM Rate-Limit Scheduler
+Admits AIService calls through token buckets for the provider's requests
+per minute and tokens per minute, so bulk jobs (e.g. forecasting a whole
+offering) queue up instead of tripping the provider's limits. Interactive
+requests are admitted ahead of queued batch work, a 429 answer pauses
+admissions for its Retry-After and the call is retried, and the queue depth
+is published as the 'scheduler.queue_depth' gauge (LMS.ai_metrics).
+"""
+
+import asyncio
+import heapq
+import itertools
+import threading
+import time
+
+import openai
+from django.conf import settings
+
+from . import ai_metrics
+from .ai_limits import AIBusyError
+
+
+# Lower is admitted first
+INTERACTIVE, BATCH = 0, 1
+
+
+class TokenBucket:
+    """Refills continuously at per_minute / 60 per second up to capacity (default: one minute's worth)"""
+
+    def __init__(self, per_minute, capacity=None, clock=time.monotonic):
+        self.rate = per_minute / 60.0
+        self.capacity = capacity or per_minute
+        self.clock = clock
+        self.level = self.capacity
+        self.updated = clock()
+
+    def _refill(self):
+        now = self.clock()
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount):
+        """Seconds until amount is available (0.0 if it is now)"""
+        self._refill()
+        # Larger than the bucket: wait for a full bucket rather than forever
+        amount = min(amount, self.capacity)
+        return 0.0 if self.level >= amount else (amount - self.level) / self.rate
+
+    def take(self, amount):
+        self._refill()
+        self.level -= amount
+
+    def give(self, amount):
+        """Return an over-estimate (or charge an under-estimate with a negative amount)"""
+        self._refill()
+        self.level = min(self.capacity, self.level + amount)
+
+
+class LLMScheduler:
+    def __init__(self, requests_per_minute=None, tokens_per_minute=None, burst=None,
+                 rate_limit_retries=3, rate_limit_backoff=2.0, waits=None, poll=0.05,
+                 clock=time.monotonic, sleep=time.sleep, async_sleep=asyncio.sleep):
+        """
+        Args:
+            requests_per_minute, tokens_per_minute: Provider limits; 0/None disables that bucket
+            burst: Bucket capacity as a fraction of a minute's allowance (default: a full minute)
+            rate_limit_retries: Extra attempts after a 429 answer
+            rate_limit_backoff: Pause after a 429 without Retry-After, doubled per attempt
+            waits: {priority: seconds} a caller may queue before AIBusyError
+        """
+        self.clock = clock
+        self.sleep = sleep
+        self.async_sleep = async_sleep
+        self.poll = poll
+        self.rate_limit_retries = rate_limit_retries
+        self.rate_limit_backoff = rate_limit_backoff
+        self.waits = {INTERACTIVE: 10.0, BATCH: 300.0, **(waits or {})}
+        self.requests = self._bucket(requests_per_minute, burst)
+        self.tokens = self._bucket(tokens_per_minute, burst)
+        self.paused_until = 0.0
+        self._queue = []
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+        self.admitted = 0
+        self.rate_limited = 0
+        self.max_queue_depth = 0
+
+    def _bucket(self, per_minute, burst):
+        if not per_minute:
+            return None
+        capacity = max(1.0, per_minute * burst) if burst else None
+        return TokenBucket(per_minute, capacity=capacity, clock=self.clock)
+
+    @property
+    def queue_depth(self):
+        return len(self._queue)
+
+    def _publish(self):
+        self.max_queue_depth = max(self.max_queue_depth, len(self._queue))
+        ai_metrics.set_gauge('scheduler.queue_depth', len(self._queue))
+
+    def _enqueue(self, priority):
+        with self._lock:
+            ticket = (priority, next(self._seq))
+            heapq.heappush(self._queue, ticket)
+            self._publish()
+        return ticket
+
+    def _dequeue(self, ticket):
+        with self._lock:
+            if ticket in self._queue:
+                self._queue.remove(ticket)
+                heapq.heapify(self._queue)
+                self._publish()
+
+    def _try_admit(self, ticket, tokens):
+        """None once admitted, else the seconds to wait before trying again"""
+        with self._lock:
+            if self._queue[0] != ticket:
+                # Someone with a higher priority (or who came first) is ahead
+                return self.poll
+            delay = max(0.0, self.paused_until - self.clock())
+            for bucket, amount in ((self.requests, 1), (self.tokens, tokens)):
+                if bucket is not None:
+                    delay = max(delay, bucket.wait_time(amount))
+            if delay > 0:
+                return delay
+            for bucket, amount in ((self.requests, 1), (self.tokens, tokens)):
+                if bucket is not None:
+                    bucket.take(amount)
+            heapq.heappop(self._queue)
+            self.admitted += 1
+            self._publish()
+            return None
+
+    def _check_deadline(self, ticket, delay, deadline):
+        # Fail fast (callers have fallbacks) rather than sleep past the deadline
+        if self.clock() + delay > deadline:
+            self._dequeue(ticket)
+            raise AIBusyError('AI rate limit queue is full')
+
+    def admit(self, tokens, priority=INTERACTIVE):
+        """Block until the buckets allow a call estimated at `tokens` total tokens"""
+        ticket = self._enqueue(priority)
+        started = self.clock()
+        deadline = started + self.waits[priority]
+        while (delay := self._try_admit(ticket, tokens)) is not None:
+            self._check_deadline(ticket, delay, deadline)
+            self.sleep(delay)
+        ai_metrics.observe_ms('scheduler.wait', (self.clock() - started) * 1000)
+
+    async def aadmit(self, tokens, priority=INTERACTIVE):
+        """admit() without blocking the event loop"""
+        ticket = self._enqueue(priority)
+        started = self.clock()
+        deadline = started + self.waits[priority]
+        while (delay := self._try_admit(ticket, tokens)) is not None:
+            self._check_deadline(ticket, delay, deadline)
+            await self.async_sleep(delay)
+        ai_metrics.observe_ms('scheduler.wait', (self.clock() - started) * 1000)
+
+    def settle(self, estimated, actual):
+        """Correct the token bucket with the usage the provider reported"""
+        if self.tokens is not None and actual is not None:
+            with self._lock:
+                self.tokens.give(estimated - actual)
+
+    def _rate_limited(self, error, attempt):
+        """Seconds to back off after a 429, or None when out of attempts"""
+        if attempt >= self.rate_limit_retries:
+            return None
+        retry_after = None
+        response = getattr(error, 'response', None)
+        if response is not None:
+            try:
+                retry_after = float(response.headers.get('retry-after'))
+            except (TypeError, ValueError):
+                pass
+        delay = retry_after if retry_after is not None else self.rate_limit_backoff * (2 ** attempt)
+        with self._lock:
+            self.rate_limited += 1
+            # Everyone waits: the provider says this key is over its limit
+            self.paused_until = max(self.paused_until, self.clock() + delay)
+        return delay
+
+    def run(self, fn, tokens, priority=INTERACTIVE):
+        """Admit, call fn(), and retry it after rate-limit answers"""
+        for attempt in itertools.count():
+            self.admit(tokens, priority)
+            try:
+                return fn()
+            except openai.RateLimitError as e:
+                if self._rate_limited(e, attempt) is None:
+                    raise
+
+    async def arun(self, afn, tokens, priority=INTERACTIVE):
+        for attempt in itertools.count():
+            await self.aadmit(tokens, priority)
+            try:
+                return await afn()
+            except openai.RateLimitError as e:
+                if self._rate_limited(e, attempt) is None:
+                    raise
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler():
+    """Process-wide LLMScheduler configured by the AI_* rate-limit settings"""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = LLMScheduler(
+                requests_per_minute=getattr(settings, 'AI_REQUESTS_PER_MINUTE', 0),
+                tokens_per_minute=getattr(settings, 'AI_TOKENS_PER_MINUTE', 0),
+                rate_limit_retries=getattr(settings, 'AI_RATE_LIMIT_RETRIES', 3),
+                rate_limit_backoff=getattr(settings, 'AI_RATE_LIMIT_BACKOFF', 2.0),
+                waits={
+                    INTERACTIVE: getattr(settings, 'AI_QUEUE_WAIT_INTERACTIVE', 10.0),
+                    BATCH: getattr(settings, 'AI_QUEUE_WAIT_BATCH', 300.0),
+                },
+            )
+        return _scheduler
+
+
+def reset_scheduler():
+    global _scheduler
+    with _scheduler_lock:
+        _scheduler = None
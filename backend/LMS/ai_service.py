@@ -1,12 +1,63 @@
-from openai import OpenAI
+import asyncio
+from contextlib import AsyncExitStack
+
 from django.conf import settings
 
+from . import ai_metrics
+from .ai_cache import cache_key, cache_stats, get_response_cache
+from .ai_client import get_async_client, get_caller, get_client
+from .ai_limits import get_llm_limit
+from .ai_scheduler import INTERACTIVE, get_scheduler
+from .ai_singleflight import get_single_flight
+from .ai_tokens import estimate_tokens
+from .forecast_prompt import forecast_messages
+
+
+def metrics_report():
+    """This process's AI metrics and client state, for the metrics endpoint"""
+    scheduler = get_scheduler()
+    limit = get_llm_limit()
+    breaker = get_caller().breaker
+    return {
+        'latency_ms': ai_metrics.snapshot(),
+        'counters': ai_metrics.counters(),
+        'gauges': ai_metrics.gauges(),
+        'response_cache': cache_stats(),
+        'coalesced': get_single_flight().coalesced,
+        'scheduler': {
+            'admitted': scheduler.admitted,
+            'rate_limited': scheduler.rate_limited,
+            'queue_depth': scheduler.queue_depth,
+            'max_queue_depth': scheduler.max_queue_depth,
+        },
+        'concurrency': {
+            'in_flight': limit.in_flight,
+            'max_in_flight': limit.max_in_flight,
+            'rejected': limit.rejected,
+        },
+        'circuit': {'state': breaker.state, 'failures': breaker.failures, 'rejected': breaker.rejected},
+    }
+
+
+def _subject_name(SubjectOffering):
+    """The views pass the offering's name; other callers pass the SubjectOffering"""
+    return getattr(SubjectOffering, 'name', SubjectOffering)
+
+
 class AIService:
-    def __init__(self):
-        self.client = OpenAI(api_key=settings.OPENAI_API_KEY)
+    def __init__(self, base_url=None):
+        self.base_url = base_url or getattr(settings, 'OPENAI_BASE_URL', None)
+        # Clients are shared per process (LMS.ai_client), so this is cheap per request
+        self.client = get_client(self.base_url)
         self.model = settings.OPENAI_MODEL
     
-    def chat(self, messages, temperature=0.7, max_tokens=500):
+    @property
+    def async_client(self):
+        """Shared AsyncOpenAI client for the running event loop"""
+        return get_async_client(self.base_url)
+    
+    @ai_metrics.instrumented('chat')
+    def chat(self, messages, temperature=0.7, max_tokens=500, cache=True, priority=INTERACTIVE):
         """
         Send a chat request to OpenAI GPT-3.5 Turbo
         
@@ -14,54 +65,243 @@ class AIService:
             messages: List of message dicts with 'role' and 'content'
             temperature: Creativity level (0-1)
             max_tokens: Maximum response length
+            cache: Reuse a cached answer for identical requests (LMS.ai_cache)
+            priority: INTERACTIVE or BATCH admission by the rate-limit scheduler (LMS.ai_scheduler)
         
         Returns:
             str: AI response text
         """
+        response_cache = get_response_cache() if cache else None
+        key = cache_key(self.model, messages, temperature, max_tokens)
+        if response_cache:
+            cached = response_cache.get(key)
+            if cached is not None:
+                ai_metrics.count('cache_hits')
+                ai_metrics.record(outcome='cache_hit')
+                return cached
+            ai_metrics.count('cache_misses')
+        
         try:
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=messages,
-                temperature=temperature,
-                max_tokens=max_tokens
+            # Identical requests already in flight (here or in another worker) share one call
+            # Without caching nothing is stored for other workers either
+            return get_single_flight().do(
+                key, lambda: self._complete(key, messages, temperature, max_tokens, response_cache, priority),
+                share=response_cache is not None,
             )
-            return response.choices[0].message.content
         except Exception as e:
+            ai_metrics.record_error(e)
             return f"Error: {str(e)}"
     
-    def generate_quiz_questions(self, SubjectOffering, topic, num_questions=5):
-        """Generate quiz questions for a subject and topic"""
+    def _complete(self, key, messages, temperature, max_tokens, response_cache, priority):
+        def call():
+            # At most AI_MAX_CONCURRENCY calls are in flight per process
+            # Timeouts, retries and the circuit breaker live in LMS.ai_client
+            with get_llm_limit().slot():
+                return get_caller().call(lambda: self.client.chat.completions.create(
+                    model=self.model,
+                    messages=messages,
+                    temperature=temperature,
+                    max_tokens=max_tokens
+                ))
+        
+        # The provider's per-minute request and token limits are enforced before a slot is taken
+        scheduler = get_scheduler()
+        estimated = estimate_tokens(messages) + max_tokens
+        response = scheduler.run(call, estimated, priority)
+        usage = getattr(response, 'usage', None)
+        scheduler.settle(estimated, getattr(usage, 'total_tokens', None))
+        ai_metrics.record_usage(usage)
+        content = response.choices[0].message.content
+        
+        # Only successful completions are cached
+        if response_cache and content is not None:
+            response_cache.set(key, content)
+        return content
+    
+    @ai_metrics.instrumented('chat')
+    async def achat(self, messages, temperature=0.7, max_tokens=500, cache=True, priority=INTERACTIVE):
+        """chat() for async views: awaits the LLM without holding a worker thread"""
+        response_cache = get_response_cache() if cache else None
+        key = cache_key(self.model, messages, temperature, max_tokens)
+        if response_cache:
+            # The disk tier does file I/O, so look it up off the event loop
+            cached = await asyncio.to_thread(response_cache.get, key)
+            if cached is not None:
+                ai_metrics.count('cache_hits')
+                ai_metrics.record(outcome='cache_hit')
+                return cached
+            ai_metrics.count('cache_misses')
+        
+        try:
+            return await get_single_flight().ado(
+                key, lambda: self._acomplete(key, messages, temperature, max_tokens, response_cache, priority),
+                share=response_cache is not None,
+            )
+        except Exception as e:
+            ai_metrics.record_error(e)
+            return f"Error: {str(e)}"
+    
+    async def _acomplete(self, key, messages, temperature, max_tokens, response_cache, priority):
+        async def call():
+            async with get_llm_limit().aslot():
+                return await get_caller().acall(lambda: self.async_client.chat.completions.create(
+                    model=self.model,
+                    messages=messages,
+                    temperature=temperature,
+                    max_tokens=max_tokens
+                ))
+        
+        scheduler = get_scheduler()
+        estimated = estimate_tokens(messages) + max_tokens
+        response = await scheduler.arun(call, estimated, priority)
+        usage = getattr(response, 'usage', None)
+        scheduler.settle(estimated, getattr(usage, 'total_tokens', None))
+        ai_metrics.record_usage(usage)
+        content = response.choices[0].message.content
+        
+        if response_cache and content is not None:
+            await asyncio.to_thread(response_cache.set, key, content)
+        return content
+    
+    @ai_metrics.instrumented('chat_stream')
+    async def astream_chat(self, messages, temperature=0.7, max_tokens=500, cache=True):
+        """
+        Async generator yielding the completion text as it arrives
+        
+        A cached answer is yielded as one chunk; a fully streamed answer is
+        cached like chat() would. Upstream errors are raised to the caller.
+        """
+        response_cache = get_response_cache() if cache else None
+        key = cache_key(self.model, messages, temperature, max_tokens) if response_cache else None
+        if response_cache:
+            cached = await asyncio.to_thread(response_cache.get, key)
+            if cached is not None:
+                ai_metrics.count('cache_hits')
+                ai_metrics.record(outcome='cache_hit')
+                yield cached
+                return
+            ai_metrics.count('cache_misses')
+        
+        parts = []
+        scheduler = get_scheduler()
+        estimated = estimate_tokens(messages) + max_tokens
+        
+        # The slot is held until the last chunk (or until the client goes away)
+        async with AsyncExitStack() as streaming:
+            async def open_stream():
+                async with AsyncExitStack() as attempt:
+                    await attempt.enter_async_context(get_llm_limit().aslot())
+                    # Retries cover opening the stream, not a stream that broke midway
+                    stream = await get_caller().acall(lambda: self.async_client.chat.completions.create(
+                        model=self.model,
+                        messages=messages,
+                        temperature=temperature,
+                        max_tokens=max_tokens,
+                        stream=True,
+                        # The usage arrives in a last chunk without choices
+                        stream_options={'include_usage': True},
+                    ))
+                    # Opened: keep the slot past this attempt
+                    streaming.push_async_exit(attempt.pop_all())
+                    return stream
+            
+            # A 429 on open pauses the scheduler and is retried like chat()
+            stream = await scheduler.arun(open_stream, estimated)
+            async for chunk in stream:
+                usage = getattr(chunk, 'usage', None)
+                if usage is not None:
+                    scheduler.settle(estimated, usage.total_tokens)
+                    ai_metrics.record_usage(usage)
+                delta = chunk.choices[0].delta.content if chunk.choices else None
+                if delta:
+                    parts.append(delta)
+                    yield delta
+        
+        # An empty completion is not an answer worth replaying
+        content = ''.join(parts)
+        if response_cache and content:
+            await asyncio.to_thread(response_cache.set, key, content)
+    
+    def cache_stats(self):
+        """Hit and miss counters of the shared response cache"""
+        return cache_stats()
+    
+    # Each request is (messages, chat kwargs) so the sync and async methods share prompts
+    
+    def _quiz_questions_request(self, SubjectOffering, topic, num_questions):
         messages = [
             {"role": "system", "content": "You are an educational assistant that creates quiz questions."},
-            {"role": "user", "content": f"Generate {num_questions} multiple choice questions about {topic} in {SubjectOffering.name}. Format each question with 4 options (A, B, C, D) and indicate the correct answer."}
+            {"role": "user", "content": f"Generate {num_questions} multiple choice questions about {topic} in {_subject_name(SubjectOffering)}. Format each question with 4 options (A, B, C, D) and indicate the correct answer."}
         ]
-        return self.chat(messages, temperature=0.8, max_tokens=1000)
+        return messages, {'temperature': 0.8, 'max_tokens': 1000}
     
-    def explain_concept(self, concept, SubjectOffering):
-        """Explain a concept in simple terms"""
+    def _explain_concept_request(self, concept, SubjectOffering):
         messages = [
             {"role": "system", "content": "You are a helpful teacher explaining concepts to students in a clear and simple way."},
-            {"role": "user", "content": f"Explain the concept of '{concept}' in {SubjectOffering.name} in simple terms that a student can understand."}
+            {"role": "user", "content": f"Explain the concept of '{concept}' in {_subject_name(SubjectOffering)} in simple terms that a student can understand."}
         ]
-        return self.chat(messages, temperature=0.7)
+        return messages, {'temperature': 0.7}
     
-    def provide_feedback(self, student_answer, correct_answer, question):
-        """Provide personalized feedback on student answers"""
+    def _feedback_request(self, student_answer, correct_answer, question):
         messages = [
             {"role": "system", "content": "You are a supportive teacher providing constructive feedback."},
             {"role": "user", "content": f"Question: {question}\nStudent's answer: {student_answer}\nCorrect answer: {correct_answer}\n\nProvide brief, encouraging feedback explaining why the answer is right or wrong."}
         ]
-        return self.chat(messages, temperature=0.6, max_tokens=300)
+        return messages, {'temperature': 0.6, 'max_tokens': 300}
     
-    def generate_study_plan(self, SubjectOffering, topics, difficulty_level):
-        """Create a personalized study plan"""
+    def _study_plan_request(self, SubjectOffering, topics, difficulty_level):
         messages = [
             {"role": "system", "content": "You are an educational planner helping students organize their studies."},
-            {"role": "user", "content": f"Create a study plan for {SubjectOffering.name} covering these topics: {', '.join(topics)}. The difficulty level is {difficulty_level}. Include time allocation and learning strategies."}
+            {"role": "user", "content": f"Create a study plan for {_subject_name(SubjectOffering)} covering these topics: {', '.join(topics)}. The difficulty level is {difficulty_level}. Include time allocation and learning strategies."}
         ]
-        return self.chat(messages, temperature=0.7, max_tokens=800)
+        return messages, {'temperature': 0.7, 'max_tokens': 800}
+    
+    @ai_metrics.instrumented('generate_quiz_questions')
+    def generate_quiz_questions(self, SubjectOffering, topic, num_questions=5):
+        """Generate quiz questions for a subject and topic"""
+        messages, options = self._quiz_questions_request(SubjectOffering, topic, num_questions)
+        return self.chat(messages, **options)
+    
+    @ai_metrics.instrumented('explain_concept')
+    def explain_concept(self, concept, SubjectOffering):
+        """Explain a concept in simple terms"""
+        messages, options = self._explain_concept_request(concept, SubjectOffering)
+        return self.chat(messages, **options)
+    
+    @ai_metrics.instrumented('provide_feedback')
+    def provide_feedback(self, student_answer, correct_answer, question):
+        """Provide personalized feedback on student answers"""
+        messages, options = self._feedback_request(student_answer, correct_answer, question)
+        return self.chat(messages, **options)
+    
+    @ai_metrics.instrumented('generate_study_plan')
+    def generate_study_plan(self, SubjectOffering, topics, difficulty_level):
+        """Create a personalized study plan"""
+        messages, options = self._study_plan_request(SubjectOffering, topics, difficulty_level)
+        return self.chat(messages, **options)
+    
+    @ai_metrics.instrumented('generate_quiz_questions')
+    async def agenerate_quiz_questions(self, SubjectOffering, topic, num_questions=5):
+        messages, options = self._quiz_questions_request(SubjectOffering, topic, num_questions)
+        return await self.achat(messages, **options)
     
-    def predict_grade(self, student_data):
+    @ai_metrics.instrumented('explain_concept')
+    async def aexplain_concept(self, concept, SubjectOffering):
+        messages, options = self._explain_concept_request(concept, SubjectOffering)
+        return await self.achat(messages, **options)
+    
+    @ai_metrics.instrumented('provide_feedback')
+    async def aprovide_feedback(self, student_answer, correct_answer, question):
+        messages, options = self._feedback_request(student_answer, correct_answer, question)
+        return await self.achat(messages, **options)
+    
+    @ai_metrics.instrumented('generate_study_plan')
+    async def agenerate_study_plan(self, SubjectOffering, topics, difficulty_level):
+        messages, options = self._study_plan_request(SubjectOffering, topics, difficulty_level)
+        return await self.achat(messages, **options)
+    
+    @ai_metrics.instrumented('predict_grade')
+    def predict_grade(self, student_data, priority=INTERACTIVE):
         """
         Predict student's final grade using AI based on quiz performance
         
@@ -74,6 +314,7 @@ class AIService:
                 - quiz_count: int
                 - topic_performance: List[Dict] with 'topic', 'accuracy'
                 - recent_trend: str (description of recent performance)
+            priority: BATCH for bulk jobs, so interactive requests go first
         
         Returns:
             Dict with:
@@ -84,60 +325,16 @@ class AIService:
                 - strong_topics: List[str]
                 - weak_topics: List[str]
                 - recommendations: str
+                - fallback: True when the local forecast stood in for the AI
         """
         try:
-            # Prepare data summary for AI
-            quiz_summary = f"Quiz scores: {student_data['quiz_scores']}"
             avg_score = student_data['current_average']
-            quiz_count = student_data['quiz_count']
             
-            # Topic analysis
-            topics_text = "\n".join([
-                f"  - {t['topic']}: {t['accuracy']:.1f}% accuracy ({t['correct']}/{t['total']} correct)"
-                for t in student_data['topic_performance']
-            ])
-            
-            # Create AI prompt
-            prompt = f"""You are an educational data analyst. Analyze this student's quiz performance and provide a grade forecast.
-
-Student: {student_data['student_name']}
-Subject: {student_data['subject_name']}
-Quizzes Taken: {quiz_count}
-Current Average: {avg_score:.1f}%
-
-Quiz Score History: {quiz_summary}
-Recent Performance Trend: {student_data['recent_trend']}
-
-Topic-Level Performance:
-{topics_text}
-
-Based on this data, provide:
-1. Predicted final grade (0-100 scale)
-2. Confidence level in prediction (0-1 scale)
-3. Risk assessment (LOW/MEDIUM/HIGH) - risk of failing or underperforming
-4. Performance trend (IMPROVING/STABLE/DECLINING)
-5. Top 3 strong topics (topics with >75% accuracy)
-6. Top 3 weak topics (topics with <60% accuracy)
-7. Specific study recommendations (2-3 sentences)
-
-Format your response EXACTLY as JSON:
-{{
-  "predicted_grade": <number>,
-  "confidence": <number 0-1>,
-  "risk_level": "<LOW/MEDIUM/HIGH>",
-  "trend": "<IMPROVING/STABLE/DECLINING>",
-  "strong_topics": ["topic1", "topic2", "topic3"],
-  "weak_topics": ["topic1", "topic2", "topic3"],
-  "recommendations": "<text>"
-}}"""
-
-            messages = [
-                {"role": "system", "content": "You are an educational data analyst specializing in grade forecasting and student performance analysis. Always respond with valid JSON only."},
-                {"role": "user", "content": prompt}
-            ]
+            # Scores and topics are compacted to fit AI_FORECAST_PROMPT_BUDGET tokens
+            messages = forecast_messages(student_data)
             
             # Get AI response
-            response = self.chat(messages, temperature=0.3, max_tokens=800)
+            response = self.chat(messages, temperature=0.3, max_tokens=800, priority=priority)
             
             # Parse JSON response
             import json
@@ -162,50 +359,16 @@ Format your response EXACTLY as JSON:
             }
             
         except Exception as e:
-            # Fallback to rule-based prediction if AI fails
-            return self._fallback_prediction(student_data, str(e))
+            # Fallback to the local statistical forecast if AI fails
+            ai_metrics.count('fallbacks')
+            ai_metrics.record_error(e, outcome='fallback')
+            return self._fallback_prediction(student_data)
     
-    def _fallback_prediction(self, student_data, error_msg):
-        """Rule-based fallback prediction if AI fails"""
-        avg = student_data['current_average']
-        quiz_count = student_data['quiz_count']
-        
-        # Simple linear projection
-        predicted = avg
-        
-        # Determine trend from recent scores
-        if len(student_data['quiz_scores']) >= 3:
-            recent = student_data['quiz_scores'][-3:]
-            if recent[-1] > recent[0] + 5:
-                trend = 'IMPROVING'
-                predicted += 3
-            elif recent[-1] < recent[0] - 5:
-                trend = 'DECLINING'
-                predicted -= 3
-            else:
-                trend = 'STABLE'
-        else:
-            trend = 'STABLE'
-        
-        # Risk assessment
-        if avg >= 75:
-            risk = 'LOW'
-        elif avg >= 60:
-            risk = 'MEDIUM'
-        else:
-            risk = 'HIGH'
-        
-        # Topic analysis
-        topics = sorted(student_data['topic_performance'], key=lambda x: x['accuracy'], reverse=True)
-        strong = [t['topic'] for t in topics[:3] if t['accuracy'] >= 75]
-        weak = [t['topic'] for t in topics[-3:] if t['accuracy'] < 60]
-        
-        return {
-            'predicted_grade': max(0, min(100, predicted)),
-            'confidence': 0.6 if quiz_count >= 3 else 0.4,
-            'risk_level': risk,
-            'trend': trend,
-            'strong_topics': strong,
-            'weak_topics': weak,
-            'recommendations': f'AI service unavailable. Current average: {avg:.1f}%. Focus on weak areas to improve performance.'
-        }
+    def _fallback_prediction(self, student_data):
+        """Local statistical forecast if AI fails"""
+        from .forecasting import LocalForecastEngine
+
+        prediction = LocalForecastEngine().predict_grade(student_data)
+        prediction['recommendations'] = f"AI service unavailable. {prediction['recommendations']}"
+        prediction['fallback'] = True
+        return prediction
@@ -0,0 +1,215 @@
+"""
+AI Request Coalescing
+Single-flight deduplication for identical in-flight LLM requests. Callers
+in one process with the same key wait on one leader and share its result;
+across worker processes the leaders serialize on the key's fcntl lock file
+and the first one's answer is handed to the rest through a small SQLite
+result store. Callers that disabled response caching coalesce within their
+process only, so nothing is stored for them.
+"""
+
+import asyncio
+import os
+import threading
+import time
+import weakref
+
+from django.conf import settings
+
+from . import ai_metrics
+from .ai_cache import DiskTier
+
+try:
+    import fcntl
+except ImportError:  # Windows: coalesce within the process only
+    fcntl = None
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    def __init__(self, lock_dir=None, result_ttl=30.0, wait=60.0, poll=0.02):
+        self.lock_dir = lock_dir if lock_dir and fcntl else None
+        self.result_ttl = result_ttl
+        self.wait = wait
+        self.poll = poll
+        self._calls = {}
+        self._lock = threading.Lock()
+        # event loop -> {key: Future} for async callers
+        self._futures = weakref.WeakKeyDictionary()
+        self.coalesced = 0
+        self.results = None
+        if self.lock_dir:
+            os.makedirs(self.lock_dir, exist_ok=True)
+            self.results = DiskTier(os.path.join(self.lock_dir, 'results.sqlite3'), maxsize=1000)
+
+    def _coalesced(self):
+        with self._lock:
+            self.coalesced += 1
+        ai_metrics.count('coalesced')
+        ai_metrics.record(outcome='coalesced')
+
+    # Cross-process part: hold the key's lock file while computing
+
+    def _lock_path(self, key):
+        return os.path.join(self.lock_dir, f"{key}.lock")
+
+    def _acquire(self, key):
+        """
+        Lock the key's file, then look for a result another process stored
+
+        Returns:
+            (lock file or None, stored result or None); after `wait` seconds
+            without the lock the caller goes ahead unlocked
+        """
+        if not self.lock_dir:
+            return None, None
+        path = self._lock_path(key)
+        deadline = time.monotonic() + self.wait
+        while True:
+            handle = open(path, 'a+')
+            while True:
+                try:
+                    fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    break
+                except BlockingIOError:
+                    if time.monotonic() >= deadline:
+                        handle.close()
+                        return None, None
+                    time.sleep(self.poll)
+            # The previous holder unlinks the file on release; a lock on the
+            # unlinked file would not exclude anyone, so start over on a fresh one
+            try:
+                if os.stat(path).st_ino == os.fstat(handle.fileno()).st_ino:
+                    break
+            except FileNotFoundError:
+                pass
+            handle.close()
+        stored = self.results.get(key)
+        return handle, stored[0] if stored else None
+
+    def _store(self, key, value):
+        if self.results is not None and value is not None:
+            self.results.set(key, value, time.time() + self.result_ttl)
+
+    def _release(self, key, handle):
+        if handle is not None:
+            # Unlinked while still locked, so the directory does not grow with every key
+            os.unlink(self._lock_path(key))
+            fcntl.flock(handle, fcntl.LOCK_UN)
+            handle.close()
+
+    # Sync callers
+
+    def do(self, key, fn, share=True):
+        """
+        Run fn() once for all concurrent callers with this key and return its result to each
+
+        Args:
+            share: Also coalesce with other processes and hand them the result
+                through the result store; False keeps the call in this process
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            self._coalesced()
+            if not call.done.wait(self.wait):
+                return fn()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            handle, stored = self._acquire(key) if share else (None, None)
+            try:
+                if stored is not None:
+                    self._coalesced()
+                    call.result = stored
+                else:
+                    call.result = fn()
+                    if share:
+                        self._store(key, call.result)
+            finally:
+                self._release(key, handle)
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.done.set()
+
+    # Async callers (one event loop; the lock file is taken off the loop)
+
+    async def ado(self, key, afn, share=True):
+        """do() for coroutines: afn is a coroutine function"""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            futures = self._futures.setdefault(loop, {})
+            future = futures.get(key)
+            leader = future is None
+            if leader:
+                future = futures[key] = loop.create_future()
+
+        if not leader:
+            self._coalesced()
+            return await asyncio.shield(future)
+
+        try:
+            handle, stored = await asyncio.to_thread(self._acquire, key) if share else (None, None)
+            try:
+                if stored is not None:
+                    self._coalesced()
+                    result = stored
+                else:
+                    result = await afn()
+                    if share:
+                        await asyncio.to_thread(self._store, key, result)
+            finally:
+                self._release(key, handle)
+            future.set_result(result)
+            return result
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Followers re-raise it; mark it retrieved for the leader
+            future.exception()
+            raise
+        finally:
+            with self._lock:
+                futures.pop(key, None)
+
+
+_single_flight = None
+_single_flight_lock = threading.Lock()
+
+
+def get_single_flight():
+    """Process-wide SingleFlight configured by the AI_SINGLEFLIGHT_* settings"""
+    global _single_flight
+    with _single_flight_lock:
+        if _single_flight is None:
+            _single_flight = SingleFlight(
+                lock_dir=getattr(settings, 'AI_SINGLEFLIGHT_DIR', None),
+                result_ttl=getattr(settings, 'AI_SINGLEFLIGHT_TTL', 30.0),
+                wait=getattr(settings, 'AI_SINGLEFLIGHT_WAIT', 60.0),
+            )
+        return _single_flight
+
+
+def reset_single_flight():
+    global _single_flight
+    with _single_flight_lock:
+        _single_flight = None
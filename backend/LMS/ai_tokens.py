@@ -0,0 +1,27 @@
+"""
+Prompt Token Estimates
+A local, dependency-free approximation of the provider's tokenizer: words
+count as one token per four characters (at least one) and each punctuation
+mark as one token. Good enough to budget prompts and rate limits; the
+provider's reported usage remains the source of truth.
+"""
+
+import re
+
+
+_PIECES = re.compile(r"\w+|[^\w\s]")
+
+# Role and separator tokens the chat format adds around every message
+MESSAGE_OVERHEAD = 4
+REPLY_PRIMING = 3
+
+
+def estimate_text_tokens(text):
+    return sum(-(-len(piece) // 4) for piece in _PIECES.findall(str(text or '')))
+
+
+def estimate_tokens(messages):
+    """Estimated prompt tokens of a chat request's messages"""
+    return REPLY_PRIMING + sum(
+        MESSAGE_OVERHEAD + estimate_text_tokens(m.get('content', '')) for m in messages
+    )
@@ -0,0 +1,200 @@
+"""
+Async AI Endpoints
+Native async Django views for the LLM-backed endpoints. Under ASGI
+(backend/asgi.py) a slow completion awaits on the event loop instead of
+pinning a worker thread; AIService.achat bounds the calls in flight.
+Request and response bodies match the former DRF views. ai_chat can also
+stream the answer as server-sent events.
+"""
+
+import json
+import time
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.http import JsonResponse, StreamingHttpResponse
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+
+from . import ai_metrics
+from .ai_service import AIService
+
+
+# Bodies DRF's FormParser and MultiPartParser accepted on the former views
+FORM_CONTENT_TYPES = ('application/x-www-form-urlencoded', 'multipart/form-data')
+
+
+def _unauthorized(detail):
+    response = JsonResponse({'detail': str(detail)}, status=401)
+    response['WWW-Authenticate'] = JWTAuthentication().authenticate_header(None)
+    return response
+
+
+def async_ai_view(view):
+    """
+    POST-only, JWT-authenticated async view taking the parsed request body
+
+    Mirrors @api_view(['POST']) + IsAuthenticated for views that cannot go
+    through DRF (DRF views are sync only), including DRF's default parsers:
+    form-encoded and multipart bodies arrive as a QueryDict, anything else
+    is parsed as JSON.
+    """
+    @csrf_exempt
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        if request.method != 'POST':
+            return JsonResponse({'detail': f'Method "{request.method}" not allowed.'}, status=405)
+
+        try:
+            # Token validation and the user lookup hit the database
+            auth = await sync_to_async(JWTAuthentication().authenticate)(request)
+        except AuthenticationFailed as e:
+            return _unauthorized(e.detail)
+        if auth is None:
+            return _unauthorized('Authentication credentials were not provided.')
+        request.user = auth[0]
+
+        if request.content_type in FORM_CONTENT_TYPES:
+            # Multipart parsing may spool uploads to disk
+            data = await sync_to_async(lambda: request.POST)()
+            return await view(request, data, *args, **kwargs)
+        try:
+            data = json.loads(request.body or b'{}')
+        except ValueError:
+            return JsonResponse({'detail': 'JSON parse error'}, status=400)
+        if not isinstance(data, dict):
+            return JsonResponse({'detail': 'Expected a JSON object'}, status=400)
+
+        return await view(request, data, *args, **kwargs)
+    return wrapper
+
+
+def _sse(payload, event=None):
+    head = f"event: {event}\n" if event else ""
+    return f"{head}data: {json.dumps(payload)}\n\n"
+
+
+def _wants_stream(request, data):
+    return bool(data.get('stream')) or 'text/event-stream' in request.headers.get('Accept', '')
+
+
+async def _stream_chat(messages):
+    """
+    Server-sent events: one {"delta": ...} event per chunk, then a "done"
+    event with timings (or an "error" event)
+
+    The first chunk is awaited before responding so the time to first token
+    can go in the X-Time-To-First-Token-Ms and Server-Timing headers.
+    """
+    started = time.perf_counter()
+    chunks = AIService().astream_chat(messages)
+    failure = None
+    try:
+        first = await anext(chunks, '')
+    except Exception as e:
+        first, failure = '', e
+    ttft_ms = (time.perf_counter() - started) * 1000
+    if failure is None:
+        ai_metrics.observe_ms('chat.ttft', ttft_ms)
+
+    async def events():
+        if failure is not None:
+            yield _sse({'error': f"Error: {failure}"}, event='error')
+            return
+        size = len(first)
+        if first:
+            yield _sse({'delta': first})
+        try:
+            async for delta in chunks:
+                size += len(delta)
+                yield _sse({'delta': delta})
+        except Exception as e:
+            yield _sse({'error': f"Error: {e}"}, event='error')
+            return
+        total_ms = (time.perf_counter() - started) * 1000
+        ai_metrics.observe_ms('chat.stream_total', total_ms)
+        yield _sse({'ttft_ms': round(ttft_ms, 1), 'total_ms': round(total_ms, 1), 'chars': size}, event='done')
+
+    response = StreamingHttpResponse(events(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # Stop nginx from buffering the stream
+    response['X-Accel-Buffering'] = 'no'
+    response['X-Time-To-First-Token-Ms'] = f"{ttft_ms:.1f}"
+    response['Server-Timing'] = f"ttft;dur={ttft_ms:.1f}"
+    return response
+
+
+@async_ai_view
+async def ai_chat(request, data):
+    """
+    General AI chat endpoint
+
+    {"stream": true} (or Accept: text/event-stream) streams the answer as
+    server-sent events instead of returning {"response": ...}
+    """
+    messages = data.get('messages', [])
+
+    if not messages:
+        return JsonResponse({'error': 'Messages are required'}, status=400)
+
+    if _wants_stream(request, data):
+        return await _stream_chat(messages)
+
+    response = await AIService().achat(messages)
+    return JsonResponse({'response': response})
+
+
+@async_ai_view
+async def generate_quiz(request, data):
+    """Generate quiz questions using AI"""
+    SubjectOffering = data.get('name', '')
+    topic = data.get('topic', '')
+    num_questions = data.get('num_questions', 5)
+
+    if not SubjectOffering or not topic:
+        return JsonResponse({'error': 'Subject and topic are required'}, status=400)
+
+    questions = await AIService().agenerate_quiz_questions(SubjectOffering, topic, num_questions)
+    return JsonResponse({'questions': questions})
+
+
+@async_ai_view
+async def explain_concept(request, data):
+    """Get AI explanation of a concept"""
+    concept = data.get('concept', '')
+    SubjectOffering = data.get('name', '')
+
+    if not concept or not SubjectOffering:
+        return JsonResponse({'error': 'Concept and subject are required'}, status=400)
+
+    explanation = await AIService().aexplain_concept(concept, SubjectOffering)
+    return JsonResponse({'explanation': explanation})
+
+
+@async_ai_view
+async def provide_feedback(request, data):
+    """Get AI feedback on student answer"""
+    student_answer = data.get('student_answer', '')
+    correct_answer = data.get('correct_answer', '')
+    question = data.get('question', '')
+
+    if not all([student_answer, correct_answer, question]):
+        return JsonResponse({'error': 'All fields are required'}, status=400)
+
+    feedback = await AIService().aprovide_feedback(student_answer, correct_answer, question)
+    return JsonResponse({'feedback': feedback})
+
+
+@async_ai_view
+async def generate_study_plan(request, data):
+    """Generate personalized study plan"""
+    SubjectOffering = data.get('name', '')
+    topics = data.get('topics', [])
+    difficulty_level = data.get('difficulty_level', 'intermediate')
+
+    if not SubjectOffering or not topics:
+        return JsonResponse({'error': 'Subject and topics are required'}, status=400)
+
+    study_plan = await AIService().agenerate_study_plan(SubjectOffering, topics, difficulty_level)
+    return JsonResponse({'study_plan': study_plan})
@@ -0,0 +1,120 @@
+"""
+Best Score Projection
+Keeps QuizBestScore (best counted attempt per student and quiz) in step with
+QuizAttempt so quarterly totals are a sum over one indexed table.
+"""
+
+from django.db import transaction
+from django.db.models import F
+
+from .models import QuizAttempt, QuizBestScore
+
+
+
+def _counted_attempts(student_ids=None, quiz_ids=None):
+    attempts = QuizAttempt.objects.filter(status__in=QuizAttempt.COUNTED_STATUSES)
+    if student_ids is not None:
+        attempts = attempts.filter(student_id__in=student_ids)
+    if quiz_ids is not None:
+        attempts = attempts.filter(quiz_id__in=quiz_ids)
+    # Highest score first, earliest attempt wins ties; unscored attempts count as 0
+    return attempts.order_by(F("score").desc(nulls_last=True), "id")
+
+
+def expected_best_scores(student_ids=None, quiz_ids=None):
+    """
+    Compute the projection straight from the raw attempts
+
+    Returns:
+        Dict of (student_id, quiz_id) -> (best_score, attempt_id)
+    """
+    expected = {}
+    rows = _counted_attempts(student_ids, quiz_ids).values_list("student_id", "quiz_id", "score", "id")
+    for student_id, quiz_id, score, attempt_id in rows:
+        expected.setdefault((student_id, quiz_id), (float(score or 0.0), attempt_id))
+    return expected
+
+
+def refresh_best_score(student_id, quiz_id):
+    """Re-derive one (student, quiz) row after any of its attempts changed score or status"""
+    best = (
+        _counted_attempts([student_id], [quiz_id])
+        .values_list("score", "id")
+        .first()
+    )
+    if best is None:
+        QuizBestScore.objects.filter(student_id=student_id, quiz_id=quiz_id).delete()
+        return None
+
+    score, attempt_id = best
+    row, _ = QuizBestScore.objects.update_or_create(
+        student_id=student_id,
+        quiz_id=quiz_id,
+        defaults={"best_score": float(score or 0.0), "attempt_id": attempt_id},
+    )
+    return row
+
+
+def _stored_rows(student_ids=None, quiz_ids=None):
+    rows = QuizBestScore.objects.all()
+    if student_ids is not None:
+        rows = rows.filter(student_id__in=student_ids)
+    if quiz_ids is not None:
+        rows = rows.filter(quiz_id__in=quiz_ids)
+    return {(r.student_id, r.quiz_id): r for r in rows}
+
+
+def check_best_scores(student_ids=None, quiz_ids=None):
+    """
+    Compare the projection with the raw attempts
+
+    Returns:
+        List of dicts describing each drifted (student, quiz) pair; empty when consistent
+    """
+    expected = expected_best_scores(student_ids, quiz_ids)
+    stored = _stored_rows(student_ids, quiz_ids)
+
+    problems = []
+    for key in sorted(set(expected) | set(stored)):
+        want = expected.get(key)
+        row = stored.get(key)
+        have = (row.best_score, row.attempt_id) if row else None
+        if want != have:
+            problems.append({
+                "student_id": key[0],
+                "quiz_id": key[1],
+                "expected": want[0] if want else None,
+                "stored": have[0] if have else None,
+            })
+    return problems
+
+
+def rebuild_best_scores(student_ids=None, quiz_ids=None):
+    """
+    Rebuild the projection (optionally for some students/quizzes) from the raw attempts
+
+    Returns:
+        Dict with created, updated and deleted row counts
+    """
+    expected = expected_best_scores(student_ids, quiz_ids)
+
+    with transaction.atomic():
+        stored = _stored_rows(student_ids, quiz_ids)
+
+        to_create, to_update = [], []
+        for (student_id, quiz_id), (score, attempt_id) in expected.items():
+            row = stored.pop((student_id, quiz_id), None)
+            if row is None:
+                to_create.append(QuizBestScore(
+                    student_id=student_id, quiz_id=quiz_id, best_score=score, attempt_id=attempt_id,
+                ))
+            elif (row.best_score, row.attempt_id) != (score, attempt_id):
+                row.best_score, row.attempt_id = score, attempt_id
+                to_update.append(row)
+
+        QuizBestScore.objects.bulk_create(to_create, batch_size=500)
+        QuizBestScore.objects.bulk_update(to_update, ["best_score", "attempt"], batch_size=500)
+        stale_ids = [row.id for row in stored.values()]
+        QuizBestScore.objects.filter(id__in=stale_ids).delete()
+
+    return {"created": len(to_create), "updated": len(to_update), "deleted": len(stale_ids)}
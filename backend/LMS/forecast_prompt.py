@@ -0,0 +1,160 @@
+"""
+Grade Forecast Prompt
+Builds the AIService.predict_grade prompt within a token budget. The raw
+score list and topic table are compacted into summary statistics, a
+fixed-size downsampled score history and the strongest/weakest topics, and
+shrunk further until the local token estimate (LMS.ai_tokens) fits
+AI_FORECAST_PROMPT_BUDGET.
+"""
+
+import statistics
+
+from django.conf import settings
+
+from .ai_tokens import estimate_tokens
+
+
+# The prompt never shrinks below this many history points / topics per end
+MIN_HISTORY_POINTS = 4
+MIN_TOPICS = 1
+# Quiz titles double as topic names and can be long
+MAX_NAME_CHARS = 60
+
+SYSTEM_PROMPT = (
+    "You are an educational data analyst specializing in grade forecasting and "
+    "student performance analysis. Always respond with valid JSON only."
+)
+
+INSTRUCTIONS = """Based on this data, provide:
+1. Predicted final grade (0-100 scale)
+2. Confidence level in prediction (0-1 scale)
+3. Risk assessment (LOW/MEDIUM/HIGH) - risk of failing or underperforming
+4. Performance trend (IMPROVING/STABLE/DECLINING)
+5. Top 3 strong topics (topics with >75% accuracy)
+6. Top 3 weak topics (topics with <60% accuracy)
+7. Specific study recommendations (2-3 sentences)
+
+Format your response EXACTLY as JSON:
+{
+  "predicted_grade": <number>,
+  "confidence": <number 0-1>,
+  "risk_level": "<LOW/MEDIUM/HIGH>",
+  "trend": "<IMPROVING/STABLE/DECLINING>",
+  "strong_topics": ["topic1", "topic2", "topic3"],
+  "weak_topics": ["topic1", "topic2", "topic3"],
+  "recommendations": "<text>"
+}"""
+
+
+def _short(name, limit=MAX_NAME_CHARS):
+    name = str(name)
+    return name if len(name) <= limit else name[:limit - 3] + '...'
+
+
+def score_summary(scores):
+    """Summary statistics of a non-empty score list (percentages)"""
+    return {
+        'min': min(scores),
+        'median': statistics.median(scores),
+        'max': max(scores),
+        'stdev': statistics.pstdev(scores),
+        'latest': scores[-1],
+    }
+
+
+def downsample(scores, size):
+    """
+    At most `size` points, oldest first: consecutive scores are averaged in
+    (nearly) equal runs, which keeps the shape of the history
+    """
+    if len(scores) <= size:
+        return [round(s, 1) for s in scores]
+    return [
+        round(statistics.fmean(scores[i * len(scores) // size:(i + 1) * len(scores) // size]), 1)
+        for i in range(size)
+    ]
+
+
+def select_topics(topics, count):
+    """The `count` strongest and `count` weakest topics, strongest first"""
+    ranked = sorted(topics, key=lambda t: t['accuracy'], reverse=True)
+    if len(ranked) <= 2 * count:
+        return ranked
+    return ranked[:count] + ranked[-count:]
+
+
+def _user_prompt(student_data, history_size, topic_count):
+    scores = student_data['quiz_scores']
+    history = downsample(scores, history_size)
+    if len(history) < len(scores):
+        history_line = f"Quiz Score History ({len(scores)} scores averaged into {len(history)} points, oldest first): {history}"
+    else:
+        history_line = f"Quiz Score History (oldest first): {history}"
+    if scores:
+        summary = score_summary(scores)
+        summary_line = (
+            f"Score Summary: min {summary['min']:.1f}, median {summary['median']:.1f}, max {summary['max']:.1f}, "
+            f"std dev {summary['stdev']:.1f}, latest {summary['latest']:.1f}"
+        )
+    else:
+        summary_line = "Score Summary: no scores"
+
+    topics = student_data['topic_performance']
+    shown = select_topics(topics, topic_count)
+    topics_text = "\n".join(
+        f"  - {_short(t['topic'])}: {t['accuracy']:.1f}% accuracy ({t['correct']}/{t['total']} correct)"
+        for t in shown
+    )
+    if len(shown) < len(topics):
+        topics_header = f"Topic-Level Performance (strongest {topic_count} and weakest {topic_count} of {len(topics)} topics):"
+    else:
+        topics_header = "Topic-Level Performance:"
+
+    return f"""You are an educational data analyst. Analyze this student's quiz performance and provide a grade forecast.
+
+Student: {_short(student_data['student_name'])}
+Subject: {_short(student_data['subject_name'])}
+Quizzes Taken: {student_data['quiz_count']}
+Current Average: {student_data['current_average']:.1f}%
+{summary_line}
+
+{history_line}
+Recent Performance Trend: {student_data['recent_trend']}
+
+{topics_header}
+{topics_text}
+
+{INSTRUCTIONS}"""
+
+
+def forecast_messages(student_data, budget=None, history_size=None, topic_count=None):
+    """
+    Chat messages for a grade forecast whose estimated size fits the budget
+
+    Topics are dropped first, then the history is halved, down to
+    MIN_TOPICS / MIN_HISTORY_POINTS; a budget below that floor gets the
+    smallest prompt.
+
+    Args:
+        student_data: As for AIService.predict_grade
+        budget: Prompt tokens (default settings.AI_FORECAST_PROMPT_BUDGET)
+        history_size: Score history points (default settings.AI_FORECAST_HISTORY_POINTS)
+        topic_count: Strongest and weakest topics shown (default settings.AI_FORECAST_TOPICS)
+    """
+    budget = budget or getattr(settings, 'AI_FORECAST_PROMPT_BUDGET', 800)
+    history_size = history_size or getattr(settings, 'AI_FORECAST_HISTORY_POINTS', 12)
+    topic_count = topic_count or getattr(settings, 'AI_FORECAST_TOPICS', 3)
+
+    while True:
+        messages = [
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": _user_prompt(student_data, history_size, topic_count)},
+        ]
+        if estimate_tokens(messages) <= budget:
+            return messages
+        if topic_count > MIN_TOPICS:
+            topic_count -= 1
+        elif history_size > MIN_HISTORY_POINTS:
+            history_size = max(MIN_HISTORY_POINTS, history_size // 2)
+        else:
+            return messages
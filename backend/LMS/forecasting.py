@@ -0,0 +1,141 @@
+"""
+Local Grade Forecasting
+Exponentially weighted linear regression over each student's quiz percentages,
+vectorized with NumPy across many students. Returns the same dict shape as
+AIService.predict_grade so either engine can back GradeAnalyticsService.
+"""
+
+import numpy as np
+from django.conf import settings
+
+
+# Same thresholds the rule-based fallback and the AI prompt use
+RISK_LOW_AT = 75.0
+RISK_MEDIUM_AT = 60.0
+TREND_DELTA = 5.0
+STRONG_TOPIC_AT = 75.0
+WEAK_TOPIC_AT = 60.0
+
+
+class LocalForecastEngine:
+    """Offline replacement for AIService.predict_grade"""
+
+    def __init__(self, half_life=None, horizon=None, slope_damping=0.5):
+        # A quiz half_life quizzes old counts half as much as the latest one
+        self.half_life = half_life or getattr(settings, 'GRADE_FORECAST_HALF_LIFE', 4)
+        # Quizzes ahead the projection looks
+        self.horizon = horizon or getattr(settings, 'GRADE_FORECAST_HORIZON', 3)
+        self.slope_damping = slope_damping
+
+    def fit(self, score_lists):
+        """
+        Fit every student at once
+
+        Args:
+            score_lists: List of quiz percentage lists, oldest first
+
+        Returns:
+            Dict of per-student NumPy arrays: n, level, slope, predicted, residual_std, confidence
+        """
+        n_students = len(score_lists)
+        counts = np.array([len(s) for s in score_lists], dtype=float)
+        width = int(counts.max()) if n_students else 0
+
+        # Right-align the scores so column width-1 is every student's latest quiz
+        y = np.zeros((n_students, width))
+        mask = np.zeros((n_students, width), dtype=bool)
+        for i, scores in enumerate(score_lists):
+            if scores:
+                y[i, width - len(scores):] = scores
+                mask[i, width - len(scores):] = True
+
+        # x is "quizzes ago" negated: latest = 0, previous = -1, ...
+        x = np.arange(width, dtype=float) - (width - 1)
+        w = np.where(mask, 0.5 ** (-x / self.half_life), 0.0)
+
+        w_sum = np.maximum(w.sum(axis=1), 1e-12)
+        x_mean = (w * x).sum(axis=1) / w_sum
+        y_mean = (w * y).sum(axis=1) / w_sum
+        dx = np.where(mask, x - x_mean[:, None], 0.0)
+        dy = np.where(mask, y - y_mean[:, None], 0.0)
+        sxx = (w * dx * dx).sum(axis=1)
+        slope = np.where(sxx > 1e-12, (w * dx * dy).sum(axis=1) / np.maximum(sxx, 1e-12), 0.0)
+
+        # Fitted value at the latest quiz, then a damped projection forward
+        level = y_mean - slope * x_mean
+        predicted = np.clip(level + self.slope_damping * slope * self.horizon, 0.0, 100.0)
+
+        residuals = np.where(mask, y - (level[:, None] + slope[:, None] * x), 0.0)
+        dof = np.maximum(counts - 2, 1)
+        residual_std = np.sqrt((w * residuals ** 2).sum(axis=1) / w_sum * counts / dof)
+
+        # More quizzes and steadier scores mean more confidence
+        sample_factor = counts / (counts + 3.0)
+        spread_factor = 1.0 / (1.0 + residual_std / 15.0)
+        confidence = np.clip(sample_factor * spread_factor, 0.05, 0.95)
+
+        return {
+            'n': counts,
+            'level': level,
+            'slope': slope,
+            'predicted': predicted,
+            'residual_std': residual_std,
+            'confidence': confidence,
+        }
+
+    def predict_many(self, students_data):
+        """predict_grade() for many students with one vectorized fit"""
+        if not students_data:
+            return []
+        fit = self.fit([list(d['quiz_scores']) for d in students_data])
+
+        results = []
+        for i, student_data in enumerate(students_data):
+            n = int(fit['n'][i])
+            predicted = float(fit['predicted'][i])
+
+            # Change the fitted line implies over the last three quizzes
+            recent_change = float(fit['slope'][i]) * (min(n, 3) - 1)
+            if n >= 3 and recent_change > TREND_DELTA:
+                trend = 'IMPROVING'
+            elif n >= 3 and recent_change < -TREND_DELTA:
+                trend = 'DECLINING'
+            else:
+                trend = 'STABLE'
+
+            # Risk reflects the current average, as in the AI prompt, not the projection
+            average = student_data['current_average']
+            if average >= RISK_LOW_AT:
+                risk = 'LOW'
+            elif average >= RISK_MEDIUM_AT:
+                risk = 'MEDIUM'
+            else:
+                risk = 'HIGH'
+
+            topics = sorted(student_data['topic_performance'], key=lambda t: t['accuracy'], reverse=True)
+            strong = [t['topic'] for t in topics[:3] if t['accuracy'] >= STRONG_TOPIC_AT]
+            weak = [t['topic'] for t in topics[-3:] if t['accuracy'] < WEAK_TOPIC_AT]
+
+            results.append({
+                'predicted_grade': round(predicted, 2),
+                'confidence': round(float(fit['confidence'][i]), 3),
+                'risk_level': risk,
+                'trend': trend,
+                'strong_topics': strong,
+                'weak_topics': weak,
+                'recommendations': self._recommendations(predicted, trend, weak),
+            })
+        return results
+
+    def predict_grade(self, student_data):
+        return self.predict_many([student_data])[0]
+
+    def _recommendations(self, predicted, trend, weak):
+        text = f"Projected grade {predicted:.1f}% based on recent quiz results ({trend.lower()} trend)."
+        if weak:
+            text += f" Review {', '.join(weak)} before the next quiz."
+        elif predicted < RISK_LOW_AT:
+            text += " Regular practice on missed questions will help raise the average."
+        else:
+            text += " Keep up the consistent preparation."
+        return text
@@ -1,20 +1,62 @@
 """
 Grade Forecasting Service
-Analyzes quiz performance and generates AI-powered grade predictions
+Analyzes quiz performance and generates grade predictions, either AI-powered
+(AIService) or with the local statistical engine (LMS.forecasting)
 """
 
-from django.db.models import Avg, Count, Q
-from django.utils import timezone
-from datetime import timedelta
-from .models import QuizAttempt, QuizAnswer, QuizTopicPerformance, GradeForecast, Student, Subject, Quiz, SubjectOffering
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, Count, F, FloatField, Max, Q, Sum, Value, When
+from django.db.models.functions import Coalesce
+from .models import QuizAttempt, QuizAnswer, QuizTopicPerformance, GradeForecast, Student, SubjectOffering
+from .ai_scheduler import BATCH
 from .ai_service import AIService
+from .forecasting import LocalForecastEngine
+
+
+FORECAST_FIELDS = [
+    'current_average', 'quiz_count', 'predicted_grade', 'confidence_score', 'risk_level',
+    'performance_trend', 'strong_topics', 'weak_topics', 'recommendations', 'source_fingerprint', 'updated_at',
+]
+
+
+def _attempt_percentage():
+    """Attempt score as a percentage of the quiz's total points, computed in SQL"""
+    return Case(
+        When(quiz__total_points__gt=0,
+             then=Coalesce(F('score'), Value(0.0)) * 100.0 / F('quiz__total_points')),
+        default=Value(0.0),
+        output_field=FloatField(),
+    )
+
+
+FORECAST_ENGINES = ('ai', 'local')
+
+
+def _fingerprint(engine, quiz_count, latest_submitted_at, percentage_total):
+    """Identifies the graded-attempt state a forecast was built from"""
+    latest = latest_submitted_at.isoformat() if latest_submitted_at else '-'
+    return f"{engine}|{quiz_count}|{latest}|{percentage_total or 0.0:.4f}"
+
+
+def _topic_accuracy(row):
+    return (row['correct'] / row['total'] * 100) if row['total'] > 0 else 0
 
 
 class GradeAnalyticsService:
     """Service for aggregating quiz data and generating forecasts"""
     
-    def __init__(self):
-        self.ai_service = AIService()
+    def __init__(self, engine=None):
+        """
+        Args:
+            engine: 'ai' (LLM via AIService) or 'local' (LocalForecastEngine);
+                defaults to settings.GRADE_FORECAST_ENGINE
+        """
+        self.engine = engine or getattr(settings, 'GRADE_FORECAST_ENGINE', 'ai')
+        if self.engine not in FORECAST_ENGINES:
+            raise ValueError(f"Unknown forecast engine: {self.engine}")
+        # The local engine needs no API key or network access
+        self.forecaster = AIService() if self.engine == 'ai' else LocalForecastEngine()
     
     def get_student_quiz_data(self, student_id, SubjectOffering_id=None):
         """
@@ -28,7 +70,7 @@ class GradeAnalyticsService:
             Dict with aggregated performance metrics
         """
         try:
-            student = Student.objects.get(id=student_id)
+            student = Student.objects.select_related('user').get(id=student_id)
         except Student.DoesNotExist:
             return None
         
@@ -41,16 +83,19 @@ class GradeAnalyticsService:
         if SubjectOffering_id:
             attempts_query = attempts_query.filter(quiz__SubjectOffering_id=SubjectOffering_id)
         
-        attempts = attempts_query.select_related('quiz__SubjectOffering').order_by('submitted_at')
+        # Percentages are computed in SQL; one query returns (percentage, submitted_at) rows
+        rows = list(
+            attempts_query
+            .annotate(percentage=_attempt_percentage())
+            .order_by('submitted_at')
+            .values_list('percentage', 'submitted_at')
+        )
         
-        if not attempts.exists():
+        if not rows:
             return None
         
         # Calculate basic metrics
-        quiz_scores = [
-            (att.score / att.quiz.total_points * 100) if att.quiz.total_points > 0 else 0
-            for att in attempts
-        ]
+        quiz_scores = [percentage for percentage, _ in rows]
         
         current_average = sum(quiz_scores) / len(quiz_scores) if quiz_scores else 0
         
@@ -71,7 +116,8 @@ class GradeAnalyticsService:
             'quiz_count': len(quiz_scores),
             'recent_trend': recent_trend,
             'topic_performance': topic_performance,
-            'last_quiz_date': attempts.last().submitted_at if attempts.exists() else None
+            'last_quiz_date': rows[-1][1],
+            'latest_submitted_at': max((d for _, d in rows if d), default=None)
         }
     
     def _analyze_trend(self, scores):
@@ -102,38 +148,33 @@ class GradeAnalyticsService:
         Returns:
             List of dicts with topic, accuracy, correct, total
         """
-        # Get all graded answers for the student
+        # Graded auto-graded answers for the student
         answers_query = QuizAnswer.objects.filter(
             attempt__student=student,
             attempt__status='GRADED',
             question__question_type__in=['MULTIPLE_CHOICE', 'TRUE_FALSE']  # Only auto-graded
-        ).select_related('question__quiz')
+        )
         
         if SubjectOffering_id:
             answers_query = answers_query.filter(attempt__quiz__SubjectOffering_id=SubjectOffering_id)
         
-        # Group by quiz title as "topic" (you can enhance this with actual topic field)
-        topic_stats = {}
-        
-        for answer in answers_query:
-            topic = answer.question.quiz.title  # Using quiz title as topic
-            
-            if topic not in topic_stats:
-                topic_stats[topic] = {'correct': 0, 'total': 0}
-            
-            topic_stats[topic]['total'] += 1
-            if answer.is_correct:
-                topic_stats[topic]['correct'] += 1
+        # Group by quiz title as "topic" (you can enhance this with actual topic field);
+        # the database returns one summary row per topic
+        topic_rows = (
+            answers_query
+            .values(topic=F('question__quiz__title'))
+            .annotate(total=Count('id'), correct=Count('id', filter=Q(is_correct=True)))
+            .order_by('topic')
+        )
         
         # Convert to list format with accuracy
         performance_list = []
-        for topic, stats in topic_stats.items():
-            accuracy = (stats['correct'] / stats['total'] * 100) if stats['total'] > 0 else 0
+        for row in topic_rows:
             performance_list.append({
-                'topic': topic,
-                'accuracy': accuracy,
-                'correct': stats['correct'],
-                'total': stats['total']
+                'topic': row['topic'],
+                'accuracy': _topic_accuracy(row),
+                'correct': row['correct'],
+                'total': row['total']
             })
         
         # Sort by accuracy (descending)
@@ -150,21 +191,56 @@ class GradeAnalyticsService:
             return False
         
         topic_data = self._calculate_topic_performance(student, SubjectOffering_id)
+        self.save_topic_performance(offering, {student.id: topic_data})
+        return True
+    
+    def save_topic_performance(self, offering, topics_by_student, chunk_size=500):
+        """
+        Bulk upsert topic performance for many students of one offering
         
-        # Update or create records
-        for topic_info in topic_data:
-            obj, created = QuizTopicPerformance.objects.update_or_create(
-                student=student,
+        Rows are inserted or updated with one conflict-handling insert on
+        (student, SubjectOffering, topic); each student's topics that are no
+        longer in their list are deleted.
+        
+        Args:
+            offering: SubjectOffering
+            topics_by_student: Dict of student id -> _calculate_topic_performance() list
+                (an empty list removes all of that student's topics)
+        
+        Returns:
+            Dict with 'upserted' and 'deleted' row counts
+        """
+        rows = [
+            QuizTopicPerformance(
+                student_id=student_id,
                 SubjectOffering=offering,
                 topic=topic_info['topic'],
-                defaults={
-                    'total_questions': topic_info['total'],
-                    'correct_answers': topic_info['correct'],
-                    'accuracy_percentage': topic_info['accuracy']
-                }
+                total_questions=topic_info['total'],
+                correct_answers=topic_info['correct'],
+                accuracy_percentage=topic_info['accuracy'],
             )
+            for student_id, topics in topics_by_student.items()
+            for topic_info in topics
+        ]
         
-        return True
+        deleted = 0
+        student_ids = list(topics_by_student)
+        with transaction.atomic():
+            QuizTopicPerformance.objects.bulk_create(
+                rows,
+                update_conflicts=True,
+                unique_fields=['student', 'SubjectOffering', 'topic'],
+                update_fields=['total_questions', 'correct_answers', 'accuracy_percentage', 'last_updated'],
+                batch_size=chunk_size,
+            )
+            for start in range(0, len(student_ids), chunk_size):
+                stale = Q()
+                for student_id in student_ids[start:start + chunk_size]:
+                    current = [t['topic'] for t in topics_by_student[student_id]]
+                    stale |= Q(student_id=student_id) & ~Q(topic__in=current)
+                deleted += QuizTopicPerformance.objects.filter(SubjectOffering=offering).filter(stale).delete()[0]
+        
+        return {'upserted': len(rows), 'deleted': deleted}
     
     def generate_forecast(self, student_id, SubjectOffering_id):
         """
@@ -192,30 +268,237 @@ class GradeAnalyticsService:
         student_data['subject_name'] = subject.name
         
         # Call AI service for prediction
-        ai_prediction = self.ai_service.predict_grade(student_data)
+        ai_prediction = self.forecaster.predict_grade(student_data)
         
-        # Update topic performance records
-        self.update_topic_performance_records(student_id, SubjectOffering_id)
+        # Update topic performance records (already computed above)
+        self.save_topic_performance(subject, {student_data['student'].id: student_data['topic_performance']})
         
         # Create or update forecast record
         forecast, created = GradeForecast.objects.update_or_create(
             student=student_data['student'],
-            SubjectOffering=SubjectOffering.objects.get(id=SubjectOffering_id),
-            defaults={
-                'current_average': student_data['current_average'],
-                'quiz_count': student_data['quiz_count'],
-                'predicted_grade': ai_prediction['predicted_grade'],
-                'confidence_score': ai_prediction['confidence'],
-                'risk_level': ai_prediction['risk_level'],
-                'performance_trend': ai_prediction['trend'],
-                'strong_topics': ai_prediction['strong_topics'],
-                'weak_topics': ai_prediction['weak_topics'],
-                'recommendations': ai_prediction['recommendations']
-            }
+            SubjectOffering=subject,
+            defaults=self._forecast_values(student_data, ai_prediction)
         )
         
         return forecast
     
+    def _forecast_values(self, student_data, ai_prediction):
+        # A fallback forecast gets no fingerprint, so the next request retries the AI
+        fingerprint = '' if ai_prediction.get('fallback') else self._data_fingerprint(student_data)
+        return {
+            'current_average': student_data['current_average'],
+            'quiz_count': student_data['quiz_count'],
+            'predicted_grade': ai_prediction['predicted_grade'],
+            'confidence_score': ai_prediction['confidence'],
+            'risk_level': ai_prediction['risk_level'],
+            'performance_trend': ai_prediction['trend'],
+            'strong_topics': ai_prediction['strong_topics'],
+            'weak_topics': ai_prediction['weak_topics'],
+            'recommendations': ai_prediction['recommendations'],
+            'source_fingerprint': fingerprint
+        }
+    
+    def _data_fingerprint(self, student_data):
+        return _fingerprint(
+            self.engine,
+            student_data['quiz_count'],
+            student_data['latest_submitted_at'],
+            sum(student_data['quiz_scores']),
+        )
+    
+    def source_fingerprint(self, student_id, SubjectOffering_id):
+        """Fingerprint of the student's current graded attempts, read with one aggregate query"""
+        stats = QuizAttempt.objects.filter(
+            student_id=student_id,
+            quiz__SubjectOffering_id=SubjectOffering_id,
+            status='GRADED'
+        ).aggregate(n=Count('id'), latest=Max('submitted_at'), total=Sum(_attempt_percentage()))
+        return _fingerprint(self.engine, stats['n'], stats['latest'], stats['total'])
+    
+    def get_or_generate_forecast(self, student_id, SubjectOffering_id, force=False):
+        """
+        Return the stored forecast while its source data is unchanged, else regenerate
+        
+        Args:
+            force: Regenerate even if nothing changed
+        
+        Returns:
+            Tuple of (GradeForecast or None, cached: bool)
+        """
+        if not force:
+            forecast = GradeForecast.objects.filter(
+                student_id=student_id,
+                SubjectOffering_id=SubjectOffering_id,
+                source_fingerprint=self.source_fingerprint(student_id, SubjectOffering_id),
+            ).first()
+            if forecast:
+                return forecast, True
+        return self.generate_forecast(student_id, SubjectOffering_id), False
+    
+    def _predict_many(self, students_data, progress=None):
+        """Predictions in input order; the local engine fits all students at once"""
+        total = len(students_data)
+        if isinstance(self.forecaster, LocalForecastEngine):
+            predictions = self.forecaster.predict_many(students_data)
+            if progress and total:
+                progress(total, total)
+            return predictions
+        
+        predictions = []
+        for done, student_data in enumerate(students_data, start=1):
+            # Bulk forecasts queue behind interactive AI requests (LMS.ai_scheduler)
+            predictions.append(self.forecaster.predict_grade(student_data, priority=BATCH))
+            if progress:
+                progress(done, total)
+        return predictions
+    
+    def get_offering_quiz_data(self, offering, student_ids=None):
+        """
+        Build get_student_quiz_data()-style dicts for every student in an offering
+        
+        Uses three queries in total: graded attempt percentages, per-topic
+        answer counts and the students themselves.
+        
+        Args:
+            offering: SubjectOffering
+            student_ids: Optional iterable restricting the students
+        
+        Returns:
+            Dict of student id -> student data (students without graded quizzes are omitted)
+        """
+        attempts_query = QuizAttempt.objects.filter(quiz__SubjectOffering=offering, status='GRADED')
+        answers_query = QuizAnswer.objects.filter(
+            attempt__quiz__SubjectOffering=offering,
+            attempt__status='GRADED',
+            question__question_type__in=['MULTIPLE_CHOICE', 'TRUE_FALSE']
+        )
+        if student_ids is not None:
+            attempts_query = attempts_query.filter(student_id__in=student_ids)
+            answers_query = answers_query.filter(attempt__student_id__in=student_ids)
+        
+        scores = {}
+        last_dates = {}
+        latest = {}
+        for student_id, percentage, submitted_at in (
+            attempts_query
+            .annotate(percentage=_attempt_percentage())
+            .order_by('student_id', 'submitted_at')
+            .values_list('student_id', 'percentage', 'submitted_at')
+        ):
+            scores.setdefault(student_id, []).append(percentage)
+            last_dates[student_id] = submitted_at
+            if submitted_at is not None:
+                latest[student_id] = max(submitted_at, latest.get(student_id) or submitted_at)
+        
+        topics = {}
+        for row in (
+            answers_query
+            .values(student_id=F('attempt__student_id'), topic=F('question__quiz__title'))
+            .annotate(total=Count('id'), correct=Count('id', filter=Q(is_correct=True)))
+            .order_by('student_id', 'topic')
+        ):
+            topics.setdefault(row['student_id'], []).append({
+                'topic': row['topic'],
+                'accuracy': _topic_accuracy(row),
+                'correct': row['correct'],
+                'total': row['total']
+            })
+        
+        results = {}
+        for student in Student.objects.filter(id__in=scores).select_related('user'):
+            quiz_scores = scores[student.id]
+            topic_performance = sorted(topics.get(student.id, []), key=lambda x: x['accuracy'], reverse=True)
+            results[student.id] = {
+                'student': student,
+                'student_name': f"{student.user.first_name} {student.user.last_name}".strip() or student.user.email,
+                'subject_name': offering.name,
+                'quiz_scores': quiz_scores,
+                'current_average': sum(quiz_scores) / len(quiz_scores),
+                'quiz_count': len(quiz_scores),
+                'recent_trend': self._analyze_trend(quiz_scores),
+                'topic_performance': topic_performance,
+                'last_quiz_date': last_dates[student.id],
+                'latest_submitted_at': latest.get(student.id)
+            }
+        return results
+    
+    def generate_offering_forecasts(self, SubjectOffering_id, student_ids=None, progress=None, force=False):
+        """
+        Generate forecasts for every student of an offering in one pass
+        
+        Student metrics are computed in memory from get_offering_quiz_data();
+        GradeForecast and QuizTopicPerformance rows are then upserted in bulk.
+        
+        Args:
+            SubjectOffering_id: SubjectOffering ID
+            student_ids: Optional iterable restricting the students
+            progress: Optional callable(done, total) reporting prediction progress
+            force: Regenerate forecasts whose source data did not change
+        
+        Returns:
+            Dict with 'forecasts' (list of GradeForecast), 'unchanged' (student ids whose
+            stored forecast was kept) and 'skipped' (student ids without graded quizzes),
+            or None if the offering does not exist
+        """
+        try:
+            offering = SubjectOffering.objects.get(id=SubjectOffering_id)
+        except SubjectOffering.DoesNotExist:
+            return None
+        
+        data = self.get_offering_quiz_data(offering, student_ids)
+        
+        # Students whose stored forecast was built from the same graded attempts keep it
+        unchanged = set()
+        if not force:
+            stored = dict(
+                GradeForecast.objects
+                .filter(SubjectOffering=offering, student_id__in=data)
+                .values_list('student_id', 'source_fingerprint')
+            )
+            unchanged = {sid for sid, d in data.items() if stored.get(sid) == self._data_fingerprint(d)}
+        
+        students_data = [d for sid, d in data.items() if sid not in unchanged]
+        predictions = self._predict_many(students_data, progress)
+        
+        forecasts = [
+            GradeForecast(
+                student=student_data['student'],
+                SubjectOffering=offering,
+                **self._forecast_values(student_data, ai_prediction)
+            )
+            for student_data, ai_prediction in zip(students_data, predictions)
+        ]
+        
+        if student_ids is None:
+            roster = Student.objects.filter(section_id=offering.section_id).values_list('id', flat=True)
+        else:
+            roster = student_ids
+        skipped = sorted(set(roster) - set(data))
+        
+        # Students without graded quizzes keep no topic rows
+        topics_by_student = {student_id: [] for student_id in skipped}
+        topics_by_student.update({student_id: d['topic_performance'] for student_id, d in data.items()})
+        
+        with transaction.atomic():
+            GradeForecast.objects.bulk_create(
+                forecasts,
+                update_conflicts=True,
+                unique_fields=['student', 'SubjectOffering'],
+                update_fields=FORECAST_FIELDS,
+                batch_size=200,
+            )
+            self.save_topic_performance(offering, topics_by_student)
+        
+        return {
+            'forecasts': list(
+                GradeForecast.objects
+                .filter(SubjectOffering=offering, student_id__in=data)
+                .select_related('student__user', 'SubjectOffering')
+            ),
+            'unchanged': sorted(unchanged),
+            'skipped': skipped,
+        }
+    
     def get_all_student_forecasts(self, student_id):
         """Get all subject forecasts for a student"""
         try:
@@ -0,0 +1,148 @@
+"""
+Quiz Item Analysis
+Per-question statistics read from the QuizQuestionStats / QuizChoiceStats
+counters (LMS.item_stats), one row per question and choice.
+"""
+
+from .models import QuizAttempt, QuizChoiceStats, QuizQuestionStats
+from .quiz_cache import get_answer_key
+
+
+OBJECTIVE_TYPES = ('MULTIPLE_CHOICE', 'TRUE_FALSE')
+
+
+def _difficulty(pct):
+    if pct >= 75:
+        return 'Easy'
+    if pct >= 50:
+        return 'Medium'
+    if pct >= 25:
+        return 'Hard'
+    return 'Very Hard'
+
+
+def _objective_item(question, stats, picks, total_attempts):
+    correct_count = stats.correct
+    ungraded_count = stats.ungraded
+    incorrect_count = total_attempts - correct_count - ungraded_count
+
+    graded_total = correct_count + incorrect_count
+    correct_percentage = (correct_count / graded_total * 100) if graded_total > 0 else 0
+    difficulty = _difficulty(correct_percentage) if graded_total > 0 else 'N/A'
+
+    choice_distribution = {}
+    for choice in question['choices']:
+        choice_count = picks.get(choice['id'], 0)
+        choice_distribution[choice['choice_text']] = {
+            'count': choice_count,
+            'percentage': (choice_count / total_attempts * 100) if total_attempts > 0 else 0,
+            'is_correct': choice['is_correct']
+        }
+
+    return {
+        'analysis_mode': 'CHOICES',
+        'correct_count': correct_count,
+        'incorrect_count': incorrect_count,
+        'ungraded_count': ungraded_count,
+        'graded_count': graded_total,
+        'pending_count': ungraded_count,
+        'correct_percentage': round(correct_percentage, 2),
+        'difficulty': difficulty,
+        'choice_distribution': choice_distribution,
+        'avg_score': None,
+        'score_distribution': [],
+    }
+
+
+def _subjective_item(question, stats, total_attempts):
+    histogram = {float(score): count for score, count in (stats.score_histogram or {}).items() if count}
+
+    graded_count = sum(histogram.values())
+    pending_count = total_attempts - graded_count
+    avg_score = (sum(score * n for score, n in histogram.items()) / graded_count) if graded_count else 0.0
+
+    score_distribution = [
+        {
+            'score': score,
+            'count': count,
+            'percentage': round((count / graded_count * 100) if graded_count > 0 else 0, 2),
+        }
+        for score, count in sorted(histogram.items())
+    ]
+
+    # Difficulty for manual items: average score vs max points
+    max_points = question['points']
+    if graded_count == 0 or max_points <= 0:
+        difficulty = 'N/A'
+    else:
+        difficulty = _difficulty((avg_score / max_points) * 100)
+
+    return {
+        'analysis_mode': 'SCORES',
+        'graded_count': graded_count,
+        'pending_count': pending_count,
+        'ungraded_count': pending_count,
+        'avg_score': round(avg_score, 2),
+        'max_points': max_points,
+        'score_distribution': score_distribution,
+
+        # Kept for compatibility (frontend can ignore in SCORES mode)
+        'correct_count': 0,
+        'incorrect_count': 0,
+        'correct_percentage': 0,
+        'difficulty': difficulty,
+        'choice_distribution': {},
+    }
+
+
+def get_item_analysis(quiz):
+    """Build the quiz_item_analysis response body from the stored counters"""
+    questions = get_answer_key(quiz).questions
+    stats = {s.question_id: s for s in QuizQuestionStats.objects.filter(question__quiz=quiz)}
+    picks = dict(
+        QuizChoiceStats.objects
+        .filter(choice__question__quiz=quiz)
+        .values_list('choice_id', 'picks')
+    )
+
+    analysis = []
+    for question in questions:
+        question_stats = stats.get(question['id'])
+        total_attempts = question_stats.attempts if question_stats else 0
+
+        base = {
+            'question_id': question['id'],
+            'question_text': question['question_text'],
+            'question_type': question['question_type'],
+            'points': question['points'],
+            'order': question['order'],
+            'total_attempts': total_attempts,
+        }
+
+        if total_attempts == 0:
+            analysis.append({
+                **base,
+                'analysis_mode': 'N/A',
+                'correct_count': 0,
+                'incorrect_count': 0,
+                'ungraded_count': 0,
+                'correct_percentage': 0,
+                'difficulty': 'N/A',
+                'choice_distribution': {},
+                'graded_count': 0,
+                'pending_count': 0,
+                'avg_score': 0,
+                'score_distribution': [],
+            })
+        elif question['question_type'] in OBJECTIVE_TYPES:
+            analysis.append({**base, **_objective_item(question, question_stats, picks, total_attempts)})
+        else:
+            analysis.append({**base, **_subjective_item(question, question_stats, total_attempts)})
+
+    return {
+        'quiz_id': quiz.id,
+        'quiz_title': quiz.title,
+        'total_questions': len(questions),
+        'total_student_attempts': quiz.attempts.filter(status__in=QuizAttempt.COUNTED_STATUSES).count(),
+        'questions': analysis
+    }
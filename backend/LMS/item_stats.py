@@ -0,0 +1,234 @@
+"""
+Item Statistics Counters
+Per-question and per-choice answer counters maintained on the grading write
+path, so item analysis reads one row per question instead of every answer.
+"""
+
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Case, Count, F, FloatField, IntegerField, Value, When
+
+from .models import QuizAnswer, QuizAttempt, QuizChoiceStats, QuizQuestionStats
+
+
+COUNTER_FIELDS = ['attempts', 'correct', 'incorrect', 'ungraded', 'manually_graded', 'points_sum']
+QUESTION_STAT_FIELDS = COUNTER_FIELDS + ['score_histogram']
+
+
+def snapshot(answer):
+    """The parts of a QuizAnswer the counters depend on"""
+    return (
+        answer.question_id,
+        answer.selected_choice_id,
+        answer.is_correct,
+        bool(answer.manually_graded),
+        float(answer.points_earned or 0.0),
+    )
+
+
+def _bucket(points):
+    return repr(float(points))
+
+
+class ItemStatsDelta:
+    """Accumulates counter changes and writes them with a constant number of queries"""
+
+    def __init__(self):
+        self.questions = defaultdict(lambda: {'histogram': defaultdict(int), **dict.fromkeys(COUNTER_FIELDS, 0)})
+        self.choices = defaultdict(int)
+
+    def add(self, snap, n=1):
+        question_id, choice_id, is_correct, manually_graded, points = snap
+        q = self.questions[question_id]
+        q['attempts'] += n
+        if is_correct is True:
+            q['correct'] += n
+        elif is_correct is False:
+            q['incorrect'] += n
+        else:
+            q['ungraded'] += n
+        if manually_graded:
+            q['manually_graded'] += n
+            q['histogram'][_bucket(points)] += n
+        q['points_sum'] += points * n
+        if choice_id is not None:
+            self.choices[choice_id] += n
+
+    def remove(self, snap):
+        self.add(snap, n=-1)
+
+    def apply(self):
+        """
+        Add the accumulated deltas to the stored counters
+
+        Counters are incremented in SQL (one UPDATE per table), so concurrent
+        submissions of the same quiz do not lock each other's rows. Only the
+        score histogram, which changes with manual grading, is read and
+        rewritten under a row lock.
+        """
+        question_ids = sorted(self.questions)
+        choice_ids = sorted(cid for cid, n in self.choices.items() if n)
+        if not question_ids and not choice_ids:
+            return
+
+        with transaction.atomic():
+            if question_ids:
+                QuizQuestionStats.objects.bulk_create(
+                    [QuizQuestionStats(question_id=qid) for qid in question_ids], ignore_conflicts=True,
+                )
+                increments = {
+                    field: _increment(field, 'question_id', {qid: q[field] for qid, q in self.questions.items()})
+                    for field in COUNTER_FIELDS
+                }
+                increments = {field: value for field, value in increments.items() if value is not None}
+                if increments:
+                    QuizQuestionStats.objects.filter(question_id__in=question_ids).update(**increments)
+                self._apply_histograms()
+
+            if choice_ids:
+                QuizChoiceStats.objects.bulk_create(
+                    [QuizChoiceStats(choice_id=cid) for cid in choice_ids], ignore_conflicts=True,
+                )
+                QuizChoiceStats.objects.filter(choice_id__in=choice_ids).update(
+                    picks=_increment('picks', 'choice_id', self.choices),
+                )
+
+    def _apply_histograms(self):
+        changed = sorted(qid for qid, q in self.questions.items() if any(q['histogram'].values()))
+        if not changed:
+            return
+        rows = list(
+            QuizQuestionStats.objects.select_for_update()
+            .filter(question_id__in=changed).order_by('question_id').only('id', 'question_id', 'score_histogram')
+        )
+        for row in rows:
+            histogram = dict(row.score_histogram or {})
+            for bucket, n in self.questions[row.question_id]['histogram'].items():
+                histogram[bucket] = histogram.get(bucket, 0) + n
+            row.score_histogram = {k: v for k, v in histogram.items() if v}
+        QuizQuestionStats.objects.bulk_update(rows, ['score_histogram'])
+
+
+def _increment(field, key_field, deltas):
+    """F(field) plus each row's delta picked by a CASE on key_field; None when nothing changes"""
+    output = FloatField() if field == 'points_sum' else IntegerField()
+    whens = [When(**{key_field: key}, then=Value(n, output_field=output)) for key, n in sorted(deltas.items()) if n]
+    if not whens:
+        return None
+    return F(field) + Case(*whens, default=Value(0, output_field=output), output_field=output)
+
+
+def record_answers(answers):
+    """Count the answers of attempts that just became SUBMITTED/GRADED"""
+    delta = ItemStatsDelta()
+    for answer in answers:
+        delta.add(snapshot(answer))
+    delta.apply()
+
+
+def record_regrades(changes):
+    """
+    Correct the counters after answers of already counted attempts changed
+
+    Args:
+        changes: Iterable of (snapshot taken before the change, updated answer)
+    """
+    delta = ItemStatsDelta()
+    for before, answer in changes:
+        delta.remove(before)
+        delta.add(snapshot(answer))
+    delta.apply()
+
+
+def _scoped(queryset, prefix, quiz_ids):
+    return queryset.filter(**{f'{prefix}__in': quiz_ids}) if quiz_ids is not None else queryset.all()
+
+
+def expected_item_stats(quiz_ids=None):
+    """
+    Counters recomputed from the raw answers with one grouped aggregation
+
+    Returns:
+        ItemStatsDelta holding the full expected counts
+    """
+    rows = (
+        _scoped(QuizAnswer.objects, 'question__quiz_id', quiz_ids)
+        .filter(attempt__status__in=QuizAttempt.COUNTED_STATUSES)
+        .values('question_id', 'selected_choice_id', 'is_correct', 'manually_graded', 'points_earned')
+        .annotate(n=Count('id'))
+        .order_by()
+    )
+    expected = ItemStatsDelta()
+    for r in rows:
+        expected.add((
+            r['question_id'], r['selected_choice_id'], r['is_correct'],
+            bool(r['manually_graded']), float(r['points_earned'] or 0.0),
+        ), n=r['n'])
+    return expected
+
+
+def _question_values(row):
+    values = {field: getattr(row, field) for field in COUNTER_FIELDS}
+    values['points_sum'] = round(values['points_sum'], 6)
+    values['histogram'] = {k: v for k, v in (row.score_histogram or {}).items() if v}
+    return values
+
+
+def _expected_values(counts):
+    values = {field: counts[field] for field in COUNTER_FIELDS}
+    values['points_sum'] = round(values['points_sum'], 6)
+    values['histogram'] = {k: v for k, v in counts['histogram'].items() if v}
+    return values
+
+
+def check_item_stats(quiz_ids=None):
+    """
+    Compare the stored counters with the raw answers
+
+    Returns:
+        List of dicts describing each drifted question or choice; empty when consistent
+    """
+    expected = expected_item_stats(quiz_ids)
+    problems = []
+
+    stored = {r.question_id: r for r in _scoped(QuizQuestionStats.objects, 'question__quiz_id', quiz_ids)}
+    zero = _expected_values(ItemStatsDelta().questions[None])
+    for qid in sorted(set(expected.questions) | set(stored)):
+        want = _expected_values(expected.questions[qid]) if qid in expected.questions else zero
+        have = _question_values(stored[qid]) if qid in stored else zero
+        if want != have:
+            problems.append({'question_id': qid, 'expected': want, 'stored': have})
+
+    picks = dict(
+        _scoped(QuizChoiceStats.objects, 'choice__question__quiz_id', quiz_ids).values_list('choice_id', 'picks')
+    )
+    for cid in sorted(set(expected.choices) | set(picks)):
+        if expected.choices.get(cid, 0) != picks.get(cid, 0):
+            problems.append({'choice_id': cid, 'expected': expected.choices.get(cid, 0), 'stored': picks.get(cid, 0)})
+    return problems
+
+
+def rebuild_item_stats(quiz_ids=None):
+    """
+    Replace the counters (optionally for some quizzes) with values from the raw answers
+
+    Returns:
+        Dict with the number of question and choice rows written
+    """
+    expected = expected_item_stats(quiz_ids)
+    with transaction.atomic():
+        _scoped(QuizQuestionStats.objects, 'question__quiz_id', quiz_ids).delete()
+        _scoped(QuizChoiceStats.objects, 'choice__question__quiz_id', quiz_ids).delete()
+        QuizQuestionStats.objects.bulk_create([
+            QuizQuestionStats(
+                question_id=qid,
+                score_histogram={k: v for k, v in counts['histogram'].items() if v},
+                **{field: counts[field] for field in COUNTER_FIELDS},
+            )
+            for qid, counts in expected.questions.items()
+        ], batch_size=500)
+        QuizChoiceStats.objects.bulk_create([
+            QuizChoiceStats(choice_id=cid, picks=n) for cid, n in expected.choices.items() if n
+        ], batch_size=500)
+    return {'questions': len(expected.questions), 'choices': sum(1 for n in expected.choices.values() if n)}
@@ -0,0 +1,174 @@
+"""
+Local Stub LLM Server
+A tiny OpenAI-compatible /v1/chat/completions server on 127.0.0.1 for load
+tests and client tests. It answers after a configurable delay (streamed
+requests get one server-sent event per word), can be told to fail the next
+requests with an HTTP error, and records how many requests were in flight
+at once.
+"""
+
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class _QuietServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # Clients that timed out and hung up are expected here
+        pass
+
+
+class StubLLMServer:
+    """
+    Usage:
+        with StubLLMServer(delay=0.05) as stub:
+            AIService(base_url=stub.base_url).chat(...)
+    """
+
+    def __init__(self, delay=0.0, reply=None, token_delay=0.0):
+        self.delay = delay
+        # Pause between streamed chunks
+        self.token_delay = token_delay
+        # reply(messages) -> completion text; echoes the last message by default
+        self.reply = reply or (lambda messages: f"stub: {messages[-1]['content'] if messages else ''}")
+        self.requests = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._failures = []
+        self._lock = threading.Lock()
+        self._server = None
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def fail(self, status=500, times=1, retry_after=None):
+        """Answer the next `times` requests with an HTTP `status` error (and a Retry-After header)"""
+        with self._lock:
+            self._failures.extend([(status, retry_after)] * times)
+
+    def _enter(self):
+        with self._lock:
+            self.requests += 1
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            return self._failures.pop(0) if self._failures else None
+
+    def _leave(self):
+        with self._lock:
+            self.in_flight -= 1
+
+    def completion(self, body):
+        messages = body.get('messages', [])
+        content = self.reply(messages)
+        prompt_tokens = sum(len(str(m.get('content', '')).split()) for m in messages)
+        return {
+            'id': f'stub-{self.requests}',
+            'object': 'chat.completion',
+            'created': int(time.time()),
+            'model': body.get('model', 'stub'),
+            'choices': [{
+                'index': 0,
+                'message': {'role': 'assistant', 'content': content},
+                'finish_reason': 'stop',
+            }],
+            'usage': {
+                'prompt_tokens': prompt_tokens,
+                'completion_tokens': len(content.split()),
+                'total_tokens': prompt_tokens + len(content.split()),
+            },
+        }
+
+    def chunks(self, body):
+        """ChatCompletionChunk payloads for a streamed request, one word each"""
+        words = self.reply(body.get('messages', [])).split(' ')
+        base = {'id': f'stub-{self.requests}', 'object': 'chat.completion.chunk',
+                'created': int(time.time()), 'model': body.get('model', 'stub')}
+        yield {**base, 'choices': [{'index': 0, 'delta': {'role': 'assistant', 'content': ''}, 'finish_reason': None}]}
+        for i, word in enumerate(words):
+            text = word if i == len(words) - 1 else word + ' '
+            yield {**base, 'choices': [{'index': 0, 'delta': {'content': text}, 'finish_reason': None}]}
+        yield {**base, 'choices': [{'index': 0, 'delta': {}, 'finish_reason': 'stop'}]}
+        if (body.get('stream_options') or {}).get('include_usage'):
+            usage = self.completion(body)['usage']
+            yield {**base, 'choices': [], 'usage': usage}
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length') or 0)
+                body = json.loads(self.rfile.read(length) or b'{}')
+                failure = stub._enter()
+                try:
+                    if stub.delay:
+                        time.sleep(stub.delay)
+                    if failure:
+                        self.error(*failure)
+                        return
+                    if body.get('stream'):
+                        self.stream(body)
+                        return
+                    payload = json.dumps(stub.completion(body)).encode()
+                finally:
+                    stub._leave()
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def error(self, status, retry_after=None):
+                payload = json.dumps({'error': {'message': f'stub error {status}', 'type': 'server_error'}}).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                if retry_after is not None:
+                    self.send_header('Retry-After', str(retry_after))
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def stream(self, body):
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/event-stream')
+                self.send_header('Transfer-Encoding', 'chunked')
+                self.end_headers()
+                events = [f"data: {json.dumps(chunk)}\n\n" for chunk in stub.chunks(body)] + ["data: [DONE]\n\n"]
+                for i, event in enumerate(events):
+                    if i and stub.token_delay:
+                        time.sleep(stub.token_delay)
+                    data = event.encode()
+                    self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+                    self.wfile.flush()
+                self.wfile.write(b"0\r\n\r\n")
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+    def start(self):
+        self._server = _QuietServer(('127.0.0.1', 0), self._handler())
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
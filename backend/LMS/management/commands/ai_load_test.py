@@ -0,0 +1,73 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand  # type: ignore
+
+from LMS.ai_client import aclose_async_clients
+from LMS.ai_limits import get_llm_limit
+from LMS.ai_service import AIService
+from LMS.llm_stub import StubLLMServer
+
+
+def _percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))] if ordered else 0.0
+
+
+class Command(BaseCommand):
+    help = 'Fire concurrent AIService chat calls at a local stub LLM server and report latency and concurrency'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200, help='Total chat calls')
+        parser.add_argument('--concurrency', type=int, default=50, help='Callers running at once')
+        parser.add_argument('--delay', type=float, default=0.2, help='Stub response delay in seconds')
+        parser.add_argument('--mode', choices=['async', 'sync'], default='async',
+                            help='async: AIService.achat on one event loop; sync: chat() on a thread pool')
+
+    async def run_async(self, service, n, concurrency):
+        gate = asyncio.Semaphore(concurrency)
+
+        async def one(i):
+            async with gate:
+                start = time.perf_counter()
+                await service.achat([{'role': 'user', 'content': f'load {i}'}], cache=False)
+                return time.perf_counter() - start
+
+        try:
+            return await asyncio.gather(*(one(i) for i in range(n)))
+        finally:
+            await aclose_async_clients()
+
+    def run_sync(self, service, n, concurrency):
+        def one(i):
+            start = time.perf_counter()
+            service.chat([{'role': 'user', 'content': f'load {i}'}], cache=False)
+            return time.perf_counter() - start
+
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            return list(pool.map(one, range(n)))
+
+    def handle(self, *args, **options):
+        n, concurrency = options['requests'], options['concurrency']
+        limit = get_llm_limit()
+
+        with StubLLMServer(delay=options['delay']) as stub:
+            service = AIService(base_url=stub.base_url)
+            start = time.perf_counter()
+            if options['mode'] == 'async':
+                latencies = asyncio.run(self.run_async(service, n, concurrency))
+            else:
+                latencies = self.run_sync(service, n, concurrency)
+            elapsed = time.perf_counter() - start
+
+        self.stdout.write(f"{options['mode']}: {n} calls, {concurrency} callers, stub delay {options['delay']:.3f}s")
+        self.stdout.write(f"  elapsed {elapsed:.2f}s, {n / elapsed:.1f} calls/s")
+        self.stdout.write(
+            f"  latency p50 {_percentile(latencies, 50) * 1000:.0f}ms, "
+            f"p95 {_percentile(latencies, 95) * 1000:.0f}ms, max {max(latencies) * 1000:.0f}ms"
+        )
+        self.stdout.write(
+            f"  upstream in flight max {stub.max_in_flight} (limit {limit.limit}), "
+            f"requests {stub.requests}, rejected {limit.rejected}"
+        )
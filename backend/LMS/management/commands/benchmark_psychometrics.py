@@ -0,0 +1,34 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError  # type: ignore
+
+from LMS.psychometrics import compute_psychometrics, synthetic_scores
+
+
+class Command(BaseCommand):
+    help = 'Time compute_psychometrics on a synthetic attempts x items matrix'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--attempts', type=int, default=500)
+        parser.add_argument('--items', type=int, default=100)
+        parser.add_argument('--choices', type=int, default=4)
+        parser.add_argument('--repeat', type=int, default=5, help='Timed runs (best is reported)')
+        parser.add_argument('--budget', type=float, default=1.0, help='Fail if the best run exceeds this many seconds')
+
+    def handle(self, *args, **options):
+        scores, max_points, choices = synthetic_scores(options['attempts'], options['items'], options['choices'])
+
+        timings = []
+        for _ in range(options['repeat']):
+            start = time.perf_counter()
+            stats = compute_psychometrics(scores, max_points, choices, options['choices'])
+            timings.append(time.perf_counter() - start)
+
+        best = min(timings)
+        self.stdout.write(
+            f"{options['attempts']} attempts x {options['items']} items: "
+            f"best {best * 1000:.1f} ms, mean {sum(timings) / len(timings) * 1000:.1f} ms "
+            f"(KR-20 {stats['kr20']:.3f})"
+        )
+        if best > options['budget']:
+            raise CommandError(f"Slower than the {options['budget']}s budget")
@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand, CommandError  # type: ignore
+
+from LMS.grade_analytics import FORECAST_ENGINES, GradeAnalyticsService
+from LMS.models import SubjectOffering
+
+
+class Command(BaseCommand):
+    help = 'Generate grade forecasts for every student of one or more subject offerings'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--offering', type=int, action='append', help='SubjectOffering id (repeatable)')
+        parser.add_argument('--section', type=int, help='Every offering of this Section id')
+        parser.add_argument('--all', action='store_true', help='Every subject offering')
+        parser.add_argument('--force', action='store_true', help='Regenerate forecasts whose data did not change')
+        parser.add_argument('--engine', choices=FORECAST_ENGINES, help='Defaults to settings.GRADE_FORECAST_ENGINE')
+
+    def handle(self, *args, **options):
+        offerings = SubjectOffering.objects.order_by('id')
+        if options['offering']:
+            offerings = offerings.filter(id__in=options['offering'])
+        elif options['section']:
+            offerings = offerings.filter(section_id=options['section'])
+        elif not options['all']:
+            raise CommandError('Pass --offering, --section or --all')
+
+        service = GradeAnalyticsService(engine=options['engine'])
+        for offering in offerings:
+            self.stdout.write(f'{offering}:')
+
+            def progress(done, total):
+                self.stdout.write(f'  {done}/{total} student(s)')
+
+            result = service.generate_offering_forecasts(offering.id, progress=progress, force=options['force'])
+            self.stdout.write(self.style.SUCCESS(
+                f"  {len(result['forecasts']) - len(result['unchanged'])} forecast(s) saved, "
+                f"{len(result['unchanged'])} unchanged, {len(result['skipped'])} student(s) without graded quizzes"
+            ))
@@ -0,0 +1,30 @@
+import time
+
+from django.core.management.base import BaseCommand  # type: ignore
+
+from LMS.submission_queue import process_batch
+
+
+class Command(BaseCommand):
+    help = 'Grade queued quiz submissions (submit_quiz?mode=async) in batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=50, help='Submissions claimed per batch')
+        parser.add_argument('--max-tries', type=int, default=3, help='Attempts before a submission is marked FAILED')
+        parser.add_argument('--sleep', type=float, default=2.0, help='Seconds to wait when the queue is empty')
+        parser.add_argument('--once', action='store_true', help='Drain the queue once and exit')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        max_tries = options['max_tries']
+
+        while True:
+            processed, failed = process_batch(batch_size=batch_size, max_tries=max_tries)
+            if processed or failed:
+                self.stdout.write(f'Graded {processed} submission(s), {failed} failed')
+                continue
+
+            if options['once']:
+                self.stdout.write(self.style.SUCCESS('Queue drained'))
+                return
+            time.sleep(options['sleep'])
@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand, CommandError  # type: ignore
+
+from LMS.best_scores import check_best_scores, rebuild_best_scores
+
+
+class Command(BaseCommand):
+    help = 'Rebuild or check the QuizBestScore projection against the raw quiz attempts'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='store_true', help='Only report drift; exit non-zero if any')
+        parser.add_argument('--quiz', type=int, action='append', help='Only this Quiz id (repeatable)')
+        parser.add_argument('--student', type=int, action='append', help='Only this Student id (repeatable)')
+
+    def handle(self, *args, **options):
+        scope = {'student_ids': options['student'], 'quiz_ids': options['quiz']}
+
+        if options['check']:
+            problems = check_best_scores(**scope)
+            for p in problems:
+                self.stdout.write(
+                    f"student={p['student_id']} quiz={p['quiz_id']} "
+                    f"expected={p['expected']} stored={p['stored']}"
+                )
+            if problems:
+                raise CommandError(f'{len(problems)} best-score row(s) out of date')
+            self.stdout.write(self.style.SUCCESS('Best scores are consistent'))
+            return
+
+        counts = rebuild_best_scores(**scope)
+        self.stdout.write(self.style.SUCCESS(
+            'Best scores rebuilt: {created} created, {updated} updated, {deleted} deleted'.format(**counts)
+        ))
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand, CommandError  # type: ignore
+
+from LMS.item_stats import check_item_stats, rebuild_item_stats
+
+
+class Command(BaseCommand):
+    help = 'Rebuild or check the per-question and per-choice item statistics counters'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='store_true', help='Only report drift; exit non-zero if any')
+        parser.add_argument('--quiz', type=int, action='append', help='Only this Quiz id (repeatable)')
+
+    def handle(self, *args, **options):
+        quiz_ids = options['quiz']
+
+        if options['check']:
+            problems = check_item_stats(quiz_ids)
+            for p in problems:
+                target = f"question={p['question_id']}" if 'question_id' in p else f"choice={p['choice_id']}"
+                self.stdout.write(f"{target} expected={p['expected']} stored={p['stored']}")
+            if problems:
+                raise CommandError(f'{len(problems)} item statistics row(s) out of date')
+            self.stdout.write(self.style.SUCCESS('Item statistics are consistent'))
+            return
+
+        counts = rebuild_item_stats(quiz_ids)
+        self.stdout.write(self.style.SUCCESS(
+            'Item statistics rebuilt: {questions} question(s), {choices} choice(s)'.format(**counts)
+        ))
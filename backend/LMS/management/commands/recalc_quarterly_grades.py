@@ -0,0 +1,69 @@
+from django.core.management.base import BaseCommand  # type: ignore
+
+from LMS.models import QuizAttempt, QuarterlyGrade, Quiz
+from LMS.best_scores import rebuild_best_scores
+from LMS.quarterly_grades import COMPONENT_FIELDS, recompute_quarterly_grades
+
+
+class Command(BaseCommand):
+    help = 'Recompute QuarterlyGrade components from quiz attempts in deduplicated batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--offering', type=int, help='Only this SubjectOffering id')
+        parser.add_argument('--student', type=int, help='Only this Student id')
+        parser.add_argument('--quarter', choices=['Q1', 'Q2', 'Q3', 'Q4'], help='Only this quarter')
+        parser.add_argument('--batch-size', type=int, default=200, help='Keys recomputed per batch')
+
+    def collect_keys(self, options):
+        attempts = QuizAttempt.objects.filter(status__in=['SUBMITTED', 'GRADED'])
+        grades = QuarterlyGrade.objects.all()
+        if options['offering']:
+            attempts = attempts.filter(quiz__SubjectOffering_id=options['offering'])
+            grades = grades.filter(SubjectOffering_id=options['offering'])
+        if options['student']:
+            attempts = attempts.filter(student_id=options['student'])
+            grades = grades.filter(student_id=options['student'])
+        if options['quarter']:
+            attempts = attempts.filter(quiz__quarter=options['quarter'])
+            grades = grades.filter(quarter=options['quarter'])
+
+        keys = set(
+            attempts.values_list('student_id', 'quiz__SubjectOffering_id', 'quiz__quarter', 'quiz__grade_type')
+            .distinct()
+        )
+
+        # Existing grade rows are refreshed for every component that has quizzes,
+        # so totals drop back when attempts were removed (components without
+        # quizzes are entered by hand and left alone)
+        quiz_keys = set(Quiz.objects.values_list('SubjectOffering_id', 'quarter', 'grade_type').distinct())
+        for student_id, offering_id, quarter in grades.values_list('student_id', 'SubjectOffering_id', 'quarter'):
+            for grade_type in COMPONENT_FIELDS:
+                if (offering_id, quarter, grade_type) in quiz_keys:
+                    keys.add((student_id, offering_id, quarter, grade_type))
+        return sorted(keys)
+
+    def handle(self, *args, **options):
+        # Repair the best-score projection first; the components are summed from it
+        quizzes = Quiz.objects.all()
+        if options['offering']:
+            quizzes = quizzes.filter(SubjectOffering_id=options['offering'])
+        if options['quarter']:
+            quizzes = quizzes.filter(quarter=options['quarter'])
+        counts = rebuild_best_scores(
+            student_ids=[options['student']] if options['student'] else None,
+            quiz_ids=list(quizzes.values_list('id', flat=True)) if options['offering'] or options['quarter'] else None,
+        )
+        self.stdout.write('Best scores: {created} created, {updated} updated, {deleted} deleted'.format(**counts))
+
+        keys = self.collect_keys(options)
+        batch_size = options['batch_size']
+        total = len(keys)
+        self.stdout.write(f'Recomputing {total} quarterly component(s)')
+
+        saved = 0
+        for start in range(0, total, batch_size):
+            batch = keys[start:start + batch_size]
+            saved += recompute_quarterly_grades(batch)
+            self.stdout.write(f'  {min(start + batch_size, total)}/{total}')
+
+        self.stdout.write(self.style.SUCCESS(f'Done: {saved} QuarterlyGrade row(s) saved'))
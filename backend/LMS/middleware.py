@@ -0,0 +1,29 @@
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+
+from .quarterly_grades import acoalesce_quarterly_recalc, coalesce_quarterly_recalc
+
+
+class QuarterlyRecalcMiddleware:
+    """Recompute each dirty quarterly grade once per request, after the view ran"""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        # Async-capable so the ASGI handler can await the async AI views
+        # instead of running the whole chain in a worker thread
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        with coalesce_quarterly_recalc():
+            return self.get_response(request)
+
+    async def __acall__(self, request):
+        # Sync views run on another thread here; the batch reaches them
+        # through sync_to_async's copied context
+        async with acoalesce_quarterly_recalc():
+            return await self.get_response(request)
@@ -0,0 +1,53 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:39
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import F
+
+
+def backfill_best_scores(apps, schema_editor):
+    QuizAttempt = apps.get_model('LMS', 'QuizAttempt')
+    QuizBestScore = apps.get_model('LMS', 'QuizBestScore')
+
+    best = {}
+    rows = (
+        QuizAttempt.objects
+        .filter(status__in=['SUBMITTED', 'GRADED'])
+        .order_by(F('score').desc(nulls_last=True), 'id')
+        .values_list('student_id', 'quiz_id', 'score', 'id')
+    )
+    for student_id, quiz_id, score, attempt_id in rows:
+        best.setdefault((student_id, quiz_id), (float(score or 0.0), attempt_id))
+
+    QuizBestScore.objects.bulk_create(
+        [
+            QuizBestScore(student_id=s, quiz_id=q, best_score=score, attempt_id=a)
+            for (s, q), (score, a) in best.items()
+        ],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('LMS', '0007_quizsubmission'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='QuizBestScore',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('best_score', models.FloatField(default=0.0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('attempt', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='LMS.quizattempt')),
+                ('quiz', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='best_scores', to='LMS.quiz')),
+                ('student', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='quiz_best_scores', to='LMS.student')),
+            ],
+            options={
+                'unique_together': {('student', 'quiz')},
+            },
+        ),
+        migrations.RunPython(backfill_best_scores, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,78 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:46
+
+import django.db.models.deletion
+from collections import defaultdict
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def backfill_item_stats(apps, schema_editor):
+    QuizAnswer = apps.get_model('LMS', 'QuizAnswer')
+    QuizQuestionStats = apps.get_model('LMS', 'QuizQuestionStats')
+    QuizChoiceStats = apps.get_model('LMS', 'QuizChoiceStats')
+
+    questions = {}
+    picks = defaultdict(int)
+    rows = (
+        QuizAnswer.objects
+        .filter(attempt__status__in=['SUBMITTED', 'GRADED'])
+        .values('question_id', 'selected_choice_id', 'is_correct', 'manually_graded', 'points_earned')
+        .annotate(n=Count('id'))
+        .order_by()
+    )
+    for r in rows:
+        n, points = r['n'], float(r['points_earned'] or 0.0)
+        stats = questions.setdefault(r['question_id'], QuizQuestionStats(question_id=r['question_id'], score_histogram={}))
+        stats.attempts += n
+        if r['is_correct'] is True:
+            stats.correct += n
+        elif r['is_correct'] is False:
+            stats.incorrect += n
+        else:
+            stats.ungraded += n
+        if r['manually_graded']:
+            stats.manually_graded += n
+            bucket = repr(points)
+            stats.score_histogram[bucket] = stats.score_histogram.get(bucket, 0) + n
+        stats.points_sum += points * n
+        if r['selected_choice_id'] is not None:
+            picks[r['selected_choice_id']] += n
+
+    QuizQuestionStats.objects.bulk_create(questions.values(), batch_size=500)
+    QuizChoiceStats.objects.bulk_create(
+        [QuizChoiceStats(choice_id=cid, picks=n) for cid, n in picks.items()], batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('LMS', '0008_quizbestscore'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='QuizChoiceStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('picks', models.IntegerField(default=0)),
+                ('choice', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='stats', to='LMS.quizchoice')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='QuizQuestionStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('attempts', models.IntegerField(default=0)),
+                ('correct', models.IntegerField(default=0)),
+                ('incorrect', models.IntegerField(default=0)),
+                ('ungraded', models.IntegerField(default=0, help_text='Answers with is_correct unset')),
+                ('manually_graded', models.IntegerField(default=0)),
+                ('points_sum', models.FloatField(default=0.0)),
+                ('score_histogram', models.JSONField(blank=True, default=dict, help_text='Points earned -> count, manually graded answers only')),
+                ('question', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='stats', to='LMS.quizquestion')),
+            ],
+        ),
+        migrations.RunPython(backfill_item_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('LMS', '0009_item_stats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='gradeforecast',
+            name='source_fingerprint',
+            field=models.CharField(blank=True, default='', max_length=128),
+        ),
+    ]
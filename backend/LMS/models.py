@@ -284,6 +284,9 @@ class Quiz(models.Model):
     shuffle_questions = models.BooleanField(default=False)
     allow_multiple_attempts = models.BooleanField(default=False)
     
+    # Bumped whenever questions/choices change so cached answer keys are invalidated
+    answer_key_version = models.PositiveIntegerField(default=0)
+    
     created_at = models.DateTimeField(auto_now_add=True, null=True)
     updated_at = models.DateTimeField(auto_now=True, null=True)
 
@@ -340,9 +343,12 @@ class QuizChoice(models.Model):
 class QuizAttempt(models.Model):
     STATUS_CHOICES = [
         ('IN_PROGRESS', 'In Progress'),
+        ('QUEUED', 'Queued for Grading'),
         ('SUBMITTED', 'Submitted'),
         ('GRADED', 'Graded'),
     ]
+    # Attempts that count towards scores, grades and item statistics
+    COUNTED_STATUSES = ('SUBMITTED', 'GRADED')
     
     quiz = models.ForeignKey(Quiz, on_delete=models.CASCADE, related_name="attempts")
     student = models.ForeignKey(Student, on_delete=models.CASCADE, related_name="quiz_attempts")
@@ -351,13 +357,17 @@ class QuizAttempt(models.Model):
     score = models.FloatField(null=True, blank=True)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='IN_PROGRESS')
     
+    # Autosaved answers while IN_PROGRESS: {question_id: {selected_choice_id, text_answer}}
+    draft_answers = models.JSONField(default=dict, blank=True)
+    draft_saved_at = models.DateTimeField(null=True, blank=True)
+    
     def __str__(self):
         return f"{self.student.user.email} - {self.quiz.title}"
 
 
 def quiz_answer_file_path(instance, filename: str) -> str:
     # media/quiz_answers/<attempt_id>/<question_id>/<filename>
-    return f"quiz_answers/{instance.attempt.id}/{instance.question.id}/{filename}"
+    return f"quiz_answers/{instance.attempt_id}/{instance.question_id}/{filename}"
 
 class QuizAnswer(models.Model):
     attempt = models.ForeignKey(QuizAttempt, on_delete=models.CASCADE, related_name="answers")
@@ -382,6 +392,75 @@ class QuizAnswer(models.Model):
         except Exception:
             return ""
 
+def queued_submission_file_path(attempt_id, file_key: str, filename: str) -> str:
+    # media/quiz_submissions/<attempt_id>/<file_key>/<filename>
+    return f"quiz_submissions/{attempt_id}/{file_key}/{filename}"
+
+class QuizSubmission(models.Model):
+    """Raw submit payload waiting for a grading worker (see process_quiz_submissions)"""
+    STATUS_CHOICES = [
+        ('PENDING', 'Pending'),
+        ('PROCESSING', 'Processing'),
+        ('DONE', 'Done'),
+        ('FAILED', 'Failed'),
+    ]
+
+    receipt = models.UUIDField(default=uuid.uuid4, unique=True, editable=False)
+    attempt = models.OneToOneField(QuizAttempt, on_delete=models.CASCADE, related_name="queued_submission")
+    answers = models.JSONField(default=list, blank=True)
+    files = models.JSONField(default=dict, blank=True, help_text="Upload field name -> stored file name")
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='PENDING')
+    tries = models.PositiveIntegerField(default=0)
+    error = models.TextField(blank=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    claimed_at = models.DateTimeField(null=True, blank=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['created_at']
+        indexes = [models.Index(fields=['status', 'created_at'])]
+
+    def __str__(self):
+        return f"{self.receipt} ({self.status})"
+
+class QuizBestScore(models.Model):
+    """Best SUBMITTED/GRADED score per student and quiz (kept current by LMS.best_scores)"""
+    student = models.ForeignKey(Student, on_delete=models.CASCADE, related_name="quiz_best_scores")
+    quiz = models.ForeignKey(Quiz, on_delete=models.CASCADE, related_name="best_scores")
+    attempt = models.ForeignKey(QuizAttempt, on_delete=models.SET_NULL, null=True, blank=True, related_name="+")
+    best_score = models.FloatField(default=0.0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ['student', 'quiz']
+
+    def __str__(self):
+        return f"{self.student_id} - {self.quiz_id}: {self.best_score}"
+
+class QuizQuestionStats(models.Model):
+    """Running answer counters for one question over counted attempts (kept current by LMS.item_stats)"""
+    question = models.OneToOneField(QuizQuestion, on_delete=models.CASCADE, related_name="stats")
+    attempts = models.IntegerField(default=0)
+    correct = models.IntegerField(default=0)
+    incorrect = models.IntegerField(default=0)
+    ungraded = models.IntegerField(default=0, help_text="Answers with is_correct unset")
+    manually_graded = models.IntegerField(default=0)
+    points_sum = models.FloatField(default=0.0)
+    score_histogram = models.JSONField(default=dict, blank=True, help_text="Points earned -> count, manually graded answers only")
+
+    def __str__(self):
+        return f"{self.question_id}: {self.attempts} answer(s)"
+
+
+class QuizChoiceStats(models.Model):
+    """How many counted answers picked a choice (kept current by LMS.item_stats)"""
+    choice = models.OneToOneField(QuizChoice, on_delete=models.CASCADE, related_name="stats")
+    picks = models.IntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.choice_id}: {self.picks}"
+
 def offering_file_path(instance, filename: str) -> str:
     # media/subject_offerings/<subject_offering_id>/<filename>
     return f"subject_offerings/{instance.subject_offering_id}/{filename}"
@@ -482,6 +561,9 @@ class GradeForecast(models.Model):
     weak_topics = models.JSONField(default=list, help_text="List of topics needing improvement")
     recommendations = models.TextField(blank=True, help_text="AI-generated study recommendations")
     
+    # Engine + graded-attempt summary the forecast was built from; unchanged means no regeneration needed
+    source_fingerprint = models.CharField(max_length=128, blank=True, default='')
+    
     # Metadata
     generated_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
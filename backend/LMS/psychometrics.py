@@ -0,0 +1,245 @@
+"""
+Quiz Psychometrics
+Classical test theory statistics (difficulty, discrimination, point-biserial,
+upper/lower 27% distractor analysis, KR-20) computed with NumPy over a dense
+attempt x question score matrix.
+"""
+
+import numpy as np
+
+from .models import QuizAnswer, QuizAttempt
+from .quiz_cache import get_answer_key
+
+
+OBJECTIVE_TYPES = ('MULTIPLE_CHOICE', 'TRUE_FALSE')
+
+# Kelley's upper/lower group fraction
+GROUP_FRACTION = 0.27
+
+
+class ScoreMatrix:
+    """
+    Dense view of a quiz's counted attempts
+
+    scores[a, q] is points_earned (0 when unanswered); choices[a, q] is the
+    position of the selected choice within question q's choices, or -1.
+    """
+
+    def __init__(self, attempt_ids, questions, scores, choices):
+        self.attempt_ids = attempt_ids
+        self.questions = questions
+        self.scores = scores
+        self.choices = choices
+
+    @property
+    def max_points(self):
+        return np.array([q['points'] for q in self.questions], dtype=float)
+
+    @property
+    def n_choices(self):
+        return max((len(q['choices']) for q in self.questions), default=0)
+
+
+def _lookup(keys, values):
+    """Positions of values inside keys (both 1-D int arrays); -1 when absent"""
+    if len(keys) == 0:
+        return np.full(len(values), -1, dtype=np.int64)
+    order = np.argsort(keys, kind='stable')
+    sorted_keys = keys[order]
+    pos = np.clip(np.searchsorted(sorted_keys, values), 0, len(keys) - 1)
+    return np.where(sorted_keys[pos] == values, order[pos], -1)
+
+
+def build_score_matrix(quiz):
+    """Load every counted answer for the quiz into a ScoreMatrix with two queries"""
+    questions = get_answer_key(quiz).questions
+
+    attempt_ids = np.array(
+        QuizAttempt.objects
+        .filter(quiz=quiz, status__in=QuizAttempt.COUNTED_STATUSES)
+        .order_by('id')
+        .values_list('id', flat=True),
+        dtype=np.int64,
+    )
+    rows = list(
+        QuizAnswer.objects
+        .filter(attempt__quiz=quiz, attempt__status__in=QuizAttempt.COUNTED_STATUSES)
+        .values_list('attempt_id', 'question_id', 'points_earned', 'selected_choice_id')
+    )
+
+    shape = (len(attempt_ids), len(questions))
+    scores = np.zeros(shape, dtype=float)
+    choices = np.full(shape, -1, dtype=np.int64)
+    if not rows or not questions:
+        return ScoreMatrix(attempt_ids, questions, scores, choices)
+
+    answer_attempts, answer_questions, points, selected = zip(*rows)
+    a_idx = _lookup(attempt_ids, np.array(answer_attempts, dtype=np.int64))
+    q_idx = _lookup(np.array([q['id'] for q in questions], dtype=np.int64), np.array(answer_questions, dtype=np.int64))
+    keep = (a_idx >= 0) & (q_idx >= 0)
+    a_idx, q_idx = a_idx[keep], q_idx[keep]
+
+    points = np.nan_to_num(np.array(points, dtype=float)[keep])
+    scores[a_idx, q_idx] = points
+
+    # Map each selected choice id to its position within its question's choices
+    choice_ids = np.array([c['id'] for q in questions for c in q['choices']], dtype=np.int64)
+    choice_pos = np.array([i for q in questions for i in range(len(q['choices']))], dtype=np.int64)
+    selected = np.nan_to_num(np.array(selected, dtype=float)[keep], nan=-1).astype(np.int64)
+    found = _lookup(choice_ids, selected)
+    choices[a_idx, q_idx] = np.where(found >= 0, choice_pos[np.maximum(found, 0)], -1)
+
+    return ScoreMatrix(attempt_ids, questions, scores, choices)
+
+
+def _column_corr(x, y):
+    """Pearson correlation of matching columns of x and y; NaN where either is constant"""
+    xc = x - x.mean(axis=0)
+    yc = y - y.mean(axis=0)
+    denom = np.sqrt((xc ** 2).sum(axis=0) * (yc ** 2).sum(axis=0))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(denom > 0, (xc * yc).sum(axis=0) / denom, np.nan)
+
+
+def _reliability(items):
+    """k/(k-1) * (1 - sum of item variances / total variance); KR-20 when items are 0/1"""
+    k = items.shape[1]
+    if k < 2 or items.shape[0] < 2:
+        return np.nan
+    total_var = items.sum(axis=1).var()
+    if total_var <= 0:
+        return np.nan
+    return (k / (k - 1)) * (1 - items.var(axis=0).sum() / total_var)
+
+
+def compute_psychometrics(scores, max_points, choices=None, n_choices=0):
+    """
+    Compute item and test statistics for an attempts x items score matrix
+
+    Args:
+        scores: (attempts, items) array of points earned
+        max_points: (items,) array of points possible
+        choices: optional (attempts, items) array of selected choice positions (-1 = none)
+        n_choices: width of the distractor tables (max choices per item)
+
+    Returns:
+        Dict of NumPy arrays (per item) and floats (per test)
+    """
+    scores = np.asarray(scores, dtype=float)
+    max_points = np.asarray(max_points, dtype=float)
+    n_attempts, n_items = scores.shape
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        # Item scores as a 0-1 fraction of the points possible
+        norm = np.where(max_points > 0, scores / max_points, 0.0)
+    correct = (norm >= 1.0).astype(float)
+    totals = scores.sum(axis=1)
+
+    # Upper and lower 27% groups by total score
+    group = max(1, int(round(GROUP_FRACTION * n_attempts))) if n_attempts else 0
+    ranked = np.argsort(totals, kind='stable')
+    lower, upper = ranked[:group], ranked[n_attempts - group:]
+
+    if group:
+        upper_mean = norm[upper].mean(axis=0)
+        lower_mean = norm[lower].mean(axis=0)
+    else:
+        upper_mean = lower_mean = np.full(n_items, np.nan)
+
+    result = {
+        'n_attempts': n_attempts,
+        'n_items': n_items,
+        'group_size': group,
+        'difficulty': norm.mean(axis=0) if n_attempts else np.full(n_items, np.nan),
+        'upper_mean': upper_mean,
+        'lower_mean': lower_mean,
+        'discrimination': upper_mean - lower_mean,
+        # Corrected (item-rest) correlation so an item is not correlated with itself
+        'point_biserial': _column_corr(norm, totals[:, None] - scores),
+        'kr20': _reliability(correct),
+        'cronbach_alpha': _reliability(scores),
+        'mean_score': totals.mean() if n_attempts else np.nan,
+        'std_score': totals.std() if n_attempts else np.nan,
+    }
+
+    if choices is not None and n_choices and group:
+        # Count selections per (item, choice) for each group with one bincount
+        offsets = np.arange(n_items) * n_choices
+
+        def tally(rows):
+            picked = choices[rows]
+            flat = (picked + offsets)[picked >= 0]
+            return np.bincount(flat, minlength=n_items * n_choices).reshape(n_items, n_choices)
+
+        result['upper_choice_counts'] = tally(upper)
+        result['lower_choice_counts'] = tally(lower)
+        result['choice_counts'] = tally(slice(None))
+    return result
+
+
+def _num(value, digits=4):
+    value = float(value)
+    return None if np.isnan(value) else round(value, digits)
+
+
+def quiz_psychometrics(quiz):
+    """Return the psychometrics endpoint payload for a quiz"""
+    matrix = build_score_matrix(quiz)
+    stats = compute_psychometrics(matrix.scores, matrix.max_points, matrix.choices, matrix.n_choices)
+    group = stats['group_size']
+
+    items = []
+    for i, question in enumerate(matrix.questions):
+        item = {
+            'question_id': question['id'],
+            'question_text': question['question_text'],
+            'question_type': question['question_type'],
+            'order': question['order'],
+            'points': question['points'],
+            'difficulty': _num(stats['difficulty'][i]),
+            'discrimination_index': _num(stats['discrimination'][i]),
+            'point_biserial': _num(stats['point_biserial'][i]),
+            'upper_group_mean': _num(stats['upper_mean'][i]),
+            'lower_group_mean': _num(stats['lower_mean'][i]),
+            'distractors': [],
+        }
+        if question['question_type'] in OBJECTIVE_TYPES and 'choice_counts' in stats:
+            for c, choice in enumerate(question['choices']):
+                upper_count = int(stats['upper_choice_counts'][i, c])
+                lower_count = int(stats['lower_choice_counts'][i, c])
+                item['distractors'].append({
+                    'choice_id': choice['id'],
+                    'choice_text': choice['choice_text'],
+                    'is_correct': choice['is_correct'],
+                    'count': int(stats['choice_counts'][i, c]),
+                    'upper_count': upper_count,
+                    'lower_count': lower_count,
+                    'upper_percentage': round(upper_count / group * 100, 2),
+                    'lower_percentage': round(lower_count / group * 100, 2),
+                })
+        items.append(item)
+
+    return {
+        'quiz_id': quiz.id,
+        'quiz_title': quiz.title,
+        'total_attempts': stats['n_attempts'],
+        'total_questions': stats['n_items'],
+        'group_size': group,
+        'kr20': _num(stats['kr20']),
+        'cronbach_alpha': _num(stats['cronbach_alpha']),
+        'mean_score': _num(stats['mean_score'], 2),
+        'std_score': _num(stats['std_score'], 2),
+        'items': items,
+    }
+
+
+def synthetic_scores(n_attempts, n_items, n_choices=4, seed=0):
+    """Random 1-parameter-logistic responses for benchmarks and tests"""
+    rng = np.random.default_rng(seed)
+    ability = rng.normal(size=(n_attempts, 1))
+    item_difficulty = rng.normal(size=(1, n_items))
+    p_correct = 1 / (1 + np.exp(-(ability - item_difficulty)))
+    correct = rng.random((n_attempts, n_items)) < p_correct
+    # Choice 0 is the key; wrong answers pick one of the distractors
+    choices = np.where(correct, 0, rng.integers(1, n_choices, size=(n_attempts, n_items)))
+    return correct.astype(float), np.ones(n_items), choices
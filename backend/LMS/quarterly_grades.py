@@ -0,0 +1,203 @@
+"""
+Quarterly Grade Computation
+Rebuilds QuarterlyGrade component totals from the QuizBestScore projection.
+
+Writers call mark_quarterly_dirty() instead of recomputing straight away.
+Dirty (student, offering, quarter, grade_type) keys are deduplicated and
+recomputed once per request (LMS.middleware.QuarterlyRecalcMiddleware), once per batch
+(coalesce_quarterly_recalc) or when the surrounding transaction commits.
+"""
+
+import contextvars
+import threading
+from contextlib import asynccontextmanager, contextmanager
+
+from asgiref.sync import sync_to_async
+from django.db import transaction
+from django.db.models import Sum
+
+from .best_scores import refresh_best_score
+from .models import Quiz, QuizAttempt, QuizBestScore, QuarterlyGrade
+
+
+COMPONENT_FIELDS = {
+    "WRITTEN_WORK": ("written_work_score", "written_work_total"),
+    "PERFORMANCE_TASK": ("performance_task_score", "performance_task_total"),
+    "QUARTERLY_EXAM": ("quarterly_assessment_score", "quarterly_assessment_total"),
+}
+
+_state = threading.local()
+# The open coalesce scope's key set; a context variable so it follows
+# sync_to_async() into the thread a sync view runs on under ASGI
+_batch = contextvars.ContextVar("quarterly_batch", default=None)
+
+
+def _component_totals(student_id, offering_id, quarter, grade_type):
+    """Best score per quiz summed over the quarter, and the quizzes' total points"""
+    quizzes = Quiz.objects.filter(
+        SubjectOffering_id=offering_id,
+        quarter=quarter,
+        grade_type=grade_type,
+    )
+
+    # ✅ best score per quiz comes from the QuizBestScore projection
+    total_score = QuizBestScore.objects.filter(
+        student_id=student_id,
+        quiz__in=quizzes,
+    ).aggregate(s=Sum("best_score"))["s"] or 0.0
+
+    # ✅ total_points counted once per quiz (not per attempt)
+    total_points = quizzes.aggregate(s=Sum("total_points"))["s"] or 0.0
+    return float(total_score), float(total_points)
+
+
+def recompute_quarterly_grades(keys):
+    """
+    Recompute QuarterlyGrade components for many dirty keys
+
+    Keys are deduplicated and grouped per (student, offering, quarter) so
+    each QuarterlyGrade row is loaded and saved once even when several of
+    its components changed.
+
+    Args:
+        keys: Iterable of (student_id, offering_id, quarter, grade_type)
+
+    Returns:
+        int: number of QuarterlyGrade rows saved
+    """
+    groups = {}
+    for student_id, offering_id, quarter, grade_type in set(keys):
+        groups.setdefault((student_id, offering_id, quarter), set()).add(grade_type)
+
+    for (student_id, offering_id, quarter), grade_types in groups.items():
+        grade, _ = QuarterlyGrade.objects.get_or_create(
+            student_id=student_id,
+            SubjectOffering_id=offering_id,
+            quarter=quarter,
+            defaults={}
+        )
+        for grade_type in grade_types:
+            if grade_type not in COMPONENT_FIELDS:
+                continue
+            score_field, total_field = COMPONENT_FIELDS[grade_type]
+            score, total = _component_totals(student_id, offering_id, quarter, grade_type)
+            setattr(grade, score_field, score)
+            setattr(grade, total_field, total)
+        grade.save()
+    return len(groups)
+
+
+def recalc_quarterly_component(*, student, offering, quarter, grade_type):
+    """
+    Recompute QuarterlyGrade component totals based on BEST attempt per quiz for the quarter.
+    Prevents adding totals when multiple attempts exist.
+    """
+    recompute_quarterly_grades([(student.id, offering.id, quarter, grade_type)])
+
+
+def _flush_pending_on_commit():
+    keys = getattr(_state, "on_commit", None)
+    _state.on_commit = set()
+    if keys:
+        recompute_quarterly_grades(keys)
+
+
+def mark_quarterly_dirty(*, student_id, offering_id, quarter, grade_type):
+    """
+    Record that a student's quarterly component needs recomputing
+
+    Inside coalesce_quarterly_recalc() the key is queued for the end of the
+    batch; inside a transaction it is recomputed once after commit;
+    otherwise it is recomputed immediately.
+    """
+    key = (student_id, offering_id, quarter, grade_type)
+
+    batch = _batch.get()
+    if batch is not None:
+        batch.add(key)
+        return
+
+    if transaction.get_connection().in_atomic_block:
+        if getattr(_state, "on_commit", None) is None:
+            _state.on_commit = set()
+        _state.on_commit.add(key)
+        # The first callback to run flushes every pending key; the rest no-op
+        transaction.on_commit(_flush_pending_on_commit)
+        return
+
+    recompute_quarterly_grades([key])
+
+
+def mark_attempt_dirty(attempt):
+    """Refresh the attempt's best-score row now and queue its quarterly component"""
+    refresh_best_score(attempt.student_id, attempt.quiz_id)
+    quiz = attempt.quiz
+    mark_quarterly_dirty(
+        student_id=attempt.student_id,
+        offering_id=quiz.SubjectOffering_id,
+        quarter=quiz.quarter,
+        grade_type=quiz.grade_type,
+    )
+
+
+def mark_quiz_total_dirty(quiz):
+    """Queue every student's component that sums the quiz's total_points (after it changed)"""
+    student_ids = (
+        QuizAttempt.objects
+        .filter(
+            quiz__SubjectOffering_id=quiz.SubjectOffering_id,
+            quiz__quarter=quiz.quarter,
+            quiz__grade_type=quiz.grade_type,
+            status__in=QuizAttempt.COUNTED_STATUSES,
+        )
+        .values_list("student_id", flat=True)
+        .distinct()
+    )
+    with coalesce_quarterly_recalc():
+        for student_id in student_ids:
+            mark_quarterly_dirty(
+                student_id=student_id,
+                offering_id=quiz.SubjectOffering_id,
+                quarter=quiz.quarter,
+                grade_type=quiz.grade_type,
+            )
+
+
+@contextmanager
+def coalesce_quarterly_recalc():
+    """
+    Defer every mark_quarterly_dirty() in the block to one deduplicated flush
+
+    Keys are flushed only when the block exits normally: a block that raised
+    is expected to have rolled its writes back.
+    """
+    if _batch.get() is not None:
+        # Nested: the outermost scope flushes
+        yield _batch.get()
+        return
+
+    keys = set()
+    token = _batch.set(keys)
+    try:
+        yield keys
+    finally:
+        _batch.reset(token)
+    if keys:
+        recompute_quarterly_grades(keys)
+
+
+@asynccontextmanager
+async def acoalesce_quarterly_recalc():
+    """coalesce_quarterly_recalc() for async code; the flush runs in a worker thread"""
+    if _batch.get() is not None:
+        yield _batch.get()
+        return
+
+    keys = set()
+    token = _batch.set(keys)
+    try:
+        yield keys
+    finally:
+        _batch.reset(token)
+    if keys:
+        await sync_to_async(recompute_quarterly_grades)(keys)
@@ -0,0 +1,224 @@
+"""
+Quiz Answer-Key Cache
+Keeps each quiz's questions, points and choice keys in memory, keyed by quiz
+id plus Quiz.answer_key_version so edits to the questions invalidate it.
+Also holds the pre-rendered student payload returned by start_quiz.
+"""
+
+import json
+import random
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models import F
+
+from rest_framework.utils.encoders import JSONEncoder
+
+from .cache_utils import LRUCache
+from .models import Quiz, QuizQuestion
+
+
+_answer_keys = LRUCache(maxsize=getattr(settings, 'QUIZ_ANSWER_KEY_CACHE_SIZE', 500))
+_start_payloads = LRUCache(maxsize=getattr(settings, 'QUIZ_START_PAYLOAD_CACHE_SIZE', 200))
+
+
+class QuizAnswerKey:
+    """Immutable snapshot of a quiz's questions and correct choices"""
+
+    def __init__(self, quiz_id, version, questions):
+        self.quiz_id = quiz_id
+        self.version = version
+        self.questions = questions
+        self.by_id = {q['id']: q for q in questions}
+        self.choice_keys = {
+            q['id']: {c['id']: c['is_correct'] for c in q['choices']}
+            for q in questions
+        }
+
+    def get(self, question_id):
+        return self.by_id.get(question_id)
+
+    def correct_choice_ids(self, question_id):
+        return [cid for cid, ok in self.choice_keys.get(question_id, {}).items() if ok]
+
+    def public_questions(self):
+        """Questions in the same shape QuizQuestionSerializer returns (no is_correct)"""
+        return [
+            {
+                'id': q['id'],
+                'question_text': q['question_text'],
+                'question_type': q['question_type'],
+                'points': q['points'],
+                'order': q['order'],
+                'choices': [
+                    {'id': c['id'], 'choice_text': c['choice_text'], 'order': c['order']}
+                    for c in q['choices']
+                ],
+            }
+            for q in self.questions
+        ]
+
+
+def _shared_cache():
+    alias = getattr(settings, 'QUIZ_CACHE_ALIAS', None)
+    return caches[alias] if alias else None
+
+
+def _shared_key(quiz_id, version):
+    return f"quiz-answer-key:{quiz_id}:{version}"
+
+
+def _load_questions(quiz_id):
+    """Read all questions and their choices for a quiz in a single query"""
+    rows = (
+        QuizQuestion.objects
+        .filter(quiz_id=quiz_id)
+        .order_by('order', 'id', 'choices__id')
+        .values(
+            'id', 'question_text', 'question_type', 'points', 'order',
+            'choices__id', 'choices__choice_text', 'choices__order', 'choices__is_correct',
+        )
+    )
+
+    questions = {}
+    for row in rows:
+        question = questions.get(row['id'])
+        if question is None:
+            question = questions[row['id']] = {
+                'id': row['id'],
+                'question_text': row['question_text'],
+                'question_type': row['question_type'],
+                'points': float(row['points'] or 0),
+                'order': row['order'],
+                'choices': [],
+            }
+        if row['choices__id'] is not None:
+            question['choices'].append({
+                'id': row['choices__id'],
+                'choice_text': row['choices__choice_text'],
+                'order': row['choices__order'],
+                'is_correct': row['choices__is_correct'],
+            })
+    return list(questions.values())
+
+
+def get_answer_key(quiz):
+    """Return the cached QuizAnswerKey for the quiz's current version"""
+    key = (quiz.id, quiz.answer_key_version)
+    answer_key = _answer_keys.get(key)
+    if answer_key is not None:
+        return answer_key
+
+    shared = _shared_cache()
+    questions = shared.get(_shared_key(*key)) if shared else None
+    if questions is None:
+        questions = _load_questions(quiz.id)
+        if shared:
+            shared.set(_shared_key(*key), questions)
+
+    answer_key = QuizAnswerKey(quiz.id, quiz.answer_key_version, questions)
+    _answer_keys.set(key, answer_key)
+    return answer_key
+
+
+def _dumps(value):
+    """Encode JSON exactly like DRF's default JSONRenderer (compact, UTF-8)"""
+    return json.dumps(value, cls=JSONEncoder, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+# StudentQuizSerializer fields that depend on the current time
+TIME_FLAGS = ('is_open', 'is_upcoming', 'is_closed')
+
+
+class StartQuizPayload:
+    """
+    Student-facing start_quiz body rendered once per quiz version
+
+    The quiz object and every question are stored as ready-to-send JSON
+    fragments; render() only splices in the attempt fields, the quiz's
+    open/upcoming/closed flags as of now, and joins the question fragments,
+    in a per-attempt shuffled order when the quiz asks for it.
+    """
+
+    def __init__(self, quiz_id, shuffle, window, quiz_json, question_fragments):
+        self.quiz_id = quiz_id
+        self.shuffle = shuffle
+        # (open_time, close_time)
+        self.window = window
+        # Serialized quiz before and after the TIME_FLAGS
+        self.quiz_head, self.quiz_tail = quiz_json
+        self.question_fragments = question_fragments
+
+    def question_order(self, attempt):
+        order = list(range(len(self.question_fragments)))
+        if self.shuffle:
+            random.Random(f"{self.quiz_id}:{attempt.id}").shuffle(order)
+        return order
+
+    def time_flags(self):
+        quiz = Quiz(open_time=self.window[0], close_time=self.window[1])
+        return {'is_open': quiz.is_open(), 'is_upcoming': quiz.is_upcoming(), 'is_closed': quiz.is_closed()}
+
+    def render(self, attempt, extra=None):
+        head = {'attempt_id': attempt.id, 'started_at': attempt.started_at}
+        if extra:
+            head.update(extra)
+        questions = b','.join(self.question_fragments[i] for i in self.question_order(attempt))
+        return b''.join([
+            _dumps(head)[:-1],
+            b',"quiz":', self.quiz_head, b',', _dumps(self.time_flags())[1:-1], b',', self.quiz_tail,
+            b',"questions":[', questions, b']}',
+        ])
+
+
+def _split_quiz(data):
+    """The serialized quiz as JSON fragments before and after its TIME_FLAGS"""
+    fields = list(data)
+    start = fields.index(TIME_FLAGS[0])
+    head = {f: data[f] for f in fields[:start]}
+    tail = {f: data[f] for f in fields[start + len(TIME_FLAGS):]}
+    return _dumps(head)[:-1], _dumps(tail)[1:]
+
+
+def _payload_key(quiz):
+    updated = quiz.updated_at.isoformat() if quiz.updated_at else ''
+    return (quiz.id, quiz.answer_key_version, updated)
+
+
+def get_start_payload(quiz):
+    """Return the pre-rendered StartQuizPayload for the quiz's current version"""
+    # Imported lazily: serializers import this module for version bumps
+    from .serializers import StudentQuizSerializer
+
+    key = _payload_key(quiz)
+    payload = _start_payloads.get(key)
+    if payload is not None:
+        return payload
+
+    shared = _shared_cache()
+    shared_key = "quiz-start-payload:%s:%s:%s" % key
+    parts = shared.get(shared_key) if shared else None
+    if parts is None:
+        parts = (
+            (quiz.open_time, quiz.close_time),
+            _split_quiz(StudentQuizSerializer(quiz).data),
+            [_dumps(q) for q in get_answer_key(quiz).public_questions()],
+        )
+        if shared:
+            shared.set(shared_key, parts)
+
+    payload = StartQuizPayload(quiz.id, quiz.shuffle_questions, *parts)
+    _start_payloads.set(key, payload)
+    return payload
+
+
+def bump_answer_key_version(quiz_id):
+    """Invalidate cached answer keys and payloads after a quiz's questions or choices change"""
+    Quiz.objects.filter(id=quiz_id).update(answer_key_version=F('answer_key_version') + 1)
+    _answer_keys.delete_where(lambda key: key[0] == quiz_id)
+    _start_payloads.delete_where(lambda key: key[0] == quiz_id)
+
+
+def clear_answer_key_cache():
+    _answer_keys.clear()
+    _start_payloads.clear()
@@ -0,0 +1,277 @@
+"""
+Quiz Grading Engine
+Scores a whole quiz submission in memory and writes all answers in bulk
+"""
+
+from django.db import transaction
+from django.db.models import Sum
+from django.utils import timezone
+
+from .item_stats import record_answers, record_regrades, snapshot
+from .models import QuizAnswer, QuizAttempt
+from .quarterly_grades import coalesce_quarterly_recalc, mark_attempt_dirty
+from .quiz_cache import get_answer_key
+
+
+OBJECTIVE_TYPES = ('MULTIPLE_CHOICE', 'TRUE_FALSE')
+
+ANSWER_UPDATE_FIELDS = [
+    'text_answer', 'answer_file', 'selected_choice', 'is_correct', 'points_earned',
+]
+
+MANUAL_GRADE_FIELDS = [
+    'points_earned', 'teacher_feedback', 'manually_graded', 'graded_by', 'graded_at',
+]
+
+
+DRAFT_FIELDS = ('selected_choice_id', 'text_answer')
+
+
+def _to_int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def apply_draft_deltas(draft, deltas, answer_key):
+    """
+    Merge autosave deltas into an attempt's draft blob
+
+    Only fields present in a delta are overwritten, so a client can send just
+    the text or just the selected choice. Unknown questions are dropped, and
+    a null text answer (the student cleared the field) is stored as ''.
+
+    Returns:
+        Tuple of (new draft dict, number of answers saved)
+    """
+    draft = dict(draft or {})
+    saved = 0
+    for delta in deltas:
+        qid = _to_int(delta.get('question_id'))
+        if answer_key.get(qid) is None:
+            continue
+        entry = dict(draft.get(str(qid), {'question_id': qid}))
+        for field in DRAFT_FIELDS:
+            if field in delta:
+                entry[field] = delta[field]
+        if entry.get('text_answer', '') is None:
+            entry['text_answer'] = ''
+        draft[str(qid)] = entry
+        saved += 1
+    return draft, saved
+
+
+def merge_draft_answers(draft, answers_data):
+    """
+    Combine autosaved answers with the final submit payload
+
+    Payload entries win over the draft for the same question. Without a
+    draft the payload is returned untouched.
+    """
+    if not draft:
+        return answers_data
+
+    merged = {key: dict(entry) for key, entry in draft.items()}
+    for answer_data in answers_data:
+        key = str(_to_int(answer_data.get('question_id')))
+        merged[key] = {**merged.get(key, {}), **answer_data}
+    return list(merged.values())
+
+
+class QuizGradingEngine:
+    """Grades submissions for one quiz against its answer key"""
+
+    def __init__(self, quiz):
+        self.quiz = quiz
+        self.answer_key = get_answer_key(quiz)
+        # Every QuizAnswer of the last graded attempt, after grading
+        self.answers = []
+
+    def grade(self, attempt, answers_data, files=None):
+        """
+        Score a submission and persist its QuizAnswer rows
+
+        The payload is processed in order with the same rules the per-answer
+        loop in submit_quiz used, so totals are identical. Query count does not
+        depend on the number of questions: one read for existing answers, one
+        bulk insert and one bulk update (plus one answer-key read on a cache miss).
+
+        Args:
+            attempt: QuizAttempt being submitted
+            answers_data: List of dicts with question_id, selected_choice_id, text_answer
+            files: Optional mapping of upload field name -> uploaded file
+
+        Returns:
+            float: total score for the attempt
+        """
+        files = files or {}
+        existing = {a.question_id: a for a in QuizAnswer.objects.filter(attempt=attempt)}
+        touched = {}
+        total_score = 0.0
+
+        for answer_data in answers_data:
+            question_id = answer_data.get('question_id')
+            selected_choice_id = answer_data.get('selected_choice_id')
+            # QuizAnswer.text_answer is NOT NULL; drafts saved before null was coerced may hold None
+            text_answer = answer_data.get('text_answer') or ''
+
+            qid = _to_int(question_id)
+            question = self.answer_key.get(qid)
+            if question is None:
+                continue
+            choice_key = self.answer_key.choice_keys[qid]
+
+            answer = touched.get(qid) or existing.get(qid)
+            if answer is None:
+                answer = QuizAnswer(attempt=attempt, question_id=qid, text_answer=text_answer)
+            else:
+                answer.text_answer = text_answer
+            touched[qid] = answer
+
+            # file upload
+            file_key = f'answer_file_{question_id}'
+            if file_key in files:
+                answer.answer_file = files[file_key]
+
+            # Grade objective questions
+            if question['question_type'] in OBJECTIVE_TYPES and selected_choice_id:
+                cid = _to_int(selected_choice_id)
+                if cid in choice_key:
+                    is_correct = choice_key[cid]
+                    answer.selected_choice_id = cid
+                    answer.is_correct = is_correct
+                    answer.points_earned = question['points'] if is_correct else 0.0
+                else:
+                    answer.points_earned = 0.0
+            else:
+                # subjective items default 0 until teacher grades
+                if answer.points_earned is None:
+                    answer.points_earned = 0.0
+
+            total_score += float(answer.points_earned or 0.0)
+
+        to_create = [a for a in touched.values() if a.pk is None]
+        to_update = [a for a in touched.values() if a.pk is not None]
+
+        with transaction.atomic():
+            for answer in touched.values():
+                upload = answer.answer_file
+                if upload and not upload._committed:
+                    upload.save(upload.name, upload.file, save=False)
+            if to_create:
+                QuizAnswer.objects.bulk_create(to_create)
+            if to_update:
+                QuizAnswer.objects.bulk_update(to_update, ANSWER_UPDATE_FIELDS)
+
+        self.answers = list({**existing, **touched}.values())
+        return float(total_score)
+
+
+def finalize_attempt(attempt, answers_data, files=None, submitted_at=None):
+    """
+    Grade an attempt and mark it SUBMITTED
+
+    Shared by the synchronous submit_quiz path and the queued submission
+    workers. Autosaved draft answers are merged with answers_data first.
+    Idempotent: an attempt that is already SUBMITTED/GRADED (e.g. finalized
+    by another worker) is left alone and keeps its score.
+
+    Returns:
+        float: total score for the attempt
+    """
+    quiz = attempt.quiz
+    with transaction.atomic():
+        # Lock the attempt row (not the quiz) so an autosave racing with the
+        # submit either lands first and is merged, or waits and finds it submitted
+        locked = (
+            QuizAttempt.objects.select_for_update(of=('self',))
+            .only('draft_answers', 'status', 'score', 'submitted_at')
+            .get(pk=attempt.pk)
+        )
+        if locked.status in QuizAttempt.COUNTED_STATUSES:
+            attempt.status, attempt.score, attempt.submitted_at = locked.status, locked.score, locked.submitted_at
+            return float(locked.score or 0.0)
+        answers_data = merge_draft_answers(locked.draft_answers, answers_data)
+
+        # Grade the whole payload in memory and write answers in bulk
+        engine = QuizGradingEngine(quiz)
+        total_score = engine.grade(attempt, answers_data, files)
+
+        # Update attempt
+        attempt.submitted_at = submitted_at or timezone.now()
+        attempt.score = float(total_score)
+        attempt.status = 'SUBMITTED'
+        attempt.draft_answers = {}
+        attempt.save(update_fields=['submitted_at', 'score', 'status', 'draft_answers'])
+
+        # The attempt now counts towards the item statistics (committed with it)
+        record_answers(engine.answers)
+
+    # ✅ IMPORTANT: do NOT += to QuarterlyGrade here.
+    # ✅ Recompute/overwrite using BEST attempt per quiz (coalesced per request/batch).
+    mark_attempt_dirty(attempt)
+    return total_score
+
+
+def apply_manual_grades(answers, grades, graded_by):
+    """
+    Save many teacher grades at once
+
+    Answers are bulk-updated, every affected attempt is re-totalled with one
+    grouped query and marked GRADED, the item statistics are corrected, and
+    each attempt's best score and quarterly component is refreshed once.
+
+    Args:
+        answers: QuizAnswer objects (with attempt__quiz loaded) already checked for ownership
+        grades: Dict of answer id -> {'points_earned': float, 'feedback': str}
+        graded_by: Teacher User doing the grading
+
+    Returns:
+        Dict of attempt id -> new total score
+    """
+    now = timezone.now()
+    attempts = {answer.attempt_id: answer.attempt for answer in answers}
+    was_counted = {attempt_id: a.status in QuizAttempt.COUNTED_STATUSES for attempt_id, a in attempts.items()}
+    before = {answer.id: snapshot(answer) for answer in answers}
+
+    for answer in answers:
+        grade = grades[answer.id]
+        answer.points_earned = float(grade['points_earned'])
+        answer.teacher_feedback = grade.get('feedback', '')
+        answer.manually_graded = True
+        answer.graded_by = graded_by
+        answer.graded_at = now
+
+    with coalesce_quarterly_recalc(), transaction.atomic():
+        QuizAnswer.objects.bulk_update(answers, MANUAL_GRADE_FIELDS)
+
+        totals = dict(
+            QuizAnswer.objects
+            .filter(attempt_id__in=attempts)
+            .values('attempt_id')
+            .annotate(total=Sum('points_earned'))
+            .values_list('attempt_id', 'total')
+        )
+        for attempt_id, attempt in attempts.items():
+            attempt.score = float(totals.get(attempt_id) or 0)
+            attempt.status = 'GRADED'
+        QuizAttempt.objects.bulk_update(list(attempts.values()), ['score', 'status'])
+
+        # Item statistics: adjust already counted answers; attempts that only
+        # now become GRADED are counted in full
+        record_regrades((before[a.id], a) for a in answers if was_counted[a.attempt_id])
+        newly_counted = [attempt_id for attempt_id, counted in was_counted.items() if not counted]
+        if newly_counted:
+            record_answers(QuizAnswer.objects.filter(attempt_id__in=newly_counted))
+
+        # One best-score refresh per (student, quiz); the quarterly keys are
+        # deduplicated by the coalesce scope
+        seen = set()
+        for attempt in attempts.values():
+            pair = (attempt.student_id, attempt.quiz_id)
+            if pair not in seen:
+                seen.add(pair)
+                mark_attempt_dirty(attempt)
+
+    return {attempt_id: attempt.score for attempt_id, attempt in attempts.items()}
@@ -237,11 +237,14 @@ class SubjectOfferingSerializer(serializers.ModelSerializer):
     def get_students(self, obj):
         return obj.section.students.count()
     def get_average(self, obj):
-        qs = QuarterlyGrade.objects.filter(
-        SubjectOffering=obj,
-        final_grade__isnull=False
-    )
-        avg = qs.aggregate(a=Avg("final_grade"))["a"]
+        # SubjectOfferingViewSet annotates the average; fall back to a query otherwise
+        if hasattr(obj, "average_final_grade"):
+            avg = obj.average_final_grade
+        else:
+            avg = QuarterlyGrade.objects.filter(
+                SubjectOffering=obj,
+                final_grade__isnull=False
+            ).aggregate(a=Avg("final_grade"))["a"]
         return round(avg, 2) if avg is not None else None
     def get_pendingTasks(self, obj):
         # pending quizzes = all quizzes not CLOSED
@@ -640,13 +643,41 @@ class QuizAttemptSerializer(serializers.ModelSerializer):
 
 
 class QuizSubmissionSerializer(serializers.Serializer):
+    # Optional: answers already autosaved on the attempt are finalized as-is
     answers = serializers.ListField(
         child=serializers.DictField(
             child=serializers.CharField()
-        )
+        ),
+        required=False,
+        default=list
+    )
+
+
+class QuizAutosaveSerializer(serializers.Serializer):
+    answers = serializers.ListField(
+        child=serializers.DictField(
+            child=serializers.CharField(allow_blank=True, allow_null=True)
+        ),
+        allow_empty=False
     )
 
 
+class AnswerGradeSerializer(serializers.Serializer):
+    answer_id = serializers.IntegerField()
+    points_earned = serializers.FloatField()
+    feedback = serializers.CharField(allow_blank=True, required=False, default='')
+
+
+class BatchAnswerGradeSerializer(serializers.Serializer):
+    grades = AnswerGradeSerializer(many=True, allow_empty=False)
+
+    def validate_grades(self, value):
+        ids = [g['answer_id'] for g in value]
+        if len(ids) != len(set(ids)):
+            raise serializers.ValidationError("Each answer_id may appear only once")
+        return value
+
+
 # Grade Forecasting Serializers
 class QuizTopicPerformanceSerializer(serializers.ModelSerializer):
     topic_name = serializers.CharField(source='topic', read_only=True)
@@ -0,0 +1,184 @@
+"""
+Queued Quiz Submissions
+Database-backed queue that lets submit_quiz return 202 immediately while
+grading workers (manage.py process_quiz_submissions) finalize attempts in batches
+"""
+
+import uuid
+from datetime import timedelta
+
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import QuizAttempt, QuizSubmission, queued_submission_file_path
+from .quarterly_grades import coalesce_quarterly_recalc
+from .quiz_grading import DRAFT_FIELDS, finalize_attempt
+
+
+class AttemptNotInProgress(Exception):
+    """The attempt was submitted or queued by a concurrent request"""
+
+
+def enqueue_submission(attempt, answers_data, files=None):
+    """
+    Durably record a submit payload and mark the attempt QUEUED
+
+    Uploaded files are written to storage right away so the worker only
+    needs their stored names; they are deleted again if the enqueue fails.
+    A resubmit after a FAILED submission reuses that row.
+
+    Returns:
+        QuizSubmission
+
+    Raises:
+        AttemptNotInProgress: the attempt is no longer IN_PROGRESS
+    """
+    stored_files = {}
+    try:
+        for file_key, upload in (files or {}).items():
+            name = queued_submission_file_path(attempt.id, file_key, upload.name)
+            stored_files[file_key] = default_storage.save(name, upload)
+
+        with transaction.atomic():
+            # Concurrent submits queue behind this lock and then find the attempt QUEUED
+            if not QuizAttempt.objects.select_for_update().filter(pk=attempt.pk, status='IN_PROGRESS').exists():
+                raise AttemptNotInProgress(f"attempt {attempt.pk} is no longer in progress")
+            submission, _ = QuizSubmission.objects.update_or_create(
+                attempt=attempt,
+                defaults={
+                    'receipt': uuid.uuid4(),
+                    'answers': list(answers_data),
+                    'files': stored_files,
+                    'status': 'PENDING',
+                    'tries': 0,
+                    'error': '',
+                    'claimed_at': None,
+                    'processed_at': None,
+                },
+            )
+            attempt.status = 'QUEUED'
+            attempt.submitted_at = timezone.now()
+            attempt.save(update_fields=['status', 'submitted_at'])
+    except Exception:
+        _delete_files(stored_files)
+        raise
+    return submission
+
+
+def _delete_files(stored_files):
+    for name in stored_files.values():
+        default_storage.delete(name)
+
+
+def claim_batch(batch_size=50, stale_after=timedelta(minutes=10)):
+    """
+    Claim up to batch_size pending submissions for this worker
+
+    Rows are locked with SKIP LOCKED where the database supports it so
+    several workers can drain the queue side by side. Submissions stuck in
+    PROCESSING longer than stale_after (a worker died) are claimed again;
+    claimed_at is the claim token, so a slow first worker cannot commit
+    after that (see process_submission).
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        ids = list(
+            QuizSubmission.objects
+            .select_for_update(skip_locked=True)
+            .filter(Q(status='PENDING') | Q(status='PROCESSING', claimed_at__lt=now - stale_after))
+            .order_by('created_at')
+            .values_list('id', flat=True)[:batch_size]
+        )
+        QuizSubmission.objects.filter(id__in=ids).update(
+            status='PROCESSING', claimed_at=now, tries=F('tries') + 1,
+        )
+    return list(
+        QuizSubmission.objects
+        .filter(id__in=ids)
+        .select_related('attempt__quiz__SubjectOffering', 'attempt__student')
+        .order_by('created_at')
+    )
+
+
+class ClaimLost(Exception):
+    """The submission was reclaimed by another worker (or finished) meanwhile"""
+
+
+def _release_attempt(submission):
+    """
+    Give a permanently failed submission back to the student
+
+    The attempt returns to IN_PROGRESS with the submitted answers as its
+    draft, so the student can submit again, even after the quiz has closed
+    (see submit_quiz); quiz_attempt_status reports the error. Queued uploads
+    are dropped (drafts hold no files).
+    """
+    attempt = submission.attempt
+    draft = dict(attempt.draft_answers or {})
+    for answer in submission.answers:
+        draft[str(answer.get('question_id'))] = {
+            'question_id': answer.get('question_id'),
+            **{field: answer[field] for field in DRAFT_FIELDS if field in answer},
+        }
+    with transaction.atomic():
+        updated = QuizAttempt.objects.filter(pk=attempt.pk, status='QUEUED').update(
+            status='IN_PROGRESS', submitted_at=None, draft_answers=draft,
+        )
+    if updated:
+        _delete_files(submission.files)
+
+
+def process_submission(submission, max_tries=3):
+    """Grade one claimed submission. Returns True on success."""
+    attempt = submission.attempt
+    try:
+        with transaction.atomic():
+            # Fence: only the worker holding the current claim may commit
+            if not QuizSubmission.objects.select_for_update().filter(
+                pk=submission.pk, status='PROCESSING', claimed_at=submission.claimed_at,
+            ).exists():
+                raise ClaimLost(f"submission {submission.receipt} was reclaimed")
+            finalize_attempt(
+                attempt,
+                submission.answers,
+                submission.files,
+                submitted_at=attempt.submitted_at,
+            )
+            submission.status = 'DONE'
+            submission.error = ''
+            submission.processed_at = timezone.now()
+            submission.save(update_fields=['status', 'error', 'processed_at'])
+        return True
+    except ClaimLost:
+        # The current claim holder reports the outcome
+        return False
+    except Exception as e:
+        submission.status = 'FAILED' if submission.tries >= max_tries else 'PENDING'
+        submission.error = str(e)
+        # Conditional on the claim too, so a reclaimed row is not overwritten
+        QuizSubmission.objects.filter(pk=submission.pk, claimed_at=submission.claimed_at).update(
+            status=submission.status, error=submission.error,
+        )
+        if submission.status == 'FAILED':
+            _release_attempt(submission)
+        return False
+
+
+def process_batch(batch_size=50, max_tries=3):
+    """
+    Claim and grade one batch
+
+    Returns:
+        Tuple of (processed, failed) counts
+    """
+    processed = failed = 0
+    # Quarterly grades touched by the batch are recomputed once at the end
+    with coalesce_quarterly_recalc():
+        for submission in claim_batch(batch_size):
+            if process_submission(submission, max_tries=max_tries):
+                processed += 1
+            else:
+                failed += 1
+    return processed, failed
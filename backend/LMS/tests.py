@@ -1,3 +1,1473 @@
-from django.test import TestCase
+import asyncio
+import io
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from types import SimpleNamespace
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from django.test import AsyncClient, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework.utils.encoders import JSONEncoder
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from .models import (
+    User, Student, Section, SubjectOffering, Quiz, QuizQuestion, QuizChoice,
+    QuizAttempt, QuizAnswer, QuarterlyGrade, QuizBestScore, GradeForecast, QuizTopicPerformance,
+    QuizQuestionStats,
+)
+from . import ai_metrics
+from .ai_cache import AIResponseCache, cache_key, reset_response_cache
+from .ai_client import aclose_async_clients, get_async_client, get_caller, reset_ai_clients
+from .ai_limits import AIBusyError, LLMConcurrencyLimit, get_llm_limit, reset_llm_limit
+from .ai_scheduler import BATCH, INTERACTIVE, LLMScheduler, get_scheduler, reset_scheduler
+from .ai_singleflight import SingleFlight, get_single_flight, reset_single_flight
+from .llm_stub import StubLLMServer
+from .middleware import QuarterlyRecalcMiddleware
+from .ai_service import AIService
+from .grade_analytics import GradeAnalyticsService
+from .quiz_cache import get_answer_key, get_start_payload, clear_answer_key_cache
+from . import quarterly_grades
+from .item_stats import check_item_stats, rebuild_item_stats
+from .submission_queue import AttemptNotInProgress, claim_batch, enqueue_submission, process_batch, process_submission
+from .forecasting import RISK_MEDIUM_AT, LocalForecastEngine
+from .forecast_prompt import downsample, forecast_messages
+from .ai_tokens import estimate_tokens
+from .psychometrics import compute_psychometrics, synthetic_scores
+from .best_scores import check_best_scores, rebuild_best_scores
+from .quiz_grading import QuizGradingEngine, finalize_attempt
+from .serializers import QuizQuestionSerializer, StudentQuizSerializer
+
+
+_ai_log_handlers = []
+
+
+def setUpModule():
+    # One JSON line per AI call would flood the test output; assertLogs still captures them
+    logger = logging.getLogger("LMS.ai")
+    _ai_log_handlers[:] = logger.handlers
+    logger.handlers = [logging.NullHandler()]
+
+
+def tearDownModule():
+    logging.getLogger("LMS.ai").handlers = list(_ai_log_handlers)
+
+
+class QuizTestMixin:
+    """Shared fixtures for quiz tests"""
+
+    def make_users(self):
+        clear_answer_key_cache()
+        self.teacher = User.objects.create_user(
+            email="teacher@test.com", password="pass", school_id="T1",
+            first_name="Tea", last_name="Cher", role="TEACHER",
+        )
+        self.section = Section.objects.create(name="A", grade_level="GRADE_7", adviser=self.teacher)
+        self.offering = SubjectOffering.objects.create(
+            name="Math", section=self.section, teacher=self.teacher,
+            room_number="1", schedule="MWF",
+        )
+        self.students = []
+        for i in range(3):
+            user = User.objects.create_user(
+                email=f"student{i}@test.com", password="pass", school_id=f"S{i}",
+                first_name="Stu", last_name=f"Dent{i}", role="STUDENT",
+            )
+            self.students.append(Student.objects.create(user=user, grade_level="GRADE_7", section=self.section))
+        self.student = self.students[0]
+
+    def make_quiz(self, num_questions=3, num_essays=0, **kwargs):
+        now = timezone.now()
+        quiz = Quiz.objects.create(
+            SubjectOffering=self.offering, teacher=self.teacher, title=kwargs.pop("title", "Quiz"),
+            open_time=now - timedelta(hours=1), close_time=now + timedelta(hours=1),
+            time_limit=30, status="OPEN", **kwargs,
+        )
+        for i in range(num_questions):
+            q = QuizQuestion.objects.create(quiz=quiz, question_text=f"Q{i}", points=2, order=i)
+            QuizChoice.objects.create(question=q, choice_text="right", is_correct=True, order=0)
+            QuizChoice.objects.create(question=q, choice_text="wrong", is_correct=False, order=1)
+        for i in range(num_essays):
+            QuizQuestion.objects.create(
+                quiz=quiz, question_text=f"E{i}", question_type="SHORT_ANSWER",
+                points=5, order=num_questions + i,
+            )
+        quiz.total_points = sum(q.points for q in quiz.questions.all())
+        quiz.save()
+        return quiz
+
+    def answer_payload(self, quiz, correct=True):
+        payload = []
+        for q in quiz.questions.all().order_by("order"):
+            if q.question_type == "SHORT_ANSWER":
+                payload.append({"question_id": str(q.id), "text_answer": "essay"})
+                continue
+            choice = q.choices.get(is_correct=correct)
+            payload.append({"question_id": str(q.id), "selected_choice_id": str(choice.id)})
+        return payload
+
+
+class QuizGradingEngineTests(QuizTestMixin, TestCase):
+    def setUp(self):
+        self.make_users()
+
+    def test_scores_objective_and_subjective_answers(self):
+        quiz = self.make_quiz(num_questions=3, num_essays=1)
+        attempt = QuizAttempt.objects.create(quiz=quiz, student=self.student)
+        payload = self.answer_payload(quiz)
+        wrong = quiz.questions.get(order=1).choices.get(is_correct=False)
+        payload[1]["selected_choice_id"] = str(wrong.id)
+
+        total = QuizGradingEngine(quiz).grade(attempt, payload)
+
+        self.assertEqual(total, 4.0)
+        self.assertEqual(attempt.answers.count(), 4)
+        self.assertEqual(attempt.answers.filter(is_correct=True).count(), 2)
+        self.assertEqual(attempt.answers.get(question__order=3).points_earned, 0.0)
+
+    def test_ignores_foreign_questions_and_invalid_choices(self):
+        quiz = self.make_quiz(num_questions=2)
+        other = self.make_quiz(num_questions=1, title="Other")
+        attempt = QuizAttempt.objects.create(quiz=quiz, student=self.student)
+        payload = self.answer_payload(quiz)
+        payload[0]["selected_choice_id"] = str(other.questions.get().choices.get(is_correct=True).id)
+        payload.append(self.answer_payload(other)[0])
+
+        total = QuizGradingEngine(quiz).grade(attempt, payload)
+
+        self.assertEqual(total, 2.0)
+        self.assertEqual(attempt.answers.count(), 2)
+        self.assertIsNone(attempt.answers.get(question__order=0).selected_choice_id)
+
+    def test_submit_query_count_is_constant(self):
+        counts = []
+        for index, size in enumerate((2, 25)):
+            quiz = self.make_quiz(num_questions=size, title=f"Quiz {size}")
+            student = self.students[index]
+            attempt = QuizAttempt.objects.create(quiz=quiz, student=student)
+            client = APIClient()
+            client.force_authenticate(student.user)
+            payload = {"answers": self.answer_payload(quiz)}
+
+            with CaptureQueriesContext(connection) as ctx:
+                response = client.post(
+                    f"/api/student/quiz-attempts/{attempt.id}/submit/", payload, format="json",
+                )
+
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.data["score"], size * 2.0)
+            self.assertEqual(QuizAnswer.objects.filter(attempt=attempt).count(), size)
+            counts.append(len(ctx.captured_queries))
+
+        self.assertEqual(counts[0], counts[1])
+        self.assertTrue(QuarterlyGrade.objects.filter(student=self.students[1]).exists())
+
+
+class AnswerKeyCacheTests(QuizTestMixin, TestCase):
+    def setUp(self):
+        self.make_users()
+
+    def test_cached_key_is_reused_until_questions_change(self):
+        quiz = self.make_quiz(num_questions=2)
+        first = get_answer_key(quiz)
+        with self.assertNumQueries(0):
+            self.assertIs(get_answer_key(quiz), first)
+
+        question = quiz.questions.get(order=0)
+        choices = [
+            {"id": c.id, "choice_text": c.choice_text, "is_correct": c.is_correct, "order": c.order}
+            for c in question.choices.all()
+        ]
+        client = APIClient()
+        client.force_authenticate(self.teacher)
+        response = client.put(f"/api/teacher/questions/{question.id}/", {"points": 7, "choices": choices}, format="json")
+        self.assertEqual(response.status_code, 200)
+
+        quiz.refresh_from_db()
+        self.assertEqual(quiz.total_points, 9.0)
+        second = get_answer_key(quiz)
+        self.assertIsNot(second, first)
+        self.assertEqual(second.get(question.id)["points"], 7.0)
+        self.assertEqual(len(second.correct_choice_ids(question.id)), 1)
+
+
+class StartQuizPayloadTests(QuizTestMixin, TestCase):
+    def setUp(self):
+        self.make_users()
+
+    def start(self, quiz, student):
+        client = APIClient()
+        client.force_authenticate(student.user)
+        response = client.post(f"/api/student/quizzes/{quiz.id}/start/")
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_payload_matches_serializers(self):
+        quiz = self.make_quiz(num_questions=3)
+        data = self.start(quiz, self.student)
+
+        attempt = QuizAttempt.objects.get(id=data["attempt_id"])
+        expected_questions = QuizQuestionSerializer(quiz.questions.all().order_by("order"), many=True).data
+        self.assertEqual(data["questions"], [dict(q) for q in expected_questions])
+        self.assertEqual(data["quiz"]["id"], quiz.id)
+        self.assertEqual(data["quiz"]["question_count"], 3)
+        self.assertEqual(data["quiz"], json.loads(json.dumps(StudentQuizSerializer(quiz).data, cls=JSONEncoder)))
+        self.assertTrue(data["started_at"].startswith(attempt.started_at.date().isoformat()))
+
+        # Resuming returns the same attempt without re-rendering the quiz
+        with self.assertNumQueries(2):
+            again = self.start(quiz, self.student)
+        self.assertEqual(again["attempt_id"], attempt.id)
+
+    def test_time_flags_are_current_on_a_cached_payload(self):
+        quiz = self.make_quiz(num_questions=1)
+        data = self.start(quiz, self.student)
+        self.assertEqual((data["quiz"]["is_open"], data["quiz"]["is_closed"]), (True, False))
+
+        attempt = QuizAttempt.objects.get(id=data["attempt_id"])
+        later = quiz.close_time + timedelta(minutes=1)
+        with mock.patch("django.utils.timezone.now", return_value=later):
+            resumed = json.loads(get_start_payload(quiz).render(attempt))
+            expected = json.loads(json.dumps(StudentQuizSerializer(quiz).data, cls=JSONEncoder))
+        self.assertEqual((resumed["quiz"]["is_open"], resumed["quiz"]["is_closed"]), (False, True))
+        self.assertEqual(resumed["quiz"], expected)
+        self.assertEqual(list(resumed["quiz"]), list(expected))
+
+    def test_shuffle_is_deterministic_per_attempt(self):
+        quiz = self.make_quiz(num_questions=12, shuffle_questions=True)
+        orders = []
+        for student in self.students:
+            first = [q["id"] for q in self.start(quiz, student)["questions"]]
+            self.assertEqual(first, [q["id"] for q in self.start(quiz, student)["questions"]])
+            self.assertCountEqual(first, quiz.questions.values_list("id", flat=True))
+            orders.append(first)
+        self.assertGreater(len({tuple(o) for o in orders}), 1)
+
+
+class AutosaveTests(QuizTestMixin, TestCase):
+    def setUp(self):
+        self.make_users()
+        self.client = APIClient()
+        self.client.force_authenticate(self.student.user)
+
+    def test_autosaved_answers_are_finalized_on_submit(self):
+        quiz = self.make_quiz(num_questions=3, num_essays=1)
+        attempt_id = self.client.post(f"/api/student/quizzes/{quiz.id}/start/").json()["attempt_id"]
+        payload = self.answer_payload(quiz)
+
+        for delta in payload[:2] + [{"question_id": "999999", "text_answer": "x"}]:
+            response = self.client.post(
+                f"/api/student/quiz-attempts/{attempt_id}/autosave/", {"answers": [delta]}, format="json",
+            )
+            self.assertEqual(response.status_code, 200)
+        self.assertEqual(QuizAttempt.objects.get(id=attempt_id).draft_answers.keys(), {
+            payload[0]["question_id"], payload[1]["question_id"],
+        })
+        self.assertFalse(QuizAnswer.objects.filter(attempt_id=attempt_id).exists())
+
+        resumed = self.client.post(f"/api/student/quizzes/{quiz.id}/start/").json()
+        self.assertEqual(len(resumed["draft_answers"]), 2)
+
+        response = self.client.post(
+            f"/api/student/quiz-attempts/{attempt_id}/submit/", {"answers": payload[2:]}, format="json",
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["score"], 6.0)
+        attempt = QuizAttempt.objects.get(id=attempt_id)
+        self.assertEqual(attempt.answers.count(), 4)
+        self.assertEqual(attempt.draft_answers, {})
+
+
+    def test_cleared_text_answer_is_submitted_as_blank(self):
+        quiz = self.make_quiz(num_questions=1, num_essays=1)
+        attempt_id = self.client.post(f"/api/student/quizzes/{quiz.id}/start/").json()["attempt_id"]
+        essay = quiz.questions.get(question_type="SHORT_ANSWER")
+
+        for text in ("draft", None):
+            response = self.client.post(
+                f"/api/student/quiz-attempts/{attempt_id}/autosave/",
+                {"answers": [{"question_id": str(essay.id), "text_answer": text}]}, format="json",
+            )
+            self.assertEqual(response.status_code, 200)
+        self.assertEqual(QuizAttempt.objects.get(id=attempt_id).draft_answers[str(essay.id)]["text_answer"], "")
+
+        response = self.client.post(f"/api/student/quiz-attempts/{attempt_id}/submit/", {"answers": []}, format="json")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(QuizAnswer.objects.get(attempt_id=attempt_id, question=essay).text_answer, "")
+
+
+class QueuedSubmissionTests(QuizTestMixin, TestCase):
+    def setUp(self):
+        self.make_users()
+        self.client = APIClient()
+        self.client.force_authenticate(self.student.user)
+
+    def test_async_submit_is_graded_by_worker(self):
+        quiz = self.make_quiz(num_questions=4)
+        attempt_id = self.client.post(f"/api/student/quizzes/{quiz.id}/start/").json()["attempt_id"]
+
+        response = self.client.post(
+            f"/api/student/quiz-attempts/{attempt_id}/submit/?mode=async",
+            {"answers": self.answer_payload(quiz)}, format="json",
+        )
+        self.assertEqual(response.status_code, 202)
+        self.assertTrue(response.data["receipt"])
+        self.assertEqual(response.data["status_url"], f"/api/student/quiz-attempts/{attempt_id}/status/")
+        status_data = self.client.get(f"/api/student/quiz-attempts/{attempt_id}/status/").json()
+        self.assertEqual(status_data["status"], "QUEUED")
+        self.assertEqual(status_data["submission"]["status"], "PENDING")
+
+        call_command("process_quiz_submissions", "--once", stdout=io.StringIO())
+
+        status_data = self.client.get(f"/api/student/quiz-attempts/{attempt_id}/status/").json()
+        self.assertEqual(status_data["status"], "SUBMITTED")
+        self.assertEqual(status_data["score"], 8.0)
+        self.assertEqual(status_data["submission"]["status"], "DONE")
+        grade = QuarterlyGrade.objects.get(student=self.student, SubjectOffering=self.offering, quarter="Q1")
+        self.assertEqual(grade.written_work_score, 8.0)
+
+
+    def submit_async(self, quiz):
+        attempt_id = self.client.post(f"/api/student/quizzes/{quiz.id}/start/").json()["attempt_id"]
+        response = self.client.post(
+            f"/api/student/quiz-attempts/{attempt_id}/submit/?mode=async",
+            {"answers": self.answer_payload(quiz)}, format="json",
+        )
+        self.assertEqual(response.status_code, 202)
+        return attempt_id
+
+    def test_failed_submission_returns_the_attempt_to_the_student(self):
+        quiz = self.make_quiz(num_questions=2)
+        attempt_id = self.submit_async(quiz)
+
+        with mock.patch("LMS.submission_queue.finalize_attempt", side_effect=RuntimeError("boom")):
+            self.assertEqual(process_batch(max_tries=1), (0, 1))
+
+        status_data = self.client.get(f"/api/student/quiz-attempts/{attempt_id}/status/").json()
+        self.assertEqual(status_data["status"], "IN_PROGRESS")
+        self.assertEqual((status_data["submission"]["status"], status_data["submission"]["error"]), ("FAILED", "boom"))
+        self.assertEqual(len(QuizAttempt.objects.get(id=attempt_id).draft_answers), 2)
+
+        # The student can submit again, and the submission row is reused
+        response = self.client.post(f"/api/student/quiz-attempts/{attempt_id}/submit/?mode=async", {}, format="json")
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(process_batch(), (1, 0))
+        self.assertEqual(QuizAttempt.objects.get(id=attempt_id).score, 4.0)
+
+    def test_released_attempt_can_be_resubmitted_after_closing(self):
+        quiz = self.make_quiz(num_questions=2)
+        attempt_id = self.submit_async(quiz)
+        with mock.patch("LMS.submission_queue.finalize_attempt", side_effect=RuntimeError("boom")):
+            process_batch(max_tries=1)
+
+        quiz.close_time = timezone.now() - timedelta(minutes=1)
+        quiz.save()
+        response = self.client.post(f"/api/student/quiz-attempts/{attempt_id}/submit/", {}, format="json")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["score"], 4.0)
+
+    def test_enqueue_rejects_an_attempt_already_queued(self):
+        quiz = self.make_quiz(num_questions=2)
+        attempt_id = self.submit_async(quiz)
+        [submission] = claim_batch()
+        # A second submit that read the attempt before the first one queued it
+        stale = QuizAttempt.objects.get(id=attempt_id)
+        stale.status = "IN_PROGRESS"
+
+        with self.assertRaises(AttemptNotInProgress):
+            enqueue_submission(stale, self.answer_payload(quiz))
+        submission.refresh_from_db()
+        self.assertEqual((submission.status, submission.tries), ("PROCESSING", 1))
+
+    def test_reclaimed_submission_is_graded_once(self):
+        quiz = self.make_quiz(num_questions=2)
+        attempt_id = self.submit_async(quiz)
+
+        [slow] = claim_batch()
+        # The first worker looks dead and the row is claimed again
+        [fresh] = claim_batch(stale_after=timedelta(0))
+        self.assertTrue(process_submission(fresh))
+        self.assertFalse(process_submission(slow))
+
+        attempt = QuizAttempt.objects.get(id=attempt_id)
+        self.assertEqual((attempt.status, attempt.score), ("SUBMITTED", 4.0))
+        self.assertEqual(finalize_attempt(attempt, self.answer_payload(quiz, correct=False)), 4.0)
+        self.assertEqual(QuizQuestionStats.objects.get(question=quiz.questions.first()).attempts, 1)
+
+
+class QuarterlyRecalcTests(QuizTestMixin, TestCase):
+    def setUp(self):
+        self.make_users()
+
+    def test_dirty_keys_are_deduplicated_per_batch(self):
+        quiz = self.make_quiz(num_questions=2)
+        attempt = QuizAttempt.objects.create(quiz=quiz, student=self.student, score=4, status="SUBMITTED")
+        key = dict(student_id=self.student.id, offering_id=self.offering.id, quarter="Q1")
+
+        with mock.patch.object(
+            quarterly_grades, "_component_totals", wraps=quarterly_grades._component_totals,
+        ) as totals:
+            with quarterly_grades.coalesce_quarterly_recalc():
+                quarterly_grades.mark_attempt_dirty(attempt)
+                for _ in range(4):
+                    quarterly_grades.mark_quarterly_dirty(grade_type="WRITTEN_WORK", **key)
+                quarterly_grades.mark_quarterly_dirty(grade_type="PERFORMANCE_TASK", **key)
+                self.assertEqual(totals.call_count, 0)
+
+        self.assertEqual(totals.call_count, 2)
+        grade = QuarterlyGrade.objects.get(student=self.student, SubjectOffering=self.offering, quarter="Q1")
+        self.assertEqual((grade.written_work_score, grade.written_work_total), (4.0, 4.0))
+
+    def test_failed_batch_is_not_flushed(self):
+        key = dict(student_id=self.student.id, offering_id=self.offering.id, quarter="Q1", grade_type="WRITTEN_WORK")
+        with self.assertRaises(RuntimeError):
+            with quarterly_grades.coalesce_quarterly_recalc():
+                quarterly_grades.mark_quarterly_dirty(**key)
+                raise RuntimeError("view failed")
+
+        self.assertFalse(QuarterlyGrade.objects.exists())
+
+    async def test_async_middleware_coalesces_sync_view_writes(self):
+        key = dict(student_id=self.student.id, offering_id=self.offering.id, quarter="Q1", grade_type="WRITTEN_WORK")
+
+        def sync_view():
+            for _ in range(3):
+                quarterly_grades.mark_quarterly_dirty(**key)
+            return QuarterlyGrade.objects.count()
+
+        async def view(request):
+            # Sync DRF views run like this under ASGI
+            return await sync_to_async(sync_view)()
+
+        with mock.patch.object(
+            quarterly_grades, "recompute_quarterly_grades", wraps=quarterly_grades.recompute_quarterly_grades,
+        ) as recompute:
+            rows_during_view = await QuarterlyRecalcMiddleware(view)(None)
+
+        self.assertEqual(rows_during_view, 0)
+        recompute.assert_called_once_with({tuple(key.values())})
+        self.assertEqual(await QuarterlyGrade.objects.acount(), 1)
+
+    def test_rebuild_command(self):
+        quiz = self.make_quiz(num_questions=2)
+        QuizAttempt.objects.create(quiz=quiz, student=self.student, score=1, status="GRADED")
+        QuizAttempt.objects.create(quiz=quiz, student=self.student, score=3, status="GRADED")
+        QuizAttempt.objects.create(quiz=quiz, student=self.students[1], score=2, status="IN_PROGRESS")
+
+        call_command("recalc_quarterly_grades", stdout=io.StringIO())
+
+        grade = QuarterlyGrade.objects.get(student=self.student)
+        self.assertEqual(grade.written_work_score, 3.0)
+        self.assertFalse(QuarterlyGrade.objects.filter(student=self.students[1]).exists())
+
+
+class BestScoreProjectionTests(QuizTestMixin, TestCase):
+    def setUp(self):
+        self.make_users()
+
+    def test_projection_follows_regrades(self):
+        quiz = self.make_quiz(num_questions=3)
+        first = QuizAttempt.objects.create(quiz=quiz, student=self.student, score=5, status="GRADED")
+        second = QuizAttempt.objects.create(quiz=quiz, student=self.student, score=2, status="GRADED")
+        quarterly_grades.mark_attempt_dirty(first)
+
+        row = QuizBestScore.objects.get(student=self.student, quiz=quiz)
+        self.assertEqual((row.best_score, row.attempt_id), (5.0, first.id))
+
+        # A regrade can lower the best score; the other attempt takes over
+        first.score = 1
+        first.save()
+        with self.captureOnCommitCallbacks(execute=True):
+            quarterly_grades.mark_attempt_dirty(first)
+
+        row.refresh_from_db()
+        self.assertEqual((row.best_score, row.attempt_id), (2.0, second.id))
+        grade = QuarterlyGrade.objects.get(student=self.student)
+        self.assertEqual(grade.written_work_score, 2.0)
+
+    def test_check_and_rebuild(self):
+        quiz = self.make_quiz(num_questions=2)
+        QuizAttempt.objects.create(quiz=quiz, student=self.student, score=3, status="SUBMITTED")
+        QuizAttempt.objects.create(quiz=quiz, student=self.students[1], score=1, status="GRADED")
+        QuizBestScore.objects.create(student=self.students[2], quiz=quiz, best_score=9)
+
+        self.assertEqual(len(check_best_scores()), 3)
+        self.assertEqual(rebuild_best_scores(), {"created": 2, "updated": 0, "deleted": 1})
+        self.assertEqual(check_best_scores(), [])
+        call_command("rebuild_best_scores", "--check", stdout=io.StringIO())
+
+
+class PerformanceSummaryTests(QuizTestMixin, TestCase):
+    def setUp(self):
+        self.make_users()
+
+    def test_submission_summary_counts_attempts(self):
+        quiz = self.make_quiz(num_questions=2)
+        self.make_quiz(num_questions=3, title="Unattempted")
+        QuizAttempt.objects.create(quiz=quiz, student=self.student, score=4, status="GRADED", submitted_at=timezone.now())
+        QuizAttempt.objects.create(quiz=quiz, student=self.student, score=1, status="SUBMITTED", submitted_at=timezone.now())
+
+        client = APIClient()
+        client.force_authenticate(self.teacher)
+        response = client.get("/api/teacher/submissions/summary/")
+        self.assertEqual(response.data["totals"]["overall_attempts"], 2)
+        self.assertEqual(response.data["by_subject"][0]["unique_students"], 1)
+        self.assertEqual(response.data["by_subject"][0]["submission_rate"], round(100 / 3, 2))
+
+    def test_question_delete_refreshes_quarterly_totals(self):
+        quiz = self.make_quiz(num_questions=2)
+        attempt = QuizAttempt.objects.create(quiz=quiz, student=self.student, score=2, status="GRADED", submitted_at=timezone.now())
+        with self.captureOnCommitCallbacks(execute=True):
+            quarterly_grades.mark_attempt_dirty(attempt)
+
+        client = APIClient()
+        client.force_authenticate(self.teacher)
+        response = client.delete(f"/api/teacher/questions/{quiz.questions.first().id}/")
+        self.assertEqual(response.status_code, 204)
+
+        quiz.refresh_from_db()
+        self.assertEqual(quiz.total_points, 2.0)
+        self.assertEqual(QuarterlyGrade.objects.get(student=self.student).written_work_total, 2.0)
+
+    def test_submission_summary_counts_own_quizzes_only(self):
+        other = User.objects.create_user(
+            email="other@test.com", password="pass", school_id="T2", role="TEACHER",
+        )
+        own = self.make_quiz(num_questions=1)
+        guest = self.make_quiz(num_questions=1, title="Guest")
+        guest.teacher = other
+        guest.save()
+        QuizAttempt.objects.create(quiz=own, student=self.student, score=2, status="GRADED")
+        QuizAttempt.objects.create(quiz=guest, student=self.students[1], score=2, status="GRADED")
+
+        client = APIClient()
+        client.force_authenticate(self.teacher)
+        response = client.get("/api/teacher/submissions/summary/")
+        self.assertEqual(response.data["totals"]["overall_attempts"], 1)
+        self.assertEqual(response.data["by_subject"][0]["submitted_attempts"], 1)
+
+
+class BatchGradingTests(QuizTestMixin, TestCase):
+    def setUp(self):
+        self.make_users()
+        self.client = APIClient()
+        self.client.force_authenticate(self.teacher)
+
+    def submitted_essays(self, quiz):
+        answers = []
+        for student in self.students:
+            attempt = QuizAttempt.objects.create(quiz=quiz, student=student, score=2, status="SUBMITTED")
+            for q in quiz.questions.all():
+                answers.append(QuizAnswer.objects.create(
+                    attempt=attempt, question=q,
+                    points_earned=2 if q.question_type != "SHORT_ANSWER" else 0,
+                ))
+        return [a for a in answers if a.question.question_type == "SHORT_ANSWER"]
+
+    def test_batch_grades_each_attempt_once(self):
+        quiz = self.make_quiz(num_questions=1, num_essays=2)
+        essays = self.submitted_essays(quiz)
+        grades = [{"answer_id": a.id, "points_earned": 3, "feedback": "ok"} for a in essays]
+
+        response = self.client.post("/api/teacher/quizzes/grade-answers/", {"grades": grades}, format="json")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data["attempt_scores"]), 3)
+        for attempt in QuizAttempt.objects.filter(quiz=quiz):
+            self.assertEqual((attempt.score, attempt.status), (8.0, "GRADED"))
+        self.assertTrue(all(a.manually_graded for a in QuizAnswer.objects.filter(id__in=[a.id for a in essays])))
+        self.assertEqual(
+            list(QuarterlyGrade.objects.values_list("written_work_score", flat=True)), [8.0, 8.0, 8.0],
+        )
+
+    def test_rejects_answers_from_other_teachers(self):
+        quiz = self.make_quiz(num_questions=0, num_essays=1)
+        essays = self.submitted_essays(quiz)
+        quiz.teacher = User.objects.create_user(
+            email="other@test.com", password="pass", school_id="T2", role="TEACHER",
+        )
+        quiz.save()
+
+        response = self.client.post(
+            "/api/teacher/quizzes/grade-answers/",
+            {"grades": [{"answer_id": essays[0].id, "points_earned": 5}]}, format="json",
+        )
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(QuizAnswer.objects.get(id=essays[0].id).points_earned, 0)
+
+
+class ItemAnalysisTests(QuizTestMixin, TestCase):
+    def setUp(self):
+        self.make_users()
+        self.client = APIClient()
+        self.client.force_authenticate(self.teacher)
+
+    def test_counters_follow_submissions_and_regrades(self):
+        quiz = self.make_quiz(num_questions=1, num_essays=1)
+        mc, essay = quiz.questions.order_by("order")
+        right, wrong = mc.choices.order_by("order")
+        for student, choice in zip(self.students, [right, right, wrong]):
+            attempt = QuizAttempt.objects.create(quiz=quiz, student=student)
+            finalize_attempt(attempt, [
+                {"question_id": mc.id, "selected_choice_id": choice.id},
+                {"question_id": essay.id, "text_answer": "essay"},
+            ])
+        essays = list(QuizAnswer.objects.filter(question=essay).order_by("id"))
+        self.client.post(
+            "/api/teacher/quizzes/grade-answers/",
+            {"grades": [{"answer_id": essays[0].id, "points_earned": 4}]}, format="json",
+        )
+        url = f"/api/teacher/quizzes/{quiz.id}/item-analysis/"
+
+        data = self.client.get(url).json()
+        self.assertEqual(data["total_student_attempts"], 3)
+        mc_data, essay_data = data["questions"]
+        self.assertEqual((mc_data["correct_count"], mc_data["incorrect_count"]), (2, 1))
+        self.assertEqual(mc_data["correct_percentage"], 66.67)
+        self.assertEqual(mc_data["difficulty"], "Medium")
+        self.assertEqual(mc_data["choice_distribution"]["right"]["count"], 2)
+        self.assertEqual((essay_data["graded_count"], essay_data["pending_count"]), (1, 2))
+        self.assertEqual(essay_data["avg_score"], 4.0)
+        self.assertEqual(essay_data["score_distribution"], [{"score": 4.0, "count": 1, "percentage": 100.0}])
+
+        # Regrading moves the answer to another bucket instead of counting it twice
+        self.client.post(
+            "/api/teacher/quizzes/grade-answers/",
+            {"grades": [{"answer_id": essays[0].id, "points_earned": 2}, {"answer_id": essays[1].id, "points_earned": 4}]},
+            format="json",
+        )
+        essay_data = self.client.get(url).json()["questions"][1]
+        self.assertEqual((essay_data["graded_count"], essay_data["avg_score"]), (2, 3.0))
+        self.assertEqual(check_item_stats(), [])
+
+        # O(questions) rows regardless of attempts
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(url)
+        self.assertLessEqual(len(queries), 6)
+
+    def test_submission_and_counters_commit_together(self):
+        quiz = self.make_quiz(num_questions=2)
+        attempt = QuizAttempt.objects.create(quiz=quiz, student=self.student)
+        with mock.patch("LMS.quiz_grading.record_answers", side_effect=RuntimeError("stats down")):
+            with self.assertRaises(RuntimeError):
+                finalize_attempt(attempt, self.answer_payload(quiz))
+
+        attempt.refresh_from_db()
+        self.assertEqual(attempt.status, "IN_PROGRESS")
+        self.assertFalse(attempt.answers.exists())
+
+        # Objective submissions only increment counters: no stats row is read back
+        with CaptureQueriesContext(connection) as queries:
+            finalize_attempt(attempt, self.answer_payload(quiz))
+        stats_reads = [q["sql"] for q in queries if q["sql"].startswith("SELECT") and "quizquestionstats" in q["sql"]]
+        self.assertEqual(stats_reads, [])
+        self.assertEqual(list(QuizQuestionStats.objects.values_list("attempts", "correct")), [(1, 1), (1, 1)])
+        self.assertEqual(check_item_stats(), [])
+
+    def test_check_and_rebuild(self):
+        quiz = self.make_quiz(num_questions=2)
+        q = quiz.questions.first()
+        attempt = QuizAttempt.objects.create(quiz=quiz, student=self.student, status="SUBMITTED")
+        QuizAnswer.objects.create(attempt=attempt, question=q, selected_choice=q.choices.first(), is_correct=True, points_earned=2)
+
+        self.assertEqual(len(check_item_stats()), 2)
+        with self.assertRaises(CommandError):
+            call_command("rebuild_item_stats", "--check", stdout=io.StringIO())
+        self.assertEqual(rebuild_item_stats([quiz.id]), {"questions": 1, "choices": 1})
+        call_command("rebuild_item_stats", "--check", stdout=io.StringIO())
+
+
+class PsychometricsTests(QuizTestMixin, TestCase):
+    def test_known_matrix(self):
+        scores = [[1, 1, 1], [1, 1, 0], [1, 0, 0], [0, 0, 0]]
+        stats = compute_psychometrics(scores, [1, 1, 1])
+
+        self.assertAlmostEqual(stats["kr20"], 0.75)
+        self.assertEqual(list(stats["difficulty"]), [0.75, 0.5, 0.25])
+        self.assertEqual(list(stats["discrimination"]), [1.0, 1.0, 1.0])
+        self.assertTrue(all(r > 0 for r in stats["point_biserial"]))
+
+    def test_500_by_100_is_fast(self):
+        scores, max_points, choices = synthetic_scores(500, 100)
+        start = time.perf_counter()
+        stats = compute_psychometrics(scores, max_points, choices, 4)
+        self.assertLess(time.perf_counter() - start, 0.5)
+        self.assertEqual(stats["upper_choice_counts"].shape, (100, 4))
+        self.assertEqual(stats["upper_choice_counts"].sum(axis=1).max(), stats["group_size"])
+
+    def test_endpoint(self):
+        self.make_users()
+        client = APIClient()
+        client.force_authenticate(self.teacher)
+        quiz = self.make_quiz(num_questions=2)
+        for student, correct in zip(self.students, [2, 1, 0]):
+            attempt = QuizAttempt.objects.create(quiz=quiz, student=student, score=correct * 2, status="GRADED")
+            for i, q in enumerate(quiz.questions.order_by("order")):
+                choice = q.choices.get(is_correct=i < correct)
+                QuizAnswer.objects.create(
+                    attempt=attempt, question=q, selected_choice=choice,
+                    is_correct=choice.is_correct, points_earned=2 if choice.is_correct else 0,
+                )
+
+        data = client.get(f"/api/teacher/quizzes/{quiz.id}/psychometrics/").json()
+
+        self.assertEqual((data["total_attempts"], data["group_size"]), (3, 1))
+        first = data["items"][0]
+        self.assertEqual(first["difficulty"], round(2 / 3, 4))
+        self.assertEqual(first["discrimination_index"], 1.0)
+        right = next(d for d in first["distractors"] if d["is_correct"])
+        self.assertEqual((right["count"], right["upper_count"], right["lower_count"]), (2, 1, 0))
+
+
+@override_settings(OPENAI_API_KEY="test")
+class GradeAnalyticsTests(QuizTestMixin, TestCase):
+    def setUp(self):
+        self.make_users()
+
+    def graded_attempt(self, quiz, correct_flags, days_ago):
+        attempt = QuizAttempt.objects.create(
+            quiz=quiz, student=self.student, status="GRADED",
+            score=2 * sum(correct_flags), submitted_at=timezone.now() - timedelta(days=days_ago),
+        )
+        for q, ok in zip(quiz.questions.order_by("order"), correct_flags):
+            QuizAnswer.objects.create(attempt=attempt, question=q, is_correct=ok, points_earned=2 if ok else 0)
+
+    PREDICTION = {
+        "predicted_grade": 88.0, "confidence": 0.7, "risk_level": "LOW", "trend": "STABLE",
+        "strong_topics": ["Algebra"], "weak_topics": [], "recommendations": "Keep going.",
+    }
+
+    def test_student_quiz_data_is_aggregated_in_sql(self):
+        algebra = self.make_quiz(num_questions=4, title="Algebra")
+        geometry = self.make_quiz(num_questions=2, title="Geometry")
+        self.graded_attempt(algebra, [True, True, True, False], days_ago=3)
+        self.graded_attempt(geometry, [False, True], days_ago=1)
+        for _ in range(5):
+            self.graded_attempt(algebra, [True] * 4, days_ago=2)
+
+        with CaptureQueriesContext(connection) as queries:
+            data = GradeAnalyticsService().get_student_quiz_data(self.student.id, self.offering.id)
+
+        self.assertEqual(len(queries), 3)
+        self.assertEqual(data["quiz_scores"], [75.0] + [100.0] * 5 + [50.0])
+        self.assertEqual(data["last_quiz_date"], QuizAttempt.objects.latest("submitted_at").submitted_at)
+        self.assertEqual(data["topic_performance"], [
+            {"topic": "Algebra", "accuracy": 23 / 24 * 100, "correct": 23, "total": 24},
+            {"topic": "Geometry", "accuracy": 50.0, "correct": 1, "total": 2},
+        ])
+
+    def test_offering_batch_forecasts(self):
+        algebra = self.make_quiz(num_questions=2, title="Algebra")
+        for student, flags in zip(self.students[:2], [[True, True], [True, False]]):
+            attempt = QuizAttempt.objects.create(
+                quiz=algebra, student=student, status="GRADED", score=2 * sum(flags), submitted_at=timezone.now(),
+            )
+            for q, ok in zip(algebra.questions.order_by("order"), flags):
+                QuizAnswer.objects.create(attempt=attempt, question=q, is_correct=ok, points_earned=2 if ok else 0)
+        client = APIClient()
+        client.force_authenticate(self.teacher)
+
+        with mock.patch("LMS.ai_service.AIService.predict_grade", return_value=self.PREDICTION) as predict:
+            response = client.post(f"/api/teacher/grade-forecast/{self.offering.id}/batch/", {}, format="json")
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(predict.call_count, 2)
+        self.assertEqual(response.data["generated"], 2)
+        self.assertEqual(response.data["skipped_student_ids"], [self.students[2].id])
+        self.assertEqual(
+            sorted(GradeForecast.objects.values_list("current_average", flat=True)), [50.0, 100.0],
+        )
+        self.assertEqual(
+            sorted(QuizTopicPerformance.objects.values_list("accuracy_percentage", flat=True)), [50.0, 100.0],
+        )
+
+        # Re-running upserts instead of duplicating; the local engine needs no AI call
+        with mock.patch("LMS.ai_service.AIService.predict_grade") as predict:
+            call_command(
+                "generate_forecasts", "--offering", str(self.offering.id), "--engine", "local", stdout=io.StringIO(),
+            )
+        predict.assert_not_called()
+        self.assertEqual(GradeForecast.objects.get(student=self.students[0]).predicted_grade, 100.0)
+        self.assertEqual(GradeForecast.objects.count(), 2)
+        self.assertEqual(QuizTopicPerformance.objects.count(), 2)
+
+    def test_topic_upsert_removes_stale_topics(self):
+        service = GradeAnalyticsService(engine="local")
+        topic = lambda name, correct: {"topic": name, "accuracy": correct * 10.0, "correct": correct, "total": 10}
+        first, second, third = (s.id for s in self.students)
+
+        service.save_topic_performance(self.offering, {
+            first: [topic("Algebra", 5), topic("Old quiz", 9)],
+            second: [topic("Algebra", 7)],
+            third: [topic("Algebra", 1)],
+        })
+        with CaptureQueriesContext(connection) as queries:
+            counts = service.save_topic_performance(self.offering, {
+                first: [topic("Algebra", 6)],
+                second: [topic("Algebra", 7), topic("Geometry", 3)],
+                third: [],
+            })
+
+        self.assertEqual(counts, {"upserted": 3, "deleted": 2})
+        self.assertLessEqual(len(queries), 4)
+        self.assertEqual(
+            sorted(QuizTopicPerformance.objects.values_list("student_id", "topic", "correct_answers")),
+            [(first, "Algebra", 6), (second, "Algebra", 7), (second, "Geometry", 3)],
+        )
+    def test_forecast_is_reused_until_attempts_change(self):
+        quiz = self.make_quiz(num_questions=2)
+        self.graded_attempt(quiz, [True, False], days_ago=2)
+        client = APIClient()
+        client.force_authenticate(self.student.user)
+        url = f"/api/student/grade-forecast/{self.offering.id}/"
+
+        with mock.patch("LMS.ai_service.AIService.predict_grade", return_value=self.PREDICTION) as predict:
+            first = client.post(url, {}, format="json")
+            second = client.post(url, {}, format="json")
+            self.graded_attempt(quiz, [True, True], days_ago=1)
+            third = client.post(url, {}, format="json")
+            forced = client.post(f"{url}?force=true", {}, format="json")
+
+        self.assertEqual([r["X-Forecast-Cache"] for r in (first, second, third, forced)], ["MISS", "HIT", "MISS", "MISS"])
+        self.assertEqual([r.status_code for r in (first, second)], [201, 200])
+        self.assertEqual(predict.call_count, 3)
+        self.assertEqual(third.data["quiz_count"], 2)
+
+        # The batch path shares the fingerprint and skips the unchanged student
+        with mock.patch("LMS.ai_service.AIService.predict_grade", return_value=self.PREDICTION) as predict:
+            result = GradeAnalyticsService().generate_offering_forecasts(self.offering.id)
+        predict.assert_not_called()
+        self.assertEqual(result["unchanged"], [self.student.id])
+
+    def test_fallback_forecast_is_not_reused(self):
+        quiz = self.make_quiz(num_questions=2)
+        self.graded_attempt(quiz, [True, False], days_ago=2)
+        client = APIClient()
+        client.force_authenticate(self.student.user)
+        url = f"/api/student/grade-forecast/{self.offering.id}/"
+
+        with mock.patch("LMS.ai_service.AIService.chat", side_effect=RuntimeError("down")):
+            first = client.post(url, {}, format="json")
+            second = client.post(url, {}, format="json")
+        self.assertTrue(second.data["recommendations"].startswith("AI service unavailable."))
+        self.assertEqual(GradeForecast.objects.get().source_fingerprint, "")
+
+        with mock.patch("LMS.ai_service.AIService.predict_grade", return_value=self.PREDICTION) as predict:
+            third = client.post(url, {}, format="json")
+            fourth = client.post(url, {}, format="json")
+        self.assertEqual(predict.call_count, 1)
+        self.assertEqual(
+            [r["X-Forecast-Cache"] for r in (first, second, third, fourth)], ["MISS", "MISS", "MISS", "HIT"],
+        )
+
+class LocalForecastEngineTests(TestCase):
+    def student(self, scores, topics=()):
+        average = sum(scores) / len(scores) if scores else 0.0
+        return {"quiz_scores": scores, "current_average": average, "topic_performance": list(topics)}
+
+    def test_trend_risk_and_confidence(self):
+        engine = LocalForecastEngine(half_life=4, horizon=3)
+        rising, falling, steady, single = engine.predict_many([
+            self.student([60, 70, 80, 90]),
+            self.student([70, 60, 50, 40], [{"topic": "Algebra", "accuracy": 40.0}]),
+            self.student([80, 81, 79, 80, 80, 81]),
+            self.student([85]),
+        ])
+
+        self.assertEqual((rising["trend"], rising["risk_level"]), ("IMPROVING", "LOW"))
+        self.assertGreater(rising["predicted_grade"], 90)
+        self.assertEqual((falling["trend"], falling["risk_level"]), ("DECLINING", "HIGH"))
+        self.assertEqual(falling["weak_topics"], ["Algebra"])
+        self.assertEqual(steady["trend"], "STABLE")
+        self.assertAlmostEqual(steady["predicted_grade"], 80.3, delta=1)
+        self.assertEqual(single["predicted_grade"], 85.0)
+        self.assertGreater(steady["confidence"], single["confidence"])
+        self.assertEqual(set(single), set(GradeAnalyticsTests.PREDICTION))
+
+    def test_risk_follows_the_current_average(self):
+        # Projected below 60 after a slide, but the average so far is still 75
+        [sliding] = LocalForecastEngine(half_life=4, horizon=3).predict_many([self.student([90, 80, 70, 60])])
+        self.assertLess(sliding["predicted_grade"], RISK_MEDIUM_AT)
+        self.assertEqual(sliding["risk_level"], "LOW")
+
+    def test_vectorized_matches_single(self):
+        students = [self.student(list(range(50, 50 + n * 7, 7))) for n in range(1, 8)]
+        engine = LocalForecastEngine()
+        self.assertEqual(engine.predict_many(students), [engine.predict_grade(s) for s in students])
+
+
+class AIResponseCacheTests(TestCase):
+    def setUp(self):
+        reset_response_cache()
+        self.addCleanup(reset_response_cache)
+
+    def test_lru_ttl_and_disk_tier(self):
+        now = [1000.0]
+        with tempfile.TemporaryDirectory() as tmp:
+            path = f"{tmp}/ai.sqlite3"
+            cache = AIResponseCache(maxsize=2, ttl=60, path=path, disk_maxsize=2, clock=lambda: now[0])
+            for key in "abc":
+                cache.set(key, key.upper())
+            self.assertEqual(len(cache.memory), 2)
+
+            # "a" left memory and the disk tier; "c" survives a restart
+            self.assertIsNone(cache.get("a"))
+            restarted = AIResponseCache(maxsize=2, ttl=60, path=path, clock=lambda: now[0])
+            self.assertEqual(restarted.get("c"), "C")
+            self.assertEqual(restarted.stats()["disk_hits"], 1)
+
+            now[0] += 61
+            self.assertIsNone(restarted.get("c"))
+            self.assertEqual(restarted.stats()["misses"], 1)
+
+    @override_settings(OPENAI_API_KEY="test", AI_CACHE_TTL=60, AI_CACHE_PATH="", AI_SINGLEFLIGHT_DIR="")
+    def test_chat_reuses_identical_requests(self):
+        reset_single_flight()
+        self.addCleanup(reset_single_flight)
+        service = AIService()
+        completion = SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content="Plants make food."))])
+        offering = SimpleNamespace(name="Science")
+        with mock.patch.object(service.client.chat.completions, "create", return_value=completion) as create:
+            for _ in range(3):
+                self.assertEqual(service.explain_concept("photosynthesis", offering), "Plants make food.")
+            service.explain_concept("respiration", offering)
+            self.assertEqual(service.chat([{"role": "user", "content": "  Hi\n"}]), service.chat([{"role": "user", "content": "Hi"}]))
+
+            create.side_effect = RuntimeError("down")
+            self.assertTrue(service.chat([{"role": "user", "content": "new"}]).startswith("Error:"))
+
+        self.assertEqual(create.call_count, 4)
+        stats = service.cache_stats()
+        self.assertEqual((stats["hits"], stats["misses"], stats["stores"]), (3, 4, 3))
+
+
+@override_settings(OPENAI_API_KEY="test", AI_CACHE_TTL=0, AI_MAX_CONCURRENCY=3, AI_SINGLEFLIGHT_DIR="")
+class AsyncAIViewTests(QuizTestMixin, TestCase):
+    def setUp(self):
+        self.make_users()
+        reset_llm_limit()
+        reset_ai_clients()
+        reset_single_flight()
+        self.addCleanup(reset_llm_limit)
+        self.addCleanup(reset_ai_clients)
+        self.addCleanup(reset_single_flight)
+        self.stub = StubLLMServer(delay=0.05).start()
+        self.addCleanup(self.stub.stop)
+        self.token = str(RefreshToken.for_user(self.teacher).access_token)
+
+    async def test_explain_concept_awaits_the_llm(self):
+        client = AsyncClient()
+        body = {"concept": "photosynthesis", "name": "Science"}
+        with self.settings(OPENAI_BASE_URL=self.stub.base_url):
+            response = await client.post(
+                "/api/ai/explain-concept/", body, content_type="application/json",
+                headers={"Authorization": f"Bearer {self.token}"},
+            )
+            anonymous = await client.post("/api/ai/explain-concept/", body, content_type="application/json")
+        await aclose_async_clients()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("photosynthesis", response.json()["explanation"])
+        self.assertEqual(anonymous.status_code, 401)
+        self.assertEqual(self.stub.requests, 1)
+
+    async def test_form_bodies_are_accepted(self):
+        client = AsyncClient()
+        with self.settings(OPENAI_BASE_URL=self.stub.base_url):
+            multipart = await client.post(
+                "/api/ai/explain-concept/", {"concept": "osmosis", "name": "Science"},
+                headers={"Authorization": f"Bearer {self.token}"},
+            )
+            urlencoded = await client.post(
+                "/api/ai/explain-concept/", "concept=diffusion&name=Science",
+                content_type="application/x-www-form-urlencoded", headers={"Authorization": f"Bearer {self.token}"},
+            )
+        await aclose_async_clients()
+
+        self.assertEqual((multipart.status_code, urlencoded.status_code), (200, 200))
+        self.assertIn("osmosis", multipart.json()["explanation"])
+        self.assertIn("diffusion", urlencoded.json()["explanation"])
+
+    async def test_ai_chat_streams_server_sent_events(self):
+        ai_metrics.reset()
+        self.stub.token_delay = 0.02
+        client = AsyncClient()
+        with self.settings(OPENAI_BASE_URL=self.stub.base_url):
+            response = await client.post(
+                "/api/ai/chat/", {"messages": [{"role": "user", "content": "one two three"}], "stream": True},
+                content_type="application/json", headers={"Authorization": f"Bearer {self.token}"},
+            )
+            body = b"".join([chunk async for chunk in response.streaming_content]).decode()
+        await aclose_async_clients()
+
+        self.assertEqual(response["Content-Type"], "text/event-stream")
+        self.assertGreater(float(response["X-Time-To-First-Token-Ms"]), 0)
+        events = [e for e in body.split("\n\n") if e]
+        deltas = [json.loads(e[len("data: "):])["delta"] for e in events if e.startswith("data: ")]
+        self.assertEqual(deltas, ["stub: ", "one ", "two ", "three"])
+        self.assertTrue(events[-1].startswith("event: done"))
+        self.assertEqual(ai_metrics.snapshot()["chat.ttft"]["count"], 1)
+
+    def test_load_test_respects_the_concurrency_limit(self):
+        out = io.StringIO()
+        call_command("ai_load_test", requests=30, concurrency=15, delay=0.05, stdout=out)
+        self.assertIn("30 calls", out.getvalue())
+        self.assertEqual(get_llm_limit().max_in_flight, 3)
+        self.assertEqual(get_llm_limit().rejected, 0)
+
+
+class ConcurrencyLimitTests(TestCase):
+    def test_released_slots_go_to_waiting_threads_and_loops_in_order(self):
+        limit = LLMConcurrencyLimit(limit=1, wait=5)
+        order = []
+
+        async def waiting_coroutine():
+            async with limit.aslot():
+                order.append("loop")
+
+        def waiting_thread():
+            with limit.slot():
+                order.append("thread")
+
+        with limit.slot():
+            loop_waiter = threading.Thread(target=asyncio.run, args=(waiting_coroutine(),))
+            loop_waiter.start()
+            while not limit._waiters:
+                time.sleep(0.001)
+            thread_waiter = threading.Thread(target=waiting_thread)
+            thread_waiter.start()
+            while len(limit._waiters) < 2:
+                time.sleep(0.001)
+        loop_waiter.join()
+        thread_waiter.join()
+
+        self.assertEqual(order, ["loop", "thread"])
+        self.assertEqual((limit.in_flight, limit._free, limit.max_in_flight), (0, 1, 1))
+
+    async def test_async_waiters_time_out_or_give_up_without_losing_slots(self):
+        limit = LLMConcurrencyLimit(limit=1, wait=0.05)
+        async with limit.aslot():
+            with self.assertRaises(AIBusyError):
+                async with limit.aslot():
+                    pass
+            waiter = asyncio.ensure_future(limit.aslot().__aenter__())
+            await asyncio.sleep(0.01)
+            waiter.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await waiter
+        self.assertEqual((limit.in_flight, limit._free, limit.rejected), (0, 1, 1))
+        self.assertFalse(limit._waiters)
+
+    @override_settings(OPENAI_API_KEY="test")
+    def test_async_clients_close_when_their_loop_ends(self):
+        reset_ai_clients()
+        self.addCleanup(reset_ai_clients)
+
+        async def use_client():
+            return get_async_client("http://127.0.0.1:9/v1")
+
+        # Each asyncio.run() is a loop like the ones asgiref runs async views on under WSGI
+        first = asyncio.run(use_client())
+        second = asyncio.run(use_client())
+        self.assertIsNot(first, second)
+        self.assertTrue(first.is_closed() and second.is_closed())
+
+
+@override_settings(
+    OPENAI_API_KEY="test", AI_CACHE_TTL=0, AI_READ_TIMEOUT=0.2, AI_MAX_RETRIES=2,
+    AI_RETRY_BACKOFF=0.01, AI_BREAKER_FAILURES=2, AI_BREAKER_RESET=30, AI_SINGLEFLIGHT_DIR="",
+)
+class ResilientClientTests(TestCase):
+    def setUp(self):
+        reset_ai_clients()
+        reset_single_flight()
+        self.addCleanup(reset_ai_clients)
+        self.addCleanup(reset_single_flight)
+        self.stub = StubLLMServer().start()
+        self.addCleanup(self.stub.stop)
+        self.service = AIService(base_url=self.stub.base_url)
+
+    def ask(self):
+        return self.service.chat([{"role": "user", "content": "hi"}])
+
+    def test_client_is_shared_and_retries_transient_errors(self):
+        self.assertIs(AIService(base_url=self.stub.base_url).client, self.service.client)
+
+        self.stub.fail(status=503, times=2)
+        self.assertEqual(self.ask(), "stub: hi")
+        self.assertEqual(self.stub.requests, 3)
+
+        # Client errors are not retried
+        self.stub.fail(status=400)
+        self.assertTrue(self.ask().startswith("Error:"))
+        self.assertEqual(self.stub.requests, 4)
+
+    def test_breaker_fails_fast_to_the_fallback(self):
+        now = [0.0]
+        get_caller().breaker.clock = lambda: now[0]
+
+        # Two calls time out after every retry, which opens the circuit
+        self.stub.delay = 0.5
+        for _ in range(2):
+            self.assertTrue(self.ask().startswith("Error:"))
+        self.assertEqual(self.stub.requests, 6)
+        self.assertEqual(get_caller().breaker.state, "open")
+
+        student = {
+            "student_name": "S", "subject_name": "Math", "quiz_scores": [70, 80, 90],
+            "current_average": 80.0, "quiz_count": 3, "topic_performance": [], "recent_trend": "Improving",
+        }
+        started = time.perf_counter()
+        prediction = self.service.predict_grade(student)
+        self.assertLess(time.perf_counter() - started, 0.1)
+        self.assertTrue(prediction["recommendations"].startswith("AI service unavailable."))
+        self.assertEqual(self.stub.requests, 6)
+
+        # After the reset timeout one trial call goes through and closes the circuit
+        self.stub.delay = 0
+        now[0] += 31
+        self.assertEqual(self.ask(), "stub: hi")
+        self.assertEqual(get_caller().breaker.state, "closed")
+
+
+@override_settings(OPENAI_API_KEY="test", AI_CACHE_TTL=0)
+class SingleFlightTests(TestCase):
+    def setUp(self):
+        self.lock_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.lock_dir.cleanup)
+        reset_ai_clients()
+        reset_single_flight()
+        self.addCleanup(reset_ai_clients)
+        self.addCleanup(reset_single_flight)
+        self.stub = StubLLMServer(delay=0.2).start()
+        self.addCleanup(self.stub.stop)
+
+    def test_concurrent_identical_requests_share_one_call(self):
+        service = AIService(base_url=self.stub.base_url)
+        offering = SimpleNamespace(name="Science")
+        answers = []
+        with self.settings(AI_SINGLEFLIGHT_DIR=self.lock_dir.name):
+            threads = [
+                threading.Thread(target=lambda: answers.append(service.explain_concept("osmosis", offering)))
+                for _ in range(8)
+            ]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        self.assertEqual(len(set(answers)), 1)
+        self.assertIn("osmosis", answers[0])
+        self.assertEqual(self.stub.requests, 1)
+        self.assertEqual(get_single_flight().coalesced, 7)
+
+    async def test_async_callers_share_one_call(self):
+        service = AIService(base_url=self.stub.base_url)
+        messages = [{"role": "user", "content": "hello"}]
+        with self.settings(AI_SINGLEFLIGHT_DIR=""):
+            answers = await asyncio.gather(*(service.achat(messages) for _ in range(5)))
+            other = await service.achat([{"role": "user", "content": "bye"}])
+        await aclose_async_clients()
+
+        self.assertEqual(answers, ["stub: hello"] * 5)
+        self.assertEqual(other, "stub: bye")
+        self.assertEqual(self.stub.requests, 2)
+
+    def test_worker_processes_share_results_through_the_lock_dir(self):
+        # Separate instances stand in for separate worker processes
+        workers = [SingleFlight(lock_dir=self.lock_dir.name, result_ttl=30) for _ in range(2)]
+        key = cache_key("gpt", [{"role": "user", "content": "hi"}], 0.7, 500)
+        calls = []
+
+        def slow_call():
+            calls.append(1)
+            time.sleep(0.2)
+            return "answer"
+
+        answers = []
+        threads = [threading.Thread(target=lambda w=w: answers.append(w.do(key, slow_call))) for w in workers]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(answers, ["answer", "answer"])
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(sum(w.coalesced for w in workers), 1)
+
+        # Failures are not stored: the next caller tries again
+        other = cache_key("gpt", [{"role": "user", "content": "boom"}], 0.7, 500)
+        with self.assertRaises(RuntimeError):
+            workers[0].do(other, mock.Mock(side_effect=RuntimeError("down")))
+        self.assertEqual(workers[1].do(other, lambda: "recovered"), "recovered")
+        self.assertEqual(os.listdir(self.lock_dir.name), ["results.sqlite3"])
+
+    def test_unrelated_keys_and_uncached_calls_do_not_wait(self):
+        workers = [SingleFlight(lock_dir=self.lock_dir.name, result_ttl=30, wait=5) for _ in range(2)]
+        slow = cache_key("gpt", [{"role": "user", "content": "slow"}], 0.7, 500)
+        started = threading.Event()
+
+        def slow_call():
+            started.set()
+            time.sleep(0.5)
+            return "slow"
+
+        thread = threading.Thread(target=workers[0].do, args=(slow, slow_call))
+        thread.start()
+        started.wait()
+        began = time.monotonic()
+        # Keys no longer share striped lock files
+        for i in range(50):
+            key = cache_key("gpt", [{"role": "user", "content": f"fast {i}"}], 0.7, 500)
+            self.assertEqual(workers[1].do(key, lambda: "fast"), "fast")
+        # Callers without caching neither wait for other workers nor store results
+        self.assertEqual(workers[1].do(slow, lambda: "own", share=False), "own")
+        self.assertLess(time.monotonic() - began, 0.4)
+        thread.join()
+
+        uncached = cache_key("gpt", [{"role": "user", "content": "private"}], 0.7, 500)
+        workers[0].do(uncached, lambda: "first", share=False)
+        self.assertEqual(workers[1].do(uncached, lambda: "second"), "second")
+
+
+class RateLimitSchedulerTests(TestCase):
+    def setUp(self):
+        ai_metrics.reset()
+        reset_scheduler()
+        self.addCleanup(reset_scheduler)
+
+    def test_token_buckets_with_fake_clock(self):
+        now = [0.0]
+
+        def sleep(seconds):
+            now[0] += seconds
+
+        scheduler = LLMScheduler(
+            requests_per_minute=60, tokens_per_minute=600, clock=lambda: now[0], sleep=sleep, waits={INTERACTIVE: 60, BATCH: 10},
+        )
+        scheduler.admit(500)
+        self.assertEqual(now[0], 0)
+
+        # 100 tokens left, refilling at 10 per second
+        scheduler.admit(500)
+        self.assertAlmostEqual(now[0], 40)
+
+        # The call used fewer tokens than estimated: the difference is returned
+        scheduler.settle(estimated=500, actual=100)
+        scheduler.admit(400)
+        self.assertAlmostEqual(now[0], 40)
+
+        # A batch call that would wait past its limit fails fast
+        with self.assertRaises(AIBusyError):
+            scheduler.admit(600, priority=BATCH)
+        self.assertAlmostEqual(now[0], 40)
+        self.assertEqual((scheduler.admitted, scheduler.queue_depth), (3, 0))
+
+    def test_interactive_requests_go_before_queued_batch_work(self):
+        scheduler = LLMScheduler(requests_per_minute=600, burst=1 / 600, poll=0.005)
+        order = []
+
+        def work(name, priority):
+            scheduler.admit(1, priority)
+            order.append(name)
+
+        # Empty the one-request bucket: the next admission is 0.1s away
+        scheduler.admit(1)
+        threads = []
+        for name, priority in [("batch0", BATCH), ("batch1", BATCH), ("batch2", BATCH), ("interactive", INTERACTIVE)]:
+            threads.append(threading.Thread(target=work, args=(name, priority)))
+            threads[-1].start()
+            time.sleep(0.01)
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(order, ["interactive", "batch0", "batch1", "batch2"])
+        self.assertEqual(scheduler.max_queue_depth, 4)
+        self.assertEqual(ai_metrics.gauges()["scheduler.queue_depth"], {"value": 0, "max": 4})
+
+    @override_settings(
+        OPENAI_API_KEY="test", AI_CACHE_TTL=0, AI_SINGLEFLIGHT_DIR="", AI_RATE_LIMIT_RETRIES=3, AI_RATE_LIMIT_BACKOFF=0.01,
+    )
+    def test_rate_limited_calls_are_retried(self):
+        reset_ai_clients()
+        self.addCleanup(reset_ai_clients)
+        with StubLLMServer() as stub:
+            service = AIService(base_url=stub.base_url)
+            stub.fail(status=429, retry_after=0.05)
+            stub.fail(status=429)
+            self.assertEqual(service.chat([{"role": "user", "content": "hi"}]), "stub: hi")
+            self.assertEqual(stub.requests, 3)
+            self.assertEqual(get_scheduler().rate_limited, 2)
+
+            # A rate limit is not an outage: the circuit stays closed
+            stub.fail(status=429, times=5)
+            self.assertTrue(service.chat([{"role": "user", "content": "again"}]).startswith("Error:"))
+            self.assertEqual(stub.requests, 7)
+            self.assertEqual(get_caller().breaker.state, "closed")
+
+    @override_settings(
+        OPENAI_API_KEY="test", AI_CACHE_TTL=60, AI_CACHE_PATH="", AI_SINGLEFLIGHT_DIR="", AI_RATE_LIMIT_BACKOFF=0.01,
+    )
+    async def test_streams_retry_rate_limits_and_skip_caching_empty_answers(self):
+        reset_ai_clients()
+        reset_response_cache()
+        self.addCleanup(reset_ai_clients)
+        self.addCleanup(reset_response_cache)
+        with StubLLMServer(reply=lambda messages: messages[-1]["content"]) as stub:
+            service = AIService(base_url=stub.base_url)
+            stub.fail(status=429)
+            chunks = [chunk async for chunk in service.astream_chat([{"role": "user", "content": "hi"}])]
+            self.assertEqual((chunks, stub.requests), (["hi"], 2))
+            self.assertEqual(get_scheduler().rate_limited, 1)
+            self.assertEqual(get_llm_limit().in_flight, 0)
+
+            empty = [{"role": "user", "content": ""}]
+            for _ in range(2):
+                self.assertEqual([chunk async for chunk in service.astream_chat(empty)], [])
+            self.assertEqual(stub.requests, 4)
+            await aclose_async_clients()
+
+
+class ForecastPromptTests(TestCase):
+    def student(self, quizzes):
+        scores = [40 + (i * 37) % 60 for i in range(quizzes)]
+        return {
+            "student_name": "Ana Cruz", "subject_name": "Mathematics 7",
+            "quiz_scores": scores, "current_average": sum(scores) / len(scores), "quiz_count": quizzes,
+            "recent_trend": "Improving (recent average up 5.0%)",
+            "topic_performance": [
+                {"topic": f"Quarter {i % 4 + 1} long quiz {i}: fractions, decimals and percentages review",
+                 "accuracy": (i * 53) % 100, "correct": i % 5, "total": 5}
+                for i in range(quizzes)
+            ],
+        }
+
+    def test_prompt_size_is_capped(self):
+        for quizzes in (80, 400):
+            for budget in (800, 600):
+                messages = forecast_messages(self.student(quizzes), budget=budget)
+                self.assertLessEqual(estimate_tokens(messages), budget)
+                self.assertIn(f"{quizzes} scores averaged into", messages[1]["content"])
+
+        # Five times the history costs (almost) nothing
+        self.assertLessEqual(
+            estimate_tokens(forecast_messages(self.student(400))),
+            estimate_tokens(forecast_messages(self.student(80))) + 5,
+        )
+
+    def test_short_histories_are_kept_verbatim(self):
+        content = forecast_messages(self.student(3))[1]["content"]
+        self.assertIn("Quiz Score History (oldest first): [40, 77, 54]", content)
+        self.assertEqual(content.count("\n  - "), 3)
+        self.assertEqual(downsample([10, 20, 30, 40, 50, 60], 3), [15.0, 35.0, 55.0])
+
+    @override_settings(OPENAI_API_KEY="test", AI_CACHE_TTL=0, AI_SINGLEFLIGHT_DIR="", AI_FORECAST_PROMPT_BUDGET=700)
+    def test_predict_grade_sends_the_compact_prompt(self):
+        reset_ai_clients()
+        self.addCleanup(reset_ai_clients)
+        prompts = []
+
+        def reply(messages):
+            prompts.append(messages)
+            return json.dumps({"predicted_grade": 81, "confidence": 0.8, "risk_level": "low", "trend": "improving",
+                               "strong_topics": [], "weak_topics": [], "recommendations": "Keep going."})
+
+        with StubLLMServer(reply=reply) as stub:
+            prediction = AIService(base_url=stub.base_url).predict_grade(self.student(80))
+
+        self.assertEqual((prediction["predicted_grade"], prediction["risk_level"]), (81.0, "LOW"))
+        self.assertLessEqual(estimate_tokens(prompts[0]), 700)
+        self.assertIn("strongest", prompts[0][1]["content"])
+
+
+@override_settings(OPENAI_API_KEY="test", AI_CACHE_TTL=60, AI_CACHE_PATH="", AI_SINGLEFLIGHT_DIR="")
+class AIInstrumentationTests(TestCase):
+    def setUp(self):
+        ai_metrics.reset()
+        for reset in (reset_ai_clients, reset_response_cache, reset_single_flight):
+            reset()
+            self.addCleanup(reset)
+        self.stub = StubLLMServer().start()
+        self.addCleanup(self.stub.stop)
+        self.service = AIService(base_url=self.stub.base_url)
+
+    def test_calls_are_timed_and_counted_per_method(self):
+        with self.assertLogs("LMS.ai", level="INFO") as logs:
+            for _ in range(2):
+                self.service.explain_concept("osmosis", SimpleNamespace(name="Science"))
+
+        counters = ai_metrics.counters()
+        self.assertEqual(counters["explain_concept.calls"], 2)
+        self.assertEqual((counters["explain_concept.cache_misses"], counters["explain_concept.cache_hits"]), (1, 1))
+        self.assertGreater(counters["explain_concept.prompt_tokens"], 0)
+        self.assertGreater(counters["explain_concept.completion_tokens"], 0)
+        self.assertEqual(ai_metrics.snapshot()["explain_concept.latency"]["count"], 2)
+
+        lines = [json.loads(record.getMessage()) for record in logs.records]
+        self.assertEqual([line["outcome"] for line in lines], ["ok", "cache_hit"])
+        self.assertEqual(lines[0]["prompt_tokens"], counters["explain_concept.prompt_tokens"])
+
+    async def test_streamed_chats_are_instrumented(self):
+        messages = [{"role": "user", "content": "one two"}]
+        with self.assertLogs("LMS.ai", level="INFO") as logs:
+            first = [chunk async for chunk in self.service.astream_chat(messages)]
+            second = [chunk async for chunk in self.service.astream_chat(messages)]
+            self.stub.fail(status=400)
+            with self.assertRaises(Exception):
+                [chunk async for chunk in self.service.astream_chat([{"role": "user", "content": "boom"}])]
+        await aclose_async_clients()
+
+        self.assertEqual(("".join(first), second), ("stub: one two", ["stub: one two"]))
+        counters = ai_metrics.counters()
+        self.assertEqual(counters["chat_stream.calls"], 3)
+        self.assertEqual((counters["chat_stream.cache_misses"], counters["chat_stream.cache_hits"]), (2, 1))
+        self.assertEqual(counters["chat_stream.errors.BadRequestError"], 1)
+        lines = [json.loads(record.getMessage()) for record in logs.records]
+        self.assertEqual([line["outcome"] for line in lines], ["ok", "cache_hit", "error"])
+        self.assertEqual((lines[0]["prompt_tokens"], lines[0]["completion_tokens"]), (2, 3))
+
+    def test_fallbacks_record_the_upstream_error_class(self):
+        self.stub.fail(status=400)
+        student = {
+            "student_name": "S", "subject_name": "Math", "quiz_scores": [70, 80], "current_average": 75.0,
+            "quiz_count": 2, "topic_performance": [], "recent_trend": "Stable",
+        }
+        with self.assertLogs("LMS.ai", level="INFO") as logs:
+            self.service.predict_grade(student)
+
+        counters = ai_metrics.counters()
+        self.assertEqual(counters["predict_grade.fallbacks"], 1)
+        self.assertEqual(counters["predict_grade.errors.BadRequestError"], 1)
+        self.assertNotIn("predict_grade.errors.JSONDecodeError", counters)
+        self.assertNotIn("chat.calls", counters)
+        line = json.loads(logs.records[-1].getMessage())
+        self.assertEqual((line["method"], line["outcome"], line["error"]), ("predict_grade", "fallback", "BadRequestError"))
+
+    def test_metrics_endpoint_is_admin_only(self):
+        self.service.chat([{"role": "user", "content": "hi"}])
+        admin = User.objects.create_user(
+            email="admin@test.com", password="pass", school_id="A1", first_name="Ad", last_name="Min", role="ADMIN",
+        )
+        teacher = User.objects.create_user(
+            email="teacher@test.com", password="pass", school_id="T1", first_name="Tea", last_name="Cher", role="TEACHER",
+        )
+        client = APIClient()
+        client.force_authenticate(teacher)
+        self.assertEqual(client.get("/api/ai/metrics/").status_code, 403)
+
+        client.force_authenticate(admin)
+        response = client.get("/api/ai/metrics/")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["counters"]["chat.calls"], 1)
+        self.assertEqual(response.data["latency_ms"]["chat.latency"]["count"], 1)
+        self.assertEqual(response.data["circuit"]["state"], "closed")
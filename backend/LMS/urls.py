@@ -1,9 +1,10 @@
 from django.urls import include, path
 from rest_framework.routers import DefaultRouter
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
-from .views import GradeChangeLogViewSet, StudentSubjectOfferingViewSet, StudentViewSet, SubjectOfferingViewSet, SubjectViewSet, TeacherQuizViewSet, TeacherSubjectListViewSet, TeacherViewSet, ai_chat, explain_concept, generate_quiz, generate_study_plan, grade_forecast, import_students_excel, list_users, LoginView, create_user, manage_quiz_question, provide_feedback, quarterly_grade_detail, quarterly_grades, quiz_item_analysis, start_quiz, student_grade_analytics, student_quiz_attempts, student_quiz_detail, student_quizzes, student_topic_performance, submit_quiz, user_detail, SectionViewSet, AdminDashboardStatsView
+from .views import GradeChangeLogViewSet, StudentSubjectOfferingViewSet, StudentViewSet, SubjectOfferingViewSet, SubjectViewSet, TeacherQuizViewSet, TeacherSubjectListViewSet, TeacherViewSet, grade_forecast, offering_grade_forecasts, import_students_excel, list_users, LoginView, create_user, manage_quiz_question, quarterly_grade_detail, quarterly_grades, quiz_item_analysis, quiz_psychometrics_view, start_quiz, autosave_quiz, quiz_attempt_status, student_grade_analytics, student_quiz_attempts, student_quiz_detail, student_quizzes, student_topic_performance, submit_quiz, user_detail, SectionViewSet, AdminDashboardStatsView
 
-from .views import teacher_submissions_summary, teacher_submissions_subject_detail, teacher_submissions_export_csv, quarterly_grades_bulk_apply_weights
+from .ai_views import ai_chat, explain_concept, generate_quiz, generate_study_plan, provide_feedback
+from .views import ai_metrics_view, teacher_submissions_summary, teacher_submissions_subject_detail, teacher_submissions_export_csv, quarterly_grades_bulk_apply_weights
 
 router = DefaultRouter()
 router.register(r"sections", SectionViewSet, basename="section")
@@ -32,12 +33,15 @@ urlpatterns = [
     
     # Quiz Item Analysis
     path('teacher/quizzes/<int:quiz_id>/item-analysis/', quiz_item_analysis, name='quiz_item_analysis'),
+    path('teacher/quizzes/<int:quiz_id>/psychometrics/', quiz_psychometrics_view, name='quiz_psychometrics'),
     
     # Student Quiz Access
     path('student/quizzes/', student_quizzes, name='student_quizzes'),
     path('student/quizzes/<int:quiz_id>/', student_quiz_detail, name='student_quiz_detail'),
     path('student/quizzes/<int:quiz_id>/start/', start_quiz, name='start_quiz'),
+    path('student/quiz-attempts/<int:attempt_id>/autosave/', autosave_quiz, name='autosave_quiz'),
     path('student/quiz-attempts/<int:attempt_id>/submit/', submit_quiz, name='submit_quiz'),
+    path('student/quiz-attempts/<int:attempt_id>/status/', quiz_attempt_status, name='quiz_attempt_status'),
     path('student/quiz-attempts/', student_quiz_attempts, name='student_quiz_attempts'),
     
     # Grade Forecasting - Student access
@@ -46,6 +50,7 @@ urlpatterns = [
     path('student/grade-forecast/<int:SubjectOffering_id>/', grade_forecast, name='student_grade_forecast_subject'),
     path('student/topic-performance/', student_topic_performance, name='student_topic_performance'),
     path('student/topic-performance/<int:SubjectOffering_id>/', student_topic_performance, name='student_topic_performance_subject'),
+    path('teacher/grade-forecast/<int:SubjectOffering_id>/batch/', offering_grade_forecasts, name='offering_grade_forecasts'),
     
     # Quarterly Grades
     path('quarterly-grades/', quarterly_grades, name='quarterly_grades'),
@@ -57,5 +62,6 @@ urlpatterns = [
     path('ai/explain-concept/', explain_concept, name='explain_concept'),
     path('ai/feedback/', provide_feedback, name='provide_feedback'),
     path('ai/study-plan/', generate_study_plan, name='generate_study_plan'),
+    path('ai/metrics/', ai_metrics_view, name='ai_metrics'),
     
 ]
\ No newline at end of file
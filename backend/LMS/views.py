@@ -1,6 +1,7 @@
 import os
 import mimetypes
 import pandas as pd
+from django.conf import settings
 from django.db import transaction
 from django.utils import timezone
 
@@ -14,26 +15,33 @@ from rest_framework.parsers import MultiPartParser, FormParser
 from rest_framework.permissions import IsAuthenticated
 from django.contrib.auth import get_user_model
 from django.shortcuts import get_object_or_404
-from django.db.models import Sum, Max
+from django.db.models import Sum
 from rest_framework import serializers
 from django.db import transaction
 
-from .ai_service import AIService
-from .models import (GradeChangeLog, Section, Student, Subject, SubjectOffering, Quiz, QuizQuestion, QuizChoice, QuizAttempt, 
+from .models import (GradeChangeLog, Section, Student, Subject, SubjectOffering, Quiz, QuizQuestion, QuizAttempt, 
     QuizAnswer, Student, GradeForecast, QuizTopicPerformance,
-    QuarterlyGrade, SubjectOfferingFile)
+    QuarterlyGrade, SubjectOfferingFile, QuizSubmission)
 from rest_framework import permissions
 from .serializers import (LoginSerializer, StudentSubjectOfferingSerializer, SubjectListSerializer, SubjectOfferingSerializer, SubjectSerializer, TeacherSerializer, UserSerializer, SectionSerializer, StudentSerializer,QuizSerializer, QuizCreateUpdateSerializer,
     QuizQuestionSerializer, StudentQuizSerializer, QuizAttemptSerializer,
-    QuizSubmissionSerializer, QuizChoiceSerializer, QuizAnswerSerializer,
+    QuizSubmissionSerializer, QuizAutosaveSerializer, BatchAnswerGradeSerializer, QuizChoiceSerializer, QuizAnswerSerializer,
     GradeForecastSerializer, QuizTopicPerformanceSerializer,
     QuarterlyGradeSerializer, QuarterlyGradeCreateUpdateSerializer, GradeChangeLogSerializer, SubjectOfferingFileSerializer
 )
-from .grade_analytics import GradeAnalyticsService
+from .ai_service import metrics_report
+from .grade_analytics import FORECAST_ENGINES, GradeAnalyticsService
+from .quiz_grading import apply_draft_deltas, apply_manual_grades, finalize_attempt
+from .submission_queue import AttemptNotInProgress, enqueue_submission
+from .item_analysis import get_item_analysis
+from .psychometrics import quiz_psychometrics
+from .quarterly_grades import mark_quiz_total_dirty
+from .quiz_cache import get_answer_key, get_start_payload, bump_answer_key_version
 
 
 # this is for submission
 from django.http import HttpResponse
+from django.urls import reverse
 from django.db.models import Count, Avg
 import csv
 
@@ -48,52 +56,6 @@ ALLOWED_EXTS = {
     ".txt", ".csv",
 }
 
-def recalc_quarterly_component(*, student, offering, quarter, grade_type):
-    """
-    Recompute QuarterlyGrade component totals based on BEST attempt per quiz for the quarter.
-    Prevents adding totals when multiple attempts exist.
-    """
-    quizzes = Quiz.objects.filter(
-        SubjectOffering=offering,
-        quarter=quarter,
-        grade_type=grade_type,
-    )
-
-    attempts_qs = QuizAttempt.objects.filter(
-        quiz__in=quizzes,
-        student=student,
-        status__in=["SUBMITTED", "GRADED"],
-    )
-
-    # ✅ best score per quiz
-    best_rows = (
-        attempts_qs.values("quiz_id")
-        .annotate(best=Max("score"))
-    )
-    total_score = sum((r["best"] or 0.0) for r in best_rows)
-
-    # ✅ total_points counted once per quiz (not per attempt)
-    total_points = quizzes.aggregate(s=Sum("total_points"))["s"] or 0.0
-
-    grade, _ = QuarterlyGrade.objects.get_or_create(
-        student=student,
-        SubjectOffering=offering,
-        quarter=quarter,
-        defaults={}
-    )
-
-    if grade_type == "WRITTEN_WORK":
-        grade.written_work_score = float(total_score)
-        grade.written_work_total = float(total_points)
-    elif grade_type == "PERFORMANCE_TASK":
-        grade.performance_task_score = float(total_score)
-        grade.performance_task_total = float(total_points)
-    elif grade_type == "QUARTERLY_EXAM":
-        grade.quarterly_assessment_score = float(total_score)
-        grade.quarterly_assessment_total = float(total_points)
-
-    grade.save()
-
 class AdminDashboardStatsView(APIView):
     permission_classes = [IsAuthenticated]
 
@@ -216,13 +178,16 @@ class SubjectOfferingViewSet(viewsets.ModelViewSet):
     def get_queryset(self):
         user = self.request.user
 
+        # Average final grade in the same query (read by SubjectOfferingSerializer.get_average)
+        offerings = SubjectOffering.objects.annotate(average_final_grade=Avg("quarterly_grades__final_grade"))
+
         # Teachers only see their own offerings
         if user.role == "TEACHER":
-            return SubjectOffering.objects.filter(teacher=user)
+            return offerings.filter(teacher=user)
 
         # Admins can see all (optional)
         if user.role == "ADMIN":
-            return SubjectOffering.objects.all()
+            return offerings
 
         # Others see none
         return SubjectOffering.objects.none()
@@ -714,21 +679,21 @@ class StudentViewSet(ModelViewSet):
     def quarterly_summary(self, request, pk=None):
         student = self.get_object()
 
+        # Only the columns the summary needs, read off the (student, offering, quarter) index
         grades = (
             QuarterlyGrade.objects
             .filter(student=student)
-            .select_related("SubjectOffering")
             .order_by("SubjectOffering_id", "quarter")
+            .values_list("SubjectOffering_id", "SubjectOffering__name", "quarter", "final_grade")
         )
 
         # group by offering
         by_offering = {}
-        for g in grades:
-            oid = g.SubjectOffering_id
+        for oid, subject, quarter, final_grade in grades:
             if oid not in by_offering:
                 by_offering[oid] = {
                     "subject_offering_id": oid,
-                    "subject": g.SubjectOffering.name,
+                    "subject": subject,
                     "q1": None,
                     "q2": None,
                     "q3": None,
@@ -736,14 +701,8 @@ class StudentViewSet(ModelViewSet):
                     "final": None,
                 }
 
-            if g.quarter == "Q1":
-                by_offering[oid]["q1"] = g.final_grade
-            elif g.quarter == "Q2":
-                by_offering[oid]["q2"] = g.final_grade
-            elif g.quarter == "Q3":
-                by_offering[oid]["q3"] = g.final_grade
-            elif g.quarter == "Q4":
-                by_offering[oid]["q4"] = g.final_grade
+            if quarter in ("Q1", "Q2", "Q3", "Q4"):
+                by_offering[oid][quarter.lower()] = final_grade
 
         # compute final average (if at least one quarter exists)
         for item in by_offering.values():
@@ -835,9 +794,8 @@ class TeacherQuizViewSet(viewsets.ModelViewSet):
             serializer.save(quiz=quiz)
 
         # recalc total_points
-            total = quiz.questions.aggregate(s=Sum('points'))['s'] or 0
-            quiz.total_points = total
-            quiz.save(update_fields=['total_points'])
+            _refresh_total_points(quiz)
+            bump_answer_key_version(quiz.id)
 
             return Response(serializer.data, status=status.HTTP_201_CREATED)
 
@@ -930,45 +888,27 @@ class TeacherQuizViewSet(viewsets.ModelViewSet):
     
     @action(detail=False, methods=['post'], url_path='grade-answer')
     def grade_answer(self, request):
-        from django.utils import timezone
-
         answer_id = request.data.get('answer_id')
         points_earned = request.data.get('points_earned')
         feedback = request.data.get('feedback', '')
 
         try:
-            answer = QuizAnswer.objects.get(id=answer_id)
+            answer = QuizAnswer.objects.select_related('attempt__quiz', 'question').get(id=answer_id)
 
             if answer.attempt.quiz.teacher != request.user:
                 return Response({'error': 'You do not have permission to grade this answer'},
                             status=status.HTTP_403_FORBIDDEN)
 
-            answer.points_earned = float(points_earned)
-            answer.teacher_feedback = feedback
-            answer.manually_graded = True
-            answer.graded_by = request.user
-            answer.graded_at = timezone.now()
-            answer.save()
-
-            attempt = answer.attempt
-            total_score = attempt.answers.aggregate(total=Sum('points_earned'))['total'] or 0
-            attempt.score = total_score
-            attempt.status = 'GRADED'
-            attempt.save()
-
-            # ✅ NEW: recompute quarterly component so written_work_score updates
-            quiz = attempt.quiz
-            recalc_quarterly_component(
-                student=attempt.student,
-                offering=quiz.SubjectOffering,
-                quarter=quiz.quarter,
-                grade_type=quiz.grade_type,
+            # Same write path as the batch endpoint: re-totals the attempt, corrects the
+            # item statistics and queues the quarterly recompute
+            scores = apply_manual_grades(
+                [answer], {answer.id: {'points_earned': points_earned, 'feedback': feedback}}, request.user,
             )
 
             return Response({
                 'message': 'Answer graded successfully',
                 'answer': QuizAnswerSerializer(answer).data,
-                'new_total_score': total_score
+                'new_total_score': scores[answer.attempt_id]
             })
 
         except QuizAnswer.DoesNotExist:
@@ -976,6 +916,55 @@ class TeacherQuizViewSet(viewsets.ModelViewSet):
         except Exception as e:
             return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
+    @action(detail=False, methods=['post'], url_path='grade-answers')
+    def grade_answers(self, request):
+        """
+        Grade many answers in one request
+
+        Body: {"grades": [{"answer_id", "points_earned", "feedback"}, ...]}
+        Each affected attempt is re-totalled once and each quarterly grade refreshed once.
+        """
+        serializer = BatchAnswerGradeSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        grades = {g['answer_id']: g for g in serializer.validated_data['grades']}
+
+        # Ownership for every answer is checked from this single query
+        answers = list(
+            QuizAnswer.objects
+            .filter(id__in=grades)
+            .select_related('attempt__quiz', 'question')
+        )
+        missing = sorted(set(grades) - {a.id for a in answers})
+        if missing:
+            return Response({'error': 'Answer not found', 'answer_ids': missing},
+                        status=status.HTTP_404_NOT_FOUND)
+        forbidden = sorted(a.id for a in answers if a.attempt.quiz.teacher_id != request.user.id)
+        if forbidden:
+            return Response({'error': 'You do not have permission to grade these answers', 'answer_ids': forbidden},
+                        status=status.HTTP_403_FORBIDDEN)
+
+        attempt_scores = apply_manual_grades(answers, grades, request.user)
+
+        return Response({
+            'message': f'{len(answers)} answer(s) graded successfully',
+            'answers': QuizAnswerSerializer(answers, many=True).data,
+            'attempt_scores': [
+                {'attempt_id': attempt_id, 'new_total_score': score}
+                for attempt_id, score in attempt_scores.items()
+            ],
+        })
+
+
+def _refresh_total_points(quiz):
+    """Re-sum the quiz's question points; a changed total re-queues the grades built on it"""
+    total = quiz.questions.aggregate(s=Sum('points'))['s'] or 0
+    if total != quiz.total_points:
+        quiz.total_points = total
+        quiz.save(update_fields=['total_points'])
+        mark_quiz_total_dirty(quiz)
+
 
 @api_view(['PUT', 'DELETE'])
 @permission_classes([IsAuthenticated])
@@ -989,12 +978,21 @@ def manage_quiz_question(request, question_id):
     if request.method == 'PUT':
         serializer = QuizQuestionSerializer(question, data=request.data, partial=True)
         if serializer.is_valid():
-            serializer.save()
+            # Bump only once the new total is saved, so no payload is cached
+            # under the new version with the old total
+            with transaction.atomic():
+                serializer.save()
+                _refresh_total_points(question.quiz)
+                bump_answer_key_version(question.quiz_id)
             return Response(serializer.data)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
     
     elif request.method == 'DELETE':
-        question.delete()
+        quiz = question.quiz
+        with transaction.atomic():
+            question.delete()
+            _refresh_total_points(quiz)
+            bump_answer_key_version(quiz.id)
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 
@@ -1055,16 +1053,13 @@ def start_quiz(request, quiz_id):
     ).first()
     
     if existing_attempt:
-        # Return existing attempt with quiz and questions data
-        questions = quiz.questions.all().order_by('order')
-        questions_data = QuizQuestionSerializer(questions, many=True).data
-        
-        return Response({
-            'attempt_id': existing_attempt.id,
-            'quiz': StudentQuizSerializer(quiz).data,
-            'questions': questions_data,
-            'started_at': existing_attempt.started_at
-        })
+        # Return existing attempt with the pre-rendered quiz and questions data,
+        # plus any autosaved answers so the student can pick up where they left off
+        body = get_start_payload(quiz).render(
+            existing_attempt,
+            extra={'draft_answers': list(existing_attempt.draft_answers.values())},
+        )
+        return HttpResponse(body, content_type='application/json')
     
     # Check if multiple attempts allowed
     if not quiz.allow_multiple_attempts:
@@ -1075,16 +1070,10 @@ def start_quiz(request, quiz_id):
     # Create new attempt
     attempt = QuizAttempt.objects.create(quiz=quiz, student=student)
     
-    # Return quiz questions
-    questions = quiz.questions.all().order_by('order')
-    questions_data = QuizQuestionSerializer(questions, many=True).data
-    
-    return Response({
-        'attempt_id': attempt.id,
-        'quiz': StudentQuizSerializer(quiz).data,
-        'questions': questions_data,
-        'started_at': attempt.started_at
-    })
+    # Quiz and questions are rendered once per quiz version; only the
+    # attempt fields (and shuffled order, if enabled) differ per student
+    body = get_start_payload(quiz).render(attempt)
+    return HttpResponse(body, content_type='application/json')
 
 
 @api_view(['POST'])
@@ -1103,8 +1092,12 @@ def submit_quiz(request, attempt_id):
     except QuizAttempt.DoesNotExist:
         return Response({'error': 'Attempt not found'}, status=status.HTTP_404_NOT_FOUND)
 
-    # Check if quiz is still open
-    if not attempt.quiz.is_open():
+    # Check if quiz is still open; an attempt handed back by a failed queued
+    # submission was submitted in time and may be resubmitted after closing
+    if not attempt.quiz.is_open() and not (
+        attempt.quiz.is_closed()
+        and QuizSubmission.objects.filter(attempt=attempt, status='FAILED').exists()
+    ):
         return Response({'error': 'Quiz has closed'}, status=status.HTTP_400_BAD_REQUEST)
 
     # Handle both JSON and multipart form data
@@ -1118,68 +1111,24 @@ def submit_quiz(request, attempt_id):
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
         answers_data = serializer.validated_data['answers']
 
-    # Process answers
-    total_score = 0.0
-
-    for answer_data in answers_data:
-        question_id = answer_data.get('question_id')
-        selected_choice_id = answer_data.get('selected_choice_id')
-        text_answer = answer_data.get('text_answer', '')
-
+    # Queued mode: durably record the raw payload and let grading workers
+    # (manage.py process_quiz_submissions) finalize it
+    mode = request.query_params.get('mode') or getattr(settings, 'QUIZ_SUBMISSION_MODE', 'sync')
+    if mode == 'async':
         try:
-            question = QuizQuestion.objects.get(id=question_id, quiz=attempt.quiz)
-        except QuizQuestion.DoesNotExist:
-            continue
-
-        answer, created = QuizAnswer.objects.get_or_create(
-            attempt=attempt,
-            question=question,
-            defaults={'text_answer': text_answer}
-        )
-
-        if not created:
-            answer.text_answer = text_answer
-
-        # file upload
-        file_key = f'answer_file_{question_id}'
-        if file_key in request.FILES:
-            answer.answer_file = request.FILES[file_key]
+            submission = enqueue_submission(attempt, answers_data, request.FILES)
+        except AttemptNotInProgress:
+            return Response({'error': 'Attempt already submitted'}, status=status.HTTP_409_CONFLICT)
+        return Response({
+            'message': 'Quiz submission received',
+            'receipt': str(submission.receipt),
+            'attempt_id': attempt.id,
+            'status': attempt.status,
+            'status_url': reverse('quiz_attempt_status', kwargs={'attempt_id': attempt.id}),
+        }, status=status.HTTP_202_ACCEPTED)
 
-        # Grade objective questions
-        if question.question_type in ['MULTIPLE_CHOICE', 'TRUE_FALSE'] and selected_choice_id:
-            try:
-                choice = QuizChoice.objects.get(id=selected_choice_id, question=question)
-                answer.selected_choice = choice
-                answer.is_correct = choice.is_correct
-                if choice.is_correct:
-                    answer.points_earned = float(question.points or 0)
-                else:
-                    answer.points_earned = 0.0
-            except QuizChoice.DoesNotExist:
-                answer.points_earned = 0.0
-        else:
-            # subjective items default 0 until teacher grades
-            if answer.points_earned is None:
-                answer.points_earned = 0.0
-
-        answer.save()
-        total_score += float(answer.points_earned or 0.0)
-
-    # Update attempt
-    attempt.submitted_at = timezone.now()
-    attempt.score = float(total_score)
-    attempt.status = 'SUBMITTED'
-    attempt.save()
-
-    # ✅ IMPORTANT: do NOT += to QuarterlyGrade here.
-    # ✅ Recompute/overwrite using BEST attempt per quiz.
-    quiz = attempt.quiz
-    recalc_quarterly_component(
-        student=attempt.student,
-        offering=quiz.SubjectOffering,
-        quarter=quiz.quarter,
-        grade_type=quiz.grade_type,
-    )
+    # Finalize autosaved answers plus whatever arrived with the submit
+    total_score = finalize_attempt(attempt, answers_data, request.FILES)
 
     return Response({
         'message': 'Quiz submitted successfully',
@@ -1189,6 +1138,82 @@ def submit_quiz(request, attempt_id):
     })
 
 
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def autosave_quiz(request, attempt_id):
+    """Store per-answer deltas on an in-progress attempt without grading them"""
+    if not hasattr(request.user, 'student_profile'):
+        return Response({'error': 'Not a student'}, status=status.HTTP_403_FORBIDDEN)
+
+    serializer = QuizAutosaveSerializer(data=request.data)
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+    with transaction.atomic():
+        try:
+            attempt = (
+                QuizAttempt.objects
+                # Lock only the attempt; locking the joined quiz would queue every autosave on it
+                .select_for_update(of=('self',))
+                .select_related('quiz')
+                .get(id=attempt_id, student=request.user.student_profile, status='IN_PROGRESS')
+            )
+        except QuizAttempt.DoesNotExist:
+            return Response({'error': 'Attempt not found'}, status=status.HTTP_404_NOT_FOUND)
+
+        if not attempt.quiz.is_open():
+            return Response({'error': 'Quiz has closed'}, status=status.HTTP_400_BAD_REQUEST)
+
+        attempt.draft_answers, saved = apply_draft_deltas(
+            attempt.draft_answers,
+            serializer.validated_data['answers'],
+            get_answer_key(attempt.quiz),
+        )
+        attempt.draft_saved_at = timezone.now()
+        attempt.save(update_fields=['draft_answers', 'draft_saved_at'])
+
+    return Response({'saved': saved, 'saved_at': attempt.draft_saved_at})
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def quiz_attempt_status(request, attempt_id):
+    """Poll the grading status of a submitted (possibly queued) attempt"""
+    if not hasattr(request.user, 'student_profile'):
+        return Response({'error': 'Not a student'}, status=status.HTTP_403_FORBIDDEN)
+
+    try:
+        attempt = QuizAttempt.objects.select_related('quiz').get(
+            id=attempt_id,
+            student=request.user.student_profile,
+        )
+    except QuizAttempt.DoesNotExist:
+        return Response({'error': 'Attempt not found'}, status=status.HTTP_404_NOT_FOUND)
+
+    data = {
+        'attempt_id': attempt.id,
+        'status': attempt.status,
+        'submitted_at': attempt.submitted_at,
+        'score': None,
+        'total_points': attempt.quiz.total_points,
+        'percentage': None,
+        'submission': None,
+    }
+    if attempt.status in ('SUBMITTED', 'GRADED'):
+        total_points = attempt.quiz.total_points
+        data['score'] = attempt.score
+        data['percentage'] = (attempt.score / total_points * 100) if total_points > 0 else 0
+
+    submission = QuizSubmission.objects.filter(attempt=attempt).first()
+    if submission:
+        data['submission'] = {
+            'receipt': str(submission.receipt),
+            'status': submission.status,
+            'error': submission.error,
+        }
+    return Response(data)
+
+
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def student_quiz_attempts(request):
@@ -1204,87 +1229,36 @@ def student_quiz_attempts(request):
     return Response(serializer.data)
 
 
-# AI-powered endpoints (Temporarily disabled - ready for future use)
-# Uncomment when ready to enable AI features
+# AI-powered endpoints (ai_chat, generate_quiz, explain_concept, provide_feedback,
+# generate_study_plan) are async views in LMS.ai_views
 
-@api_view(['POST'])
-@permission_classes([IsAuthenticated])
-def ai_chat(request):
-     """General AI chat endpoint"""
-     ai_service = AIService()
-     messages = request.data.get('messages', [])
-     
-     if not messages:
-         return Response({'error': 'Messages are required'}, status=status.HTTP_400_BAD_REQUEST)
-     
-     response = ai_service.chat(messages)
-     return Response({'response': response})
-
-
-@api_view(['POST'])
-@permission_classes([IsAuthenticated])
-def generate_quiz(request):
-     """Generate quiz questions using AI"""
-     ai_service = AIService()
-     SubjectOffering = request.data.get('name', '')
-     topic = request.data.get('topic', '')
-     num_questions = request.data.get('num_questions', 5)
-     
-     if not SubjectOffering or not topic:
-         return Response({'error': 'Subject and topic are required'}, status=status.HTTP_400_BAD_REQUEST)
-     
-     questions = ai_service.generate_quiz_questions(SubjectOffering, topic, num_questions)
-     return Response({'questions': questions})
 
-
-@api_view(['POST'])
+@api_view(['GET'])
 @permission_classes([IsAuthenticated])
-def explain_concept(request):
-     """Get AI explanation of a concept"""
-     ai_service = AIService()
-     concept = request.data.get('concept', '')
-     SubjectOffering = request.data.get('name', '')
-     
-     if not concept or not SubjectOffering:
-         return Response({'error': 'Concept and subject are required'}, status=status.HTTP_400_BAD_REQUEST)
-     
-     explanation = ai_service.explain_concept(concept, SubjectOffering)
-     return Response({'explanation': explanation})
+def ai_metrics_view(request):
+    """
+    AI latency histograms, token counts, cache hits, fallbacks and error
+    classes per AIService method, plus scheduler and client state (admins only)
+    
+    Figures are per worker process since it started.
+    """
+    if request.user.role != "ADMIN":
+        return Response({"detail": "Not authorized"}, status=status.HTTP_403_FORBIDDEN)
+    return Response(metrics_report())
 
 
-@api_view(['POST'])
-@permission_classes([IsAuthenticated])
-def provide_feedback(request):
-     """Get AI feedback on student answer"""
-     ai_service = AIService()
-     student_answer = request.data.get('student_answer', '')
-     correct_answer = request.data.get('correct_answer', '')
-     question = request.data.get('question', '')
-     
-     if not all([student_answer, correct_answer, question]):
-         return Response({'error': 'All fields are required'}, status=status.HTTP_400_BAD_REQUEST)
-     
-     feedback = ai_service.provide_feedback(student_answer, correct_answer, question)
-     return Response({'feedback': feedback})
+# ==================== GRADE FORECASTING VIEWS ====================
 
+def _forecast_engine(request):
+    """Forecast engine requested via ?engine= or the POST body (None = settings default)"""
+    return request.query_params.get('engine') or request.data.get('engine') or None
 
-@api_view(['POST'])
-@permission_classes([IsAuthenticated])
-def generate_study_plan(request):
-     """Generate personalized study plan"""
-     ai_service = AIService()
-     SubjectOffering = request.data.get('name', '')
-     topics = request.data.get('topics', [])
-     difficulty_level = request.data.get('difficulty_level', 'intermediate')
-     
-     if not SubjectOffering or not topics:
-         return Response({'error': 'Subject and topics are required'}, status=status.HTTP_400_BAD_REQUEST)
-     
-     study_plan = ai_service.generate_study_plan(SubjectOffering, topics, difficulty_level)
-     return Response({'study_plan': study_plan})
 
+def _forecast_force(request):
+    """?force=true (or "force": true in the body) regenerates even when nothing changed"""
+    value = request.query_params.get('force', request.data.get('force', False))
+    return str(value).lower() in ('1', 'true', 'yes')
 
-# ==================== GRADE FORECASTING VIEWS ====================
 
 @api_view(['GET', 'POST'])
 @permission_classes([IsAuthenticated])
@@ -1293,7 +1267,7 @@ def grade_forecast(request, student_id=None, SubjectOffering_id=None):
     Get or generate grade forecast for a student
     
     GET: Retrieve existing forecast
-    POST: Generate new forecast using AI
+    POST: Generate new forecast (AI or local engine, ?engine=ai|local)
     """
     # Determine student_id (from param or current user)
     if student_id is None:
@@ -1331,12 +1305,23 @@ def grade_forecast(request, student_id=None, SubjectOffering_id=None):
             )
         
         # Generate forecast using analytics service
-        analytics = GradeAnalyticsService()
-        forecast = analytics.generate_forecast(student_id, SubjectOffering_id)
+        engine = _forecast_engine(request)
+        if engine not in (None,) + FORECAST_ENGINES:
+            return Response({'error': f'engine must be one of {", ".join(FORECAST_ENGINES)}'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        analytics = GradeAnalyticsService(engine=engine)
+        # Unchanged graded attempts return the stored forecast unless ?force=true
+        forecast, cached = analytics.get_or_generate_forecast(
+            student_id, SubjectOffering_id, force=_forecast_force(request),
+        )
 
         if forecast:
             serializer = GradeForecastSerializer(forecast)
-            return Response(serializer.data, status=status.HTTP_201_CREATED)
+            return Response(
+                serializer.data,
+                status=status.HTTP_200_OK if cached else status.HTTP_201_CREATED,
+                headers={'X-Forecast-Cache': 'HIT' if cached else 'MISS'},
+            )
         else:
             return Response(
                 {'error': 'Insufficient data. Need at least 1 completed quiz.'},
@@ -1344,6 +1329,45 @@ def grade_forecast(request, student_id=None, SubjectOffering_id=None):
             )
 
 
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def offering_grade_forecasts(request, SubjectOffering_id):
+    """
+    Generate forecasts for every student of a subject offering at once
+
+    POST body (optional): {"student_ids": [...], "engine": "ai" | "local", "force": true}
+    Students whose graded attempts did not change keep their stored forecast unless force is set.
+    """
+    if request.user.role not in ('TEACHER', 'ADMIN'):
+        return Response({'error': 'Only teachers and admins can generate class forecasts'},
+                        status=status.HTTP_403_FORBIDDEN)
+
+    offering = get_object_or_404(SubjectOffering.objects.select_related('section'), id=SubjectOffering_id)
+    if request.user.role == 'TEACHER' and request.user.id not in (offering.teacher_id, offering.section.adviser_id):
+        return Response({'error': 'Not authorized for this subject offering'}, status=status.HTTP_403_FORBIDDEN)
+
+    student_ids = request.data.get('student_ids')
+    if student_ids is not None and not (
+        isinstance(student_ids, list) and all(isinstance(i, int) for i in student_ids)
+    ):
+        return Response({'error': 'student_ids must be a list of ids'}, status=status.HTTP_400_BAD_REQUEST)
+
+    engine = _forecast_engine(request)
+    if engine not in (None,) + FORECAST_ENGINES:
+        return Response({'error': f'engine must be one of {", ".join(FORECAST_ENGINES)}'},
+                        status=status.HTTP_400_BAD_REQUEST)
+
+    result = GradeAnalyticsService(engine=engine).generate_offering_forecasts(
+        offering.id, student_ids=student_ids, force=_forecast_force(request),
+    )
+
+    return Response({
+        'generated': len(result['forecasts']) - len(result['unchanged']),
+        'unchanged_student_ids': result['unchanged'],
+        'skipped_student_ids': result['skipped'],
+        'forecasts': GradeForecastSerializer(result['forecasts'], many=True).data,
+    }, status=status.HTTP_201_CREATED)
+
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def student_topic_performance(request, student_id=None, SubjectOffering_id=None):
@@ -1565,166 +1589,20 @@ def quiz_item_analysis(request, quiz_id):
 
     quiz = get_object_or_404(Quiz, id=quiz_id, teacher=request.user)
 
-    questions = quiz.questions.all().order_by('order')
-    analysis = []
-    included_statuses = ['SUBMITTED', 'GRADED']
-
-    for question in questions:
-        answers = QuizAnswer.objects.filter(
-            question=question,
-            attempt__status__in=included_statuses,
-        ).select_related('selected_choice')
-
-        total_attempts = answers.count()
-
-        base = {
-            'question_id': question.id,
-            'question_text': question.question_text,
-            'question_type': question.question_type,
-            'points': float(question.points or 0),
-            'order': question.order,
-            'total_attempts': total_attempts,
-        }
-
-        if total_attempts == 0:
-            analysis.append({
-                **base,
-                'analysis_mode': 'N/A',
-                'correct_count': 0,
-                'incorrect_count': 0,
-                'ungraded_count': 0,
-                'correct_percentage': 0,
-                'difficulty': 'N/A',
-                'choice_distribution': {},
-                'graded_count': 0,
-                'pending_count': 0,
-                'avg_score': 0,
-                'score_distribution': [],
-            })
-            continue
-
-        # ---------------------------
-        # Objective questions (MC/TF)
-        # ---------------------------
-        if question.question_type in ['MULTIPLE_CHOICE', 'TRUE_FALSE']:
-            correct_count = answers.filter(is_correct=True).count()
-            ungraded_count = answers.filter(is_correct__isnull=True).count()
-            incorrect_count = total_attempts - correct_count - ungraded_count
-
-            graded_total = correct_count + incorrect_count
-            correct_percentage = (correct_count / graded_total * 100) if graded_total > 0 else 0
-
-            if graded_total == 0:
-                difficulty = 'N/A'
-            elif correct_percentage >= 75:
-                difficulty = 'Easy'
-            elif correct_percentage >= 50:
-                difficulty = 'Medium'
-            elif correct_percentage >= 25:
-                difficulty = 'Hard'
-            else:
-                difficulty = 'Very Hard'
-
-            choice_distribution = {}
-            for choice in question.choices.all():
-                choice_count = answers.filter(selected_choice=choice).count()
-                choice_distribution[choice.choice_text] = {
-                    'count': choice_count,
-                    'percentage': (choice_count / total_attempts * 100) if total_attempts > 0 else 0,
-                    'is_correct': choice.is_correct
-                }
-
-            analysis.append({
-                **base,
-                'analysis_mode': 'CHOICES',
-                'correct_count': correct_count,
-                'incorrect_count': incorrect_count,
-                'ungraded_count': ungraded_count,
-                'graded_count': graded_total,
-                'pending_count': ungraded_count,
-                'correct_percentage': round(correct_percentage, 2),
-                'difficulty': difficulty,
-                'choice_distribution': choice_distribution,
-                'avg_score': None,
-                'score_distribution': [],
-            })
-            continue
-
-        # ---------------------------
-        # Subjective/manual questions
-        # ---------------------------
-        graded_qs = answers.filter(manually_graded=True)
-        graded_count = graded_qs.count()
-        pending_count = total_attempts - graded_count
-
-        avg_score = graded_qs.aggregate(a=Avg('points_earned'))['a']
-        avg_score = float(avg_score or 0)
-
-        # Build histogram for points_earned (graded answers only)
-        # NOTE: if you allow 0.5 steps, points_earned values will naturally group.
-        grouped = (
-            graded_qs
-            .values('points_earned')
-            .annotate(count=Count('id'))
-            .order_by('points_earned')
-        )
-
-        score_distribution = []
-        for row in grouped:
-            score = float(row['points_earned'] or 0)
-            count = int(row['count'])
-            pct = (count / graded_count * 100) if graded_count > 0 else 0
-            score_distribution.append({
-                'score': score,
-                'count': count,
-                'percentage': round(pct, 2),
-            })
+    # One grouped aggregation over the answers; cached until a new submission or grade
+    return Response(get_item_analysis(quiz))
 
-        # Optional difficulty for manual items:
-        # Use average score vs max points (simple but meaningful)
-        max_points = float(question.points or 0)
-        if graded_count == 0 or max_points <= 0:
-            difficulty = 'N/A'
-        else:
-            avg_pct = (avg_score / max_points) * 100
-            if avg_pct >= 75:
-                difficulty = 'Easy'
-            elif avg_pct >= 50:
-                difficulty = 'Medium'
-            elif avg_pct >= 25:
-                difficulty = 'Hard'
-            else:
-                difficulty = 'Very Hard'
-
-        analysis.append({
-            **base,
-            'analysis_mode': 'SCORES',
-            'graded_count': graded_count,
-            'pending_count': pending_count,
-            'ungraded_count': pending_count,
-            'avg_score': round(avg_score, 2),
-            'max_points': max_points,
-            'score_distribution': score_distribution,
-
-            # Keep these for compatibility (frontend can ignore in SCORES mode)
-            'correct_count': 0,
-            'incorrect_count': 0,
-            'correct_percentage': 0,
-            'difficulty': difficulty,
-            'choice_distribution': {},
-        })
 
-    total_questions = len(questions)
-    total_student_attempts = quiz.attempts.filter(status__in=included_statuses).count()
 
-    return Response({
-        'quiz_id': quiz.id,
-        'quiz_title': quiz.title,
-        'total_questions': total_questions,
-        'total_student_attempts': total_student_attempts,
-        'questions': analysis
-    })
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def quiz_psychometrics_view(request, quiz_id):
+    """Discrimination, point-biserial, 27% distractor analysis and KR-20 for a quiz"""
+    if request.user.role != 'TEACHER':
+        return Response({'error': 'Only teachers can access item analysis'}, status=status.HTTP_403_FORBIDDEN)
 
+    quiz = get_object_or_404(Quiz, id=quiz_id, teacher=request.user)
+    return Response(quiz_psychometrics(quiz))
 
 
 # ==================== SUBMISSION DOWNLOAD VIEW ====================
@@ -1773,21 +1651,27 @@ def teacher_submissions_summary(request):
         status__in=submitted_statuses,
     )
 
-    overall_attempts = teacher_attempts_qs.count()
-    overall_unique_students = teacher_attempts_qs.values("student_id").distinct().count()
+    overall = teacher_attempts_qs.aggregate(attempts=Count("id"), students=Count("student_id", distinct=True))
+    overall_attempts = overall["attempts"]
+    overall_unique_students = overall["students"]
     overall_quizzes = Quiz.objects.filter(teacher=request.user).count()
 
+    # Per-offering totals in one grouped query instead of two per offering
+    offerings = offerings.annotate(total_students=Count("section__students", distinct=True))
+    totals_by_offering = {
+        row["quiz__SubjectOffering_id"]: row
+        for row in teacher_attempts_qs
+        .values("quiz__SubjectOffering_id")
+        .annotate(attempts=Count("id"), unique_students=Count("student_id", distinct=True))
+        .order_by()
+    }
+
     results = []
     for o in offerings:
-        attempts = QuizAttempt.objects.filter(
-            quiz__SubjectOffering=o,
-            quiz__teacher=request.user,
-            status__in=submitted_statuses,
-        )
-
-        submitted_attempts = attempts.count()
-        unique_students = attempts.values("student_id").distinct().count()
-        total_students = o.section.students.count() if o.section else 0
+        totals = totals_by_offering.get(o.id, {"attempts": 0, "unique_students": 0})
+        submitted_attempts = totals["attempts"]
+        unique_students = totals["unique_students"]
+        total_students = o.total_students
         submission_rate = round((unique_students / total_students) * 100, 2) if total_students else 0
 
         results.append({
@@ -1804,7 +1688,7 @@ def teacher_submissions_summary(request):
             "overall_attempts": overall_attempts,
             "overall_unique_students": overall_unique_students,
             "overall_quizzes": overall_quizzes,
-            "overall_subject_offerings": offerings.count(),
+            "overall_subject_offerings": len(results),
         },
         "by_subject": results,
     })
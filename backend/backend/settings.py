@@ -53,6 +53,7 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'LMS.middleware.QuarterlyRecalcMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -184,6 +185,83 @@ AUTH_USER_MODEL = 'LMS.User'
 # OpenAI Configuration
 OPENAI_API_KEY = os.environ.get('OPENAI_API_KEY', '')
 OPENAI_MODEL = 'gpt-3.5-turbo'
+# Point at an OpenAI-compatible server (e.g. LMS.llm_stub for load tests)
+OPENAI_BASE_URL = os.environ.get('OPENAI_BASE_URL') or None
+
+# LLM calls in flight per process (sync and async views share the slots);
+# callers wait up to AI_CONCURRENCY_WAIT seconds for one
+AI_MAX_CONCURRENCY = int(os.environ.get('AI_MAX_CONCURRENCY', 8))
+AI_CONCURRENCY_WAIT = 10.0
+
+# Shared LLM client (LMS.ai_client): timeouts in seconds, retries with jittered
+# exponential backoff, and a circuit breaker that opens after AI_BREAKER_FAILURES
+# consecutive failures and lets a trial call through after AI_BREAKER_RESET seconds
+AI_CONNECT_TIMEOUT = 3.0
+AI_READ_TIMEOUT = float(os.environ.get('AI_READ_TIMEOUT', 20.0))
+AI_MAX_RETRIES = 2
+AI_RETRY_BACKOFF = 0.25
+AI_RETRY_BACKOFF_MAX = 2.0
+AI_BREAKER_FAILURES = 5
+AI_BREAKER_RESET = 30.0
+
+# AIService.chat response cache: per-process LRU in front of a SQLite file that
+# survives restarts. AI_CACHE_TTL = 0 disables it; AI_CACHE_PATH = '' keeps it in memory
+AI_CACHE_TTL = int(os.environ.get('AI_CACHE_TTL', 24 * 60 * 60))
+AI_CACHE_SIZE = 1000
+AI_CACHE_DISK_SIZE = 20000
+AI_CACHE_PATH = os.environ.get('AI_CACHE_PATH', str(BASE_DIR / 'ai_cache.sqlite3'))
+
+# Identical in-flight AI requests share one upstream call. Worker processes
+# coordinate through lock files and a short-lived result store in
+# AI_SINGLEFLIGHT_DIR ('' coalesces within each process only)
+AI_SINGLEFLIGHT_DIR = os.environ.get('AI_SINGLEFLIGHT_DIR', str(BASE_DIR / 'ai_singleflight'))
+AI_SINGLEFLIGHT_TTL = 30.0
+AI_SINGLEFLIGHT_WAIT = 60.0
+
+# Provider rate limits enforced per process by LMS.ai_scheduler (0 disables a bucket).
+# Interactive requests are admitted before batch work and give up (falling back)
+# after AI_QUEUE_WAIT_INTERACTIVE seconds; 429 answers are retried AI_RATE_LIMIT_RETRIES
+# times after Retry-After, or AI_RATE_LIMIT_BACKOFF seconds doubled per attempt
+AI_REQUESTS_PER_MINUTE = int(os.environ.get('AI_REQUESTS_PER_MINUTE', 500))
+AI_TOKENS_PER_MINUTE = int(os.environ.get('AI_TOKENS_PER_MINUTE', 200000))
+AI_RATE_LIMIT_RETRIES = 3
+AI_RATE_LIMIT_BACKOFF = 2.0
+AI_QUEUE_WAIT_INTERACTIVE = 10.0
+AI_QUEUE_WAIT_BATCH = 300.0
+
+# predict_grade prompts: scores are downsampled to AI_FORECAST_HISTORY_POINTS and only
+# the AI_FORECAST_TOPICS strongest and weakest topics are listed, then both shrink
+# until the locally estimated prompt fits AI_FORECAST_PROMPT_BUDGET tokens
+AI_FORECAST_PROMPT_BUDGET = 800
+AI_FORECAST_HISTORY_POINTS = 12
+AI_FORECAST_TOPICS = 3
+
+# One JSON line per AIService call (method, outcome, latency, tokens, error class)
+# on the 'LMS.ai' logger; AI_LOG_LEVEL=WARNING turns them off
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {'console': {'class': 'logging.StreamHandler'}},
+    'loggers': {
+        'LMS.ai': {'handlers': ['console'], 'level': os.environ.get('AI_LOG_LEVEL', 'INFO'), 'propagate': False},
+    },
+}
+
+# Grade forecasts: 'ai' asks OPENAI_MODEL, 'local' uses LMS.forecasting (no network).
+# Requests may override with ?engine=ai|local
+GRADE_FORECAST_ENGINE = os.environ.get('GRADE_FORECAST_ENGINE', 'ai')
+GRADE_FORECAST_HALF_LIFE = 4
+GRADE_FORECAST_HORIZON = 3
+
+# Quiz answer-key cache: entries kept per process, plus an optional shared
+# Django cache alias (e.g. a Redis/Memcached entry in CACHES) used as a second tier
+QUIZ_ANSWER_KEY_CACHE_SIZE = 500
+QUIZ_START_PAYLOAD_CACHE_SIZE = 200
+QUIZ_CACHE_ALIAS = os.environ.get('QUIZ_CACHE_ALIAS') or None
+
+# 'sync' grades inside submit_quiz; 'async' queues the payload (202 + receipt)
+# for `python manage.py process_quiz_submissions`. Clients may also pass ?mode=async
+QUIZ_SUBMISSION_MODE = os.environ.get('QUIZ_SUBMISSION_MODE', 'sync')
 
 BASE_DIR = Path(__file__).resolve().parent.parent
 